@@ -2,32 +2,88 @@ from rte import (
     Extension,
     RteEnv,
     PcmFrame,
-    PcmFrameDataFmt,
+    Data,
 )
 
 import asyncio
 import threading
 import time
 import numpy as np
-import librosa
-import queue
-import collections
-
-from modelscope.pipelines import pipeline
-from modelscope.utils.constant import Tasks
 
 from .log import logger
+from .frame_builder import PcmFrameBuilder
+from .pcm_ring_buffer import PcmRingBuffer, POLICY_DROP_NEWEST
+from .batcher import AdaptiveBatcher
+from .stream_context import StreamContext, StreamContextCache
+from .audio_tap import AudioTap
+from .vad import EnergyVad
+from .bypass import BypassController
+from .metrics import Metrics
+from .model_registry import get_denoise_model
 
 PROPERTY_SAMPLE_RATE_IN  = 'sample_rate_in'  # Optional
 PROPERTY_SAMPLE_RATE_OUT = 'sample_rate_out'  # Optional
 
+PROPERTY_TARGET_LATENCY_MS = 'target_latency_ms'  # Optional
+PROPERTY_MIN_BATCH_SIZE = 'min_batch_size'  # Optional
+PROPERTY_MAX_BATCH_SIZE = 'max_batch_size'  # Optional
+PROPERTY_MAX_STREAMS = 'max_streams'  # Optional
+PROPERTY_STREAM_IDLE_TIMEOUT_S = 'stream_idle_timeout_s'  # Optional
+PROPERTY_AUDIO_TAP_DIR = 'audio_tap_dir'  # Optional, recording is disabled when empty
+PROPERTY_AUDIO_TAP_MAX_FILE_MB = 'audio_tap_max_file_mb'  # Optional
+PROPERTY_AUDIO_TAP_MAX_FILE_S = 'audio_tap_max_file_s'  # Optional
+PROPERTY_VAD_ENABLED = 'vad_enabled'  # Optional
+PROPERTY_VAD_HANGOVER_MS = 'vad_hangover_ms'  # Optional
+PROPERTY_BYPASS_ENTER_RTF_PERCENT = 'bypass_enter_rtf_percent'  # Optional
+PROPERTY_BYPASS_EXIT_RTF_PERCENT = 'bypass_exit_rtf_percent'  # Optional
+PROPERTY_BYPASS_PROBE_INTERVAL_MS = 'bypass_probe_interval_ms'  # Optional
+
+DATA_OUT_VAD_EVENT = 'vad_event'
+DATA_OUT_VAD_EVENT_PROPERTY_STREAM_ID = 'stream_id'
+DATA_OUT_VAD_EVENT_PROPERTY_EVENT = 'event'
+DATA_OUT_VAD_EVENT_PROPERTY_TIME = 'time'  # timestamp, ms
+
+DATA_OUT_DENOISE_MODE = 'denoise_mode'
+DATA_OUT_DENOISE_MODE_PROPERTY_MODE = 'mode'
+DATA_OUT_DENOISE_MODE_PROPERTY_RTF_PERCENT = 'rtf_percent'
+DATA_OUT_DENOISE_MODE_PROPERTY_TIME = 'time'  # timestamp, ms
+
+FRAME_PROPERTY_STREAM_ID = 'stream_id'
+DEFAULT_STREAM_ID = 0
+
 MODEL_SAMPLE_RATE = 48000
-BATCH_SIZE = 4  # Process 4 frames at once (40ms)
+IDLE_WAIT_SECONDS = 30.0  # How long to block on an empty ring when nothing is buffered
+FRAME_RING_SLOTS = 3000  # ~30 seconds of audio at 10ms per slot
+FRAME_RING_SLOT_BYTES = 960  # 10ms of 16-bit mono at 48kHz, larger frames span several slots
+EVICTION_CHECK_INTERVAL_SECONDS = 1.0
 
 class AudioDenoiseExtension(Extension):
     # Default sample rates
     sample_rate_in = 16000
     sample_rate_out = 16000
+    
+    # Default batching, latency budget is measured from the first buffered frame
+    target_latency_ms = 40
+    min_batch_size = 2
+    max_batch_size = 16
+    
+    # Default bound on concurrently denoised source streams
+    max_streams = 8
+    stream_idle_timeout_s = 60
+    
+    # Audio tap is disabled by default
+    audio_tap_dir = ''
+    audio_tap_max_file_mb = 64
+    audio_tap_max_file_s = 600
+    
+    # Skip denoising during silence, disabled by default
+    vad_enabled = False
+    vad_hangover_ms = 300
+    
+    # Pass audio through undenoised while the denoiser runs slower than this share of real time
+    bypass_enter_rtf_percent = 90
+    bypass_exit_rtf_percent = 60
+    bypass_probe_interval_ms = 1000
 
     def __init__(self, name: str):
         super().__init__(name)
@@ -38,25 +94,30 @@ class AudioDenoiseExtension(Extension):
         self.loop = None
         self._lock = threading.RLock()  # For thread-safe access to shared resources
         
-        # Audio processing resources
+        # Audio processing resources, the model is shared across instances and streams
         self.denoiser = None
+        self.frame_builder = PcmFrameBuilder(bytes_per_sample=2, number_of_channels=1)
+        
+        self.metrics = Metrics("audio_denoise")
         
         # Initialize the denoising model
         self.__init_denoise_model()
         
-        # Thread-safe queue for handling multiple frames
-        # Capacity: ~30 seconds of audio (3000 frames at 10ms each)
-        self.frame_queue = queue.Queue(maxsize=3000)
+        # Preallocated single-producer/single-consumer ring between the RTE callback and the processing thread,
+        # each chunk carries its (stream_id, sample_rate, bytes_per_sample)
+        self.frame_ring = PcmRingBuffer(FRAME_RING_SLOTS, FRAME_RING_SLOT_BYTES, policy=POLICY_DROP_NEWEST)
         
-        # Buffer to collect frames for batch processing
+        # Per source stream denoise state, resamplers and pending batch, created in on_start from configuration
         # Note: This is accessed only from the processing thread, so no lock needed
-        self.frame_buffer = collections.deque(maxlen=BATCH_SIZE)
+        self.streams = None
+        self.bypass = None
+        self.last_eviction_check = 0
+        
+        # Optional recorder of input and denoised audio, None unless audio_tap_dir is configured
+        self.audio_tap = None
         
         logger.info("AudioDenoiseExtension initialized")
 
-        self.input_file = open('/tmp/input_16k.pcm', 'wb')
-        self.output_file = open('/tmp/output_48k.pcm', 'wb')
-
     def on_start(self, rte: RteEnv) -> None:
         """
         Initialize and start the audio denoising extension.
@@ -69,6 +130,26 @@ class AudioDenoiseExtension(Extension):
         
         # Load configuration from properties
         self._load_configuration(rte)
+        self.streams = StreamContextCache(
+            self.__create_stream_context,
+            max_streams=self.max_streams,
+            idle_timeout_s=self.stream_idle_timeout_s,
+            on_evict=lambda ctx: self.__flush_batch(rte, ctx),
+        )
+        self.bypass = BypassController(
+            enter_rtf=self.bypass_enter_rtf_percent / 100,
+            exit_rtf=self.bypass_exit_rtf_percent / 100,
+            probe_interval_s=self.bypass_probe_interval_ms / 1000,
+        )
+        if self.audio_tap_dir and not self.audio_tap:
+            try:
+                self.audio_tap = AudioTap(
+                    self.audio_tap_dir,
+                    max_file_bytes=self.audio_tap_max_file_mb * 1024 * 1024,
+                    max_file_seconds=self.audio_tap_max_file_s,
+                )
+            except Exception as e:
+                logger.exception(f"Failed to enable audio tap in {self.audio_tap_dir}: {e}")
         
         # Ensure we're not already running
         with self._lock:
@@ -79,6 +160,8 @@ class AudioDenoiseExtension(Extension):
                 
             # Reset state
             self.stopped = False
+            if self.frame_ring.closed:
+                self.frame_ring = PcmRingBuffer(FRAME_RING_SLOTS, FRAME_RING_SLOT_BYTES, policy=POLICY_DROP_NEWEST)
             
             # Start the processing thread
             logger.info("Starting audio denoising thread")
@@ -109,9 +192,40 @@ class AudioDenoiseExtension(Extension):
             except Exception as err:
                 logger.debug(f"GetProperty optional {optional_param} failed, err: {err}. Using default value: {self.__getattribute__(optional_param)}")
 
+        try:
+            self.audio_tap_dir = rte.get_property_string(PROPERTY_AUDIO_TAP_DIR).strip()
+        except Exception as err:
+            logger.debug(f"GetProperty optional {PROPERTY_AUDIO_TAP_DIR} failed, err: {err}. Audio tap disabled")
+
+        try:
+            self.vad_enabled = rte.get_property_bool(PROPERTY_VAD_ENABLED)
+        except Exception as err:
+            logger.debug(f"GetProperty optional {PROPERTY_VAD_ENABLED} failed, err: {err}. Using default value: {self.vad_enabled}")
+
+        for optional_param in [PROPERTY_TARGET_LATENCY_MS, PROPERTY_MIN_BATCH_SIZE, PROPERTY_MAX_BATCH_SIZE,
+                               PROPERTY_MAX_STREAMS, PROPERTY_STREAM_IDLE_TIMEOUT_S,
+                               PROPERTY_AUDIO_TAP_MAX_FILE_MB, PROPERTY_AUDIO_TAP_MAX_FILE_S, PROPERTY_VAD_HANGOVER_MS,
+                               PROPERTY_BYPASS_ENTER_RTF_PERCENT, PROPERTY_BYPASS_EXIT_RTF_PERCENT,
+                               PROPERTY_BYPASS_PROBE_INTERVAL_MS]:
+            try:
+                value = rte.get_property_int(optional_param)
+                if value > 0:
+                    with self._lock:
+                        self.__setattr__(optional_param, value)
+                    logger.info(f"Set {optional_param} to {value}")
+            except Exception as err:
+                logger.debug(f"GetProperty optional {optional_param} failed, err: {err}. Using default value: {self.__getattribute__(optional_param)}")
+
+        if self.max_batch_size < self.min_batch_size:
+            logger.warning(f"{PROPERTY_MAX_BATCH_SIZE} {self.max_batch_size} is less than {PROPERTY_MIN_BATCH_SIZE} {self.min_batch_size}, using {self.min_batch_size}")
+            self.max_batch_size = self.min_batch_size
+        if self.bypass_exit_rtf_percent > self.bypass_enter_rtf_percent:
+            logger.warning(f"{PROPERTY_BYPASS_EXIT_RTF_PERCENT} {self.bypass_exit_rtf_percent} is greater than {PROPERTY_BYPASS_ENTER_RTF_PERCENT} {self.bypass_enter_rtf_percent}, using {self.bypass_enter_rtf_percent}")
+            self.bypass_exit_rtf_percent = self.bypass_enter_rtf_percent
+
     def put_pcm_frame(self, pcm_frame: PcmFrame) -> None:
         """
-        Add a PCM frame to the processing queue.
+        Copy the audio of a PCM frame into the processing ring.
         
         Args:
             pcm_frame: The PCM frame to process, or None to signal thread termination
@@ -125,7 +239,7 @@ class AudioDenoiseExtension(Extension):
             # Check if frame is None (used as a signal to stop processing)
             if pcm_frame is None:
                 logger.debug("Received None frame, signaling thread termination")
-                self.frame_queue.put(pcm_frame, block=False)
+                self.frame_ring.close()
                 return
                 
             # Check if frame has valid data
@@ -133,12 +247,14 @@ class AudioDenoiseExtension(Extension):
             if not frame_buf or len(frame_buf) == 0:
                 logger.warning("Skipping empty PCM frame")
                 return
-            self.input_file.write(frame_buf)
+            stream_id = self.__get_stream_id(pcm_frame)
+            if self.audio_tap:
+                self.audio_tap.write(f"input_{stream_id}", frame_buf)
 
-            # Use a thread-safe queue to handle multiple frames
-            self.frame_queue.put(pcm_frame, block=False)
-        except queue.Full:
-            logger.warning("Queue is full, dropping frame")
+            meta = (stream_id, pcm_frame.get_sample_rate(), pcm_frame.get_bytes_per_sample())
+            if not self.frame_ring.put(frame_buf, meta):
+                self.metrics.incr("dropped_frames")
+                logger.warning("Ring is full, dropping frame")
         except Exception as e:
             logger.exception(f"Exception in put_pcm_frame: {e}")
 
@@ -182,14 +298,15 @@ class AudioDenoiseExtension(Extension):
                 else:
                     logger.info("Audio processing thread exited successfully")
 
-            self.input_file.close()
-            self.output_file.close()
+            if self.audio_tap:
+                self.audio_tap.close()
+                self.audio_tap = None
         rte.on_stop_done()
 
     def process_audio(self, rte: RteEnv) -> None:
         """
         Main audio processing thread function.
-        Processes audio frames from the queue and applies denoising in batches.
+        Processes audio frames from the ring and applies denoising in batches.
         
         Args:
             rte: The RTE environment instance
@@ -201,66 +318,73 @@ class AudioDenoiseExtension(Extension):
             self.loop = asyncio.new_event_loop()
             asyncio.set_event_loop(self.loop)
             
-            # Track total duration for batched frames
-            total_batch_duration_ms = 0
-            
             # Main processing loop
             while not self.stopped:
                 try:
-                    # Get a frame from the queue with timeout
-                    try:
-                        pcm_frame = self.frame_queue.get(timeout=30.0)
-                        # Mark task as done to prevent queue from growing indefinitely
-                        self.frame_queue.task_done()
-                    except queue.Empty:
-                        # If we have frames in the buffer but haven't reached BATCH_SIZE,
-                        # process them anyway after a timeout to avoid excessive latency
-                        if len(self.frame_buffer) > 0:
-                            logger.info(f"Processing partial batch of {len(self.frame_buffer)} frames after timeout")
-                            self.__process_batch(rte, self.frame_buffer, total_batch_duration_ms)
-                            self.frame_buffer.clear()
-                            total_batch_duration_ms = 0
-                        logger.debug("process_audio: waiting for pcm frame.")
-                        continue
+                    self.__evict_idle_streams()
+                    
+                    # Wait for the next frame, but never past the flush deadline of any buffered frames
+                    timeout = self.__time_until_next_deadline()
+                    item = self.frame_ring.get(timeout=IDLE_WAIT_SECONDS if timeout is None else timeout)
                     
                     # Check for termination signal
-                    if pcm_frame is None:
-                        # Process any remaining frames in the buffer before exiting
-                        if len(self.frame_buffer) > 0:
-                            logger.info(f"Processing final batch of {len(self.frame_buffer)} frames before exit")
-                            self.__process_batch(rte, self.frame_buffer, total_batch_duration_ms)
+                    if item is None and self.frame_ring.closed:
+                        # Process any remaining frames in the buffers before exiting
+                        logger.info(f"Processing final batches of {len(self.streams)} streams before exit")
+                        self.streams.clear()
                         logger.info("Received termination signal, exiting processing loop")
                         break
+                        
+                    if item is None:
+                        # The oldest buffered frame of a stream reached the latency budget, flush partial batches
+                        for ctx in self.streams:
+                            if ctx.batcher.should_flush():
+                                logger.debug(f"Processing partial batch of {len(ctx.batcher)} frames of stream {ctx.stream_id} after deadline")
+                                self.__flush_batch(rte, ctx)
+                        logger.debug("process_audio: waiting for pcm frame.")
+                        continue
                     
-                    # Get the audio data from the frame
-                    frame_buf = pcm_frame.get_buf()
+                    # Get the audio data and frame metadata
+                    frame_buf, (stream_id, frame_sample_rate, bytes_per_sample) = item
                     if not frame_buf:
                         logger.warning("process_audio: empty pcm_frame detected.")
                         continue
+                    original_buf = frame_buf
     
-                    # Extract frame metadata
-                    frame_sample_rate = pcm_frame.get_sample_rate()
-                    bytes_per_sample = pcm_frame.get_bytes_per_sample()
+                    ctx = self.streams.get(stream_id)
+                    
                     duration_ms = int(len(frame_buf) / bytes_per_sample / frame_sample_rate * 1000)
                     
+                    # Gate silence before it reaches the resampler and the model
+                    if ctx.vad:
+                        event = ctx.vad.process(np.frombuffer(frame_buf, dtype=np.int16), duration_ms)
+                        if event:
+                            self.__send_vad_event(rte, ctx, event)
+                        if not ctx.vad.active:
+                            ctx.gated = True
+                            self.__send_silence(rte, ctx, duration_ms)
+                            continue
+                        if ctx.gated:
+                            # speech resumes after silence the resamplers and the denoiser never saw
+                            ctx.gated = False
+                            ctx.reset_history(self.denoiser.new_stream_state())
+                            self.metrics.incr("vad_history_resets")
+                    
                     # Resample if needed
                     if frame_sample_rate != MODEL_SAMPLE_RATE:
-                        frame_buf = self.__resample_bytes(frame_buf, frame_sample_rate, MODEL_SAMPLE_RATE)
+                        frame_buf = self.__resample_bytes(ctx, frame_buf, frame_sample_rate, MODEL_SAMPLE_RATE)
                         
                         # Skip if resampling resulted in empty buffer
                         if not frame_buf or len(frame_buf) == 0:
                             logger.warning("Skipping frame after failed resampling")
                             continue
                     
-                    # Add frame to buffer and update total duration
-                    self.frame_buffer.append((pcm_frame, frame_buf, duration_ms))
-                    total_batch_duration_ms += duration_ms
+                    # Add frame to the stream's buffer and update total duration
+                    ctx.batcher.add((original_buf, frame_buf, duration_ms, frame_sample_rate), duration_ms)
                     
-                    # Process batch when we have collected BATCH_SIZE frames
-                    if len(self.frame_buffer) >= BATCH_SIZE:
-                        self.__process_batch(rte, self.frame_buffer, total_batch_duration_ms)
-                        self.frame_buffer.clear()
-                        total_batch_duration_ms = 0
+                    # Process batch when it is full or the latency budget is used up
+                    if ctx.batcher.should_flush():
+                        self.__flush_batch(rte, ctx)
     
                 except Exception as e:
                     logger.exception(f"Error processing audio frame: {e}")
@@ -279,19 +403,75 @@ class AudioDenoiseExtension(Extension):
                 
             logger.info("Audio denoising thread stopped")
         
-    def __process_batch(self, rte: RteEnv, frame_batch, total_duration_ms):
+    def __create_stream_context(self, stream_id: int) -> StreamContext:
+        batcher = AdaptiveBatcher(
+            target_latency_ms=self.target_latency_ms,
+            min_batch_size=self.min_batch_size,
+            max_batch_size=self.max_batch_size,
+        )
+        vad = EnergyVad(hangover_ms=self.vad_hangover_ms) if self.vad_enabled else None
+        return StreamContext(stream_id, self.denoiser.new_stream_state(), batcher, vad)
+        
+    def __get_stream_id(self, pcm_frame: PcmFrame) -> int:
+        try:
+            return pcm_frame.get_property_int(FRAME_PROPERTY_STREAM_ID)
+        except Exception:
+            return DEFAULT_STREAM_ID
+        
+    def __time_until_next_deadline(self):
+        deadlines = [t for t in (ctx.batcher.time_until_deadline() for ctx in self.streams) if t is not None]
+        return min(deadlines) if deadlines else None
+        
+    def __evict_idle_streams(self) -> None:
+        now = time.monotonic()
+        if now - self.last_eviction_check < EVICTION_CHECK_INTERVAL_SECONDS:
+            return
+        self.last_eviction_check = now
+        self.streams.evict_idle()
+        self.metrics.gauge("active_streams", len(self.streams))
+        
+    def __flush_batch(self, rte: RteEnv, ctx: StreamContext) -> None:
         """
-        Process a batch of audio frames together.
+        Denoise the buffered frames of a stream, then adapt its batch size to the current backlog.
         
         Args:
             rte: The RTE environment instance
-            frame_batch: List of tuples containing (original_frame, processed_buffer, duration_ms)
+            ctx: The stream context holding the buffered frames
+        """
+        if len(ctx.batcher) == 0:
+            return
+        frame_batch, total_duration_ms = ctx.batcher.take()
+        self.__process_batch(rte, ctx, frame_batch, total_duration_ms)
+        
+        queue_depth = len(self.frame_ring)
+        self.metrics.gauge("queue_depth", queue_depth)
+        self.metrics.observe("batch_frames", len(frame_batch))
+        self.metrics.gauge("batch_size", ctx.batcher.adapt(queue_depth))
+        self.metrics.maybe_report()
+        
+    def __process_batch(self, rte: RteEnv, ctx: StreamContext, frame_batch, total_duration_ms):
+        """
+        Process a batch of audio frames of one stream together.
+        
+        Args:
+            rte: The RTE environment instance
+            ctx: The stream context the frames belong to
+            frame_batch: List of tuples containing (original_buffer, processed_buffer, duration_ms, sample_rate)
             total_duration_ms: Total duration of all frames in milliseconds
         """
         if not frame_batch:
             logger.debug("Empty batch received, nothing to process")
             return
             
+        # The denoiser is slower than real time, pass the audio through until it recovers
+        if not self.bypass.should_denoise():
+            ctx.bypassed = True
+            self.__send_original_frames(rte, ctx, frame_batch)
+            self.metrics.incr("bypassed_frames", len(frame_batch))
+            return
+        if ctx.resume_denoising(self.denoiser.new_stream_state()):
+            self.metrics.incr("bypass_history_resets")
+            
         try:
             # Concatenate all frame buffers
             all_buffers = b''.join([frame_data[1] for frame_data in frame_batch])
@@ -303,22 +483,30 @@ class AudioDenoiseExtension(Extension):
                 
             # Apply denoising to the concatenated audio
             batch_start_time = time.time()
-            result = self.denoiser(all_buffers)
-            denoised_pcm = result['output_pcm']
+            denoised_pcm = self.denoiser.process(ctx.denoise_state, all_buffers)
             batch_process_time = (time.time() - batch_start_time)*1000
+            self.metrics.observe("denoise_ms", batch_process_time)
+            
+            mode = self.bypass.update(batch_process_time, total_duration_ms)
+            self.metrics.gauge("denoise_rtf", round(self.bypass.rtf, 3))
+            if mode:
+                self.__send_mode_event(rte, mode)
             
             # Resample output if needed
             if self.sample_rate_out != MODEL_SAMPLE_RATE:
-                denoised_pcm = self.__resample_bytes(denoised_pcm, MODEL_SAMPLE_RATE, self.sample_rate_out)
+                denoised_pcm = self.__resample_bytes(ctx, denoised_pcm, MODEL_SAMPLE_RATE, self.sample_rate_out)
                 
                 # Check if resampling was successful
                 if not denoised_pcm or len(denoised_pcm) == 0:
                     logger.warning("Resampling output resulted in empty buffer, falling back to original frames")
-                    self.__send_original_frames(rte, frame_batch)
+                    self.__send_original_frames(rte, ctx, frame_batch)
                     return
-            self.output_file.write(denoised_pcm)
+            if self.audio_tap:
+                self.audio_tap.write(f"output_{ctx.stream_id}", denoised_pcm)
             # Create a new PCM frame with the denoised audio
             denoised_frame = self.__get_frame(denoised_pcm, self.sample_rate_out, total_duration_ms)
+            if ctx.stream_id != DEFAULT_STREAM_ID:
+                denoised_frame.set_property_int(FRAME_PROPERTY_STREAM_ID, ctx.stream_id)
             
             # Send the denoised frame
             rte.send_pcm_frame(denoised_frame)
@@ -327,26 +515,92 @@ class AudioDenoiseExtension(Extension):
         except Exception as e:
             logger.exception(f"Error in batch denoising: {e}")
             # If denoising fails, pass through the original frames
-            self.__send_original_frames(rte, frame_batch)
+            self.__send_original_frames(rte, ctx, frame_batch)
             
-    def __send_original_frames(self, rte: RteEnv, frame_batch):
+    def __send_silence(self, rte: RteEnv, ctx: StreamContext, duration_ms: int) -> None:
+        """
+        Send a zeroed frame in place of a silent input frame, after any audio of the stream still pending.
+        
+        Args:
+            rte: The RTE environment instance
+            ctx: The stream context the frame belongs to
+            duration_ms: Duration of the silent frame in milliseconds
+        """
+        if len(ctx.batcher) > 0:
+            self.__flush_batch(rte, ctx)
+            
+        silence_frame = self.__get_frame(b'', self.sample_rate_out, duration_ms)
+        if ctx.stream_id != DEFAULT_STREAM_ID:
+            silence_frame.set_property_int(FRAME_PROPERTY_STREAM_ID, ctx.stream_id)
+        rte.send_pcm_frame(silence_frame)
+        self.metrics.incr("vad_skipped_frames")
+        
+    def __send_vad_event(self, rte: RteEnv, ctx: StreamContext, event: str) -> None:
+        """
+        Notify downstream extensions of a speech onset or offset.
+        
+        Args:
+            rte: The RTE environment instance
+            ctx: The stream context the event belongs to
+            event: VAD_EVENT_SPEECH_START or VAD_EVENT_SPEECH_END
+        """
+        logger.debug(f"VAD {event} on stream {ctx.stream_id}")
+        self.metrics.incr(f"vad_{event}")
+        try:
+            vad_data = Data.create(DATA_OUT_VAD_EVENT)
+            vad_data.set_property_int(DATA_OUT_VAD_EVENT_PROPERTY_STREAM_ID, ctx.stream_id)
+            vad_data.set_property_string(DATA_OUT_VAD_EVENT_PROPERTY_EVENT, event)
+            vad_data.set_property_int(DATA_OUT_VAD_EVENT_PROPERTY_TIME, int(time.time() * 1000))
+            rte.send_data(vad_data)
+        except Exception as e:
+            logger.warning(f"Failed to send {DATA_OUT_VAD_EVENT}: {e}")
+            
+    def __send_mode_event(self, rte: RteEnv, mode: str) -> None:
+        """
+        Notify downstream extensions and capacity monitoring of a switch between denoise and bypass mode.
+        
+        Args:
+            rte: The RTE environment instance
+            mode: MODE_DENOISE or MODE_BYPASS
+        """
+        rtf_percent = int(self.bypass.rtf * 100)
+        logger.warning(f"Switching to {mode} mode, denoiser real-time factor {rtf_percent}%")
+        self.metrics.incr(f"mode_{mode}")
+        self.metrics.gauge("bypass", int(self.bypass.bypassed))
+        try:
+            mode_data = Data.create(DATA_OUT_DENOISE_MODE)
+            mode_data.set_property_string(DATA_OUT_DENOISE_MODE_PROPERTY_MODE, mode)
+            mode_data.set_property_int(DATA_OUT_DENOISE_MODE_PROPERTY_RTF_PERCENT, rtf_percent)
+            mode_data.set_property_int(DATA_OUT_DENOISE_MODE_PROPERTY_TIME, int(time.time() * 1000))
+            rte.send_data(mode_data)
+        except Exception as e:
+            logger.warning(f"Failed to send {DATA_OUT_DENOISE_MODE}: {e}")
+            
+    def __send_original_frames(self, rte: RteEnv, ctx: StreamContext, frame_batch):
         """
         Send original frames as fallback when denoising fails.
         
         Args:
             rte: The RTE environment instance
-            frame_batch: List of tuples containing (original_frame, processed_buffer, duration_ms)
+            ctx: The stream context the frames belong to
+            frame_batch: List of tuples containing (original_buffer, processed_buffer, duration_ms, sample_rate)
         """
-        logger.info("Falling back to original frames")
-        for frame_data in frame_batch:
-            original_frame = frame_data[0]
+        logger.debug("Falling back to original frames")
+        for original_buf, _, duration_ms, sample_rate in frame_batch:
+            original_frame = self.__get_frame(original_buf, sample_rate, duration_ms)
+            if ctx.stream_id != DEFAULT_STREAM_ID:
+                original_frame.set_property_int(FRAME_PROPERTY_STREAM_ID, ctx.stream_id)
             rte.send_pcm_frame(original_frame)
 
-    def __resample_bytes(self, input_bytes:bytes, orig_sr:int, target_sr:int) -> bytes:
+    def __resample_bytes(self, ctx: StreamContext, input_bytes:bytes, orig_sr:int, target_sr:int) -> bytes:
         """
         Resample raw PCM bytes from original sample rate to target sample rate
         
+        Uses the stream's resampler for the (orig_sr, target_sr) pair, so filter history is
+        carried across consecutive calls instead of restarting at every batch boundary.
+        
         Args:
+            ctx: The stream context the audio belongs to
             input_bytes (bytes): Raw PCM bytes at original sample rate (16-bit, mono)
             orig_sr (int): Original sample rate in Hz (e.g., 48000 for 48kHz)
             target_sr (int): Target sample rate in Hz (e.g., 16000 for 16kHz)
@@ -359,27 +613,7 @@ class AudioDenoiseExtension(Extension):
             logger.warning(f"Empty input buffer received for resampling from {orig_sr} to {target_sr}")
             return bytes(0)  # Return empty bytes
             
-        # Convert bytes to numpy array (assuming 16-bit PCM)
-        audio_np = np.frombuffer(input_bytes, dtype=np.int16)
-        
-        # Check if we have enough samples to resample
-        if len(audio_np) == 0:
-            logger.warning(f"Zero-length audio array after conversion from bytes")
-            return bytes(0)  # Return empty bytes
-            
-        # Convert to float for librosa (normalize to [-1.0, 1.0])
-        audio_float = audio_np.astype(np.float32) / 32768.0
-        
-        # Resample from original sample rate to target sample rate
-        audio_resampled = librosa.resample(audio_float, orig_sr=orig_sr, target_sr=target_sr)
-        
-        # Convert back to int16
-        audio_resampled_int16 = (audio_resampled * 32768.0).astype(np.int16)
-        
-        # Convert to bytes
-        output_bytes = audio_resampled_int16.tobytes()
-        
-        return output_bytes
+        return ctx.get_resampler(orig_sr, target_sr).process_bytes(input_bytes)
 
 
     def __get_frame(self, data: bytes, sample_rate:int, duration_ms:int) -> PcmFrame:
@@ -394,66 +628,29 @@ class AudioDenoiseExtension(Extension):
         Returns:
             A new PcmFrame object containing the audio data
         """
-        # Calculate frame parameters
         samples = int(sample_rate / 1000 * duration_ms)
-        sample_bytes = int(samples * 2)  # 2 bytes per sample (16-bit)
-        
-        # Create and configure the frame
-        f = PcmFrame.create("pcm_frame")
-        f.set_sample_rate(sample_rate)
-        f.set_bytes_per_sample(2)  # 16-bit audio
-        f.set_number_of_channels(1)  # Mono audio
-        f.set_data_fmt(PcmFrameDataFmt.INTERLEAVE)
-        f.set_samples_per_channel(samples)
-        
-        # Allocate buffer and copy data
-        f.alloc_buf(sample_bytes)
-        buff = f.lock_buf()
-        
-        # Handle potential size mismatch between data and buffer
-        data_len = len(data)
-        buff_len = len(buff)
-        
-        # Copy only as much data as the buffer can hold
-        copy_len = min(data_len, buff_len)
-        
-        # Use a loop to copy byte by byte to avoid memoryview structure mismatch
-        for i in range(copy_len):
-            buff[i] = data[i]
-            
-        f.unlock_buf(buff)
-        
-        return f
+        return self.frame_builder.build(data, sample_rate, samples)
 
     def __init_denoise_model(self):
         """
         Initialize the audio denoising model.
-        This method is thread-safe and will only initialize the model once.
+        The model is loaded once per process and shared, this extension only owns the per-stream state.
         """
         with self._lock:
             if self.denoiser:
                 logger.debug("Denoising model already initialized")
                 return
     
-            # Initialize the denoiser
-            logger.info("Loading audio denoising model...")
-            model_load_start = time.time()
-            
+            session_start = time.time()
             try:
-                self.denoiser = pipeline(
-                    Tasks.acoustic_noise_suppression,
-                    model='iic/speech_dfsmn_ans_psm_48k_causal',
-                    stream_mode=True
-                )
-                
-                model_load_time = time.time() - model_load_start
-                logger.info(f"Audio denoising model loaded in {model_load_time:.2f} seconds")
-                
-                # Warmup inference with empty audio to initialize internal state
-                logger.debug("Performing warmup inference")
-                for i in range(100):
-                    self.denoiser(bytes(3840))  # 3840 bytes = 1920 samples at 16-bit
-                logger.debug("Warmup inference completed")
+                self.denoiser = get_denoise_model()
             except Exception as e:
                 logger.exception(f"Failed to initialize denoising model: {e}")
                 raise
+            session_start_ms = (time.time() - session_start) * 1000
+            
+            logger.info(f"Audio denoising session ready in {session_start_ms:.1f}ms "
+                        f"(model load {self.denoiser.load_time:.2f}s, warmup {self.denoiser.warmup_time:.2f}s, once per process)")
+            self.metrics.gauge("session_start_ms", round(session_start_ms, 1))
+            self.metrics.gauge("model_load_s", round(self.denoiser.load_time, 2))
+            self.metrics.gauge("model_warmup_s", round(self.denoiser.warmup_time, 2))
@@ -0,0 +1,127 @@
+import collections
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+from .log import logger
+
+
+class _TapFile:
+    def __init__(self):
+        self.file = None
+        self.index = 0
+        self.bytes_written = 0
+        self.opened_at = 0.0
+
+
+class AudioTap:
+    """
+    Opt-in raw PCM recorder for debugging audio paths.
+
+    `write` only appends to a bounded in-memory ring and never touches the disk;
+    a background thread drains the ring into per-session files named
+    `<directory>/<session_id>_<tap>_<index>.pcm`, rotating a file once it
+    exceeds `max_file_bytes` or has been open for `max_file_seconds`. When the
+    ring is full the oldest chunks are dropped.
+
+    Extensions keep `None` instead of a tap when recording is disabled, so the
+    audio path pays nothing for it.
+    """
+
+    def __init__(self, directory: str, session_id: Optional[str] = None, max_buffer_bytes: int = 8 * 1024 * 1024,
+                 max_file_bytes: int = 64 * 1024 * 1024, max_file_seconds: int = 600):
+        self.directory = directory
+        self.session_id = session_id or f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self.max_buffer_bytes = max_buffer_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_file_seconds = max_file_seconds
+
+        self.dropped_bytes = 0
+        self.written_bytes = 0
+
+        self._ring = collections.deque()
+        self._ring_bytes = 0
+        self._cond = threading.Condition()
+        self._files = {}
+        self._closed = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self.__run, name="AudioTapWriter", daemon=True)
+        self._thread.start()
+        logger.info(f"Audio tap enabled, writing session {self.session_id} to {directory}")
+
+    def write(self, tap: str, data) -> None:
+        """
+        Queue a chunk of audio for the named tap without blocking on I/O.
+        """
+        chunk = bytes(data)
+        with self._cond:
+            if self._closed:
+                return
+            self._ring.append((tap, chunk))
+            self._ring_bytes += len(chunk)
+            while self._ring_bytes > self.max_buffer_bytes and len(self._ring) > 1:
+                _, dropped = self._ring.popleft()
+                self._ring_bytes -= len(dropped)
+                self.dropped_bytes += len(dropped)
+            self._cond.notify()
+
+    def close(self, timeout: float = 2.0) -> None:
+        """
+        Stop accepting audio, drain what is buffered and close all files.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=timeout)
+        if self.dropped_bytes:
+            logger.warning(f"Audio tap {self.session_id} dropped {self.dropped_bytes} bytes")
+        logger.info(f"Audio tap {self.session_id} closed, wrote {self.written_bytes} bytes")
+
+    def __run(self) -> None:
+        try:
+            while True:
+                with self._cond:
+                    while not self._ring and not self._closed:
+                        self._cond.wait()
+                    if not self._ring and self._closed:
+                        break
+                    batch = list(self._ring)
+                    self._ring.clear()
+                    self._ring_bytes = 0
+
+                for tap, chunk in batch:
+                    self.__write_chunk(tap, chunk)
+        except Exception as e:
+            logger.exception(f"Audio tap writer failed: {e}")
+        finally:
+            for tap_file in self._files.values():
+                if tap_file.file:
+                    tap_file.file.close()
+            self._files.clear()
+
+    def __write_chunk(self, tap: str, chunk: bytes) -> None:
+        tap_file = self._files.get(tap)
+        if tap_file is None:
+            tap_file = _TapFile()
+            self._files[tap] = tap_file
+
+        if tap_file.file and (tap_file.bytes_written >= self.max_file_bytes
+                              or time.monotonic() - tap_file.opened_at >= self.max_file_seconds):
+            tap_file.file.close()
+            tap_file.file = None
+            tap_file.index += 1
+
+        if tap_file.file is None:
+            path = os.path.join(self.directory, f"{self.session_id}_{tap}_{tap_file.index}.pcm")
+            tap_file.file = open(path, 'wb')
+            tap_file.bytes_written = 0
+            tap_file.opened_at = time.monotonic()
+
+        tap_file.file.write(chunk)
+        tap_file.bytes_written += len(chunk)
+        self.written_bytes += len(chunk)
@@ -0,0 +1,73 @@
+import time
+from typing import List, Optional, Tuple
+
+
+class AdaptiveBatcher:
+    """
+    Collects frames into denoise batches under a latency budget.
+
+    A batch is flushed when it reaches the current batch size, or when the oldest
+    buffered frame has waited for `target_latency_ms`. The batch size grows while
+    the input queue is backed up (bigger batches amortize per-call model overhead)
+    and shrinks back towards `min_batch_size` when the queue is idle.
+    """
+
+    def __init__(self, target_latency_ms: int = 40, min_batch_size: int = 2, max_batch_size: int = 16,
+                 initial_batch_size: int = 4):
+        if min_batch_size < 1 or max_batch_size < min_batch_size:
+            raise ValueError(f"Invalid batch size range [{min_batch_size}, {max_batch_size}]")
+
+        self.target_latency_ms = target_latency_ms
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_size = min(max(initial_batch_size, min_batch_size), max_batch_size)
+
+        self.frames = []
+        self.duration_ms = 0
+        self.first_frame_time = None
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def add(self, item, duration_ms: int) -> None:
+        if not self.frames:
+            self.first_frame_time = time.monotonic()
+        self.frames.append(item)
+        self.duration_ms += duration_ms
+
+    def time_until_deadline(self) -> Optional[float]:
+        """
+        Seconds left before the buffered frames must be flushed, None if nothing is buffered.
+        """
+        if not self.frames:
+            return None
+        waited_ms = (time.monotonic() - self.first_frame_time) * 1000
+        return max(0.0, (self.target_latency_ms - waited_ms) / 1000)
+
+    def should_flush(self) -> bool:
+        if not self.frames:
+            return False
+        return len(self.frames) >= self.batch_size or self.time_until_deadline() == 0
+
+    def take(self) -> Tuple[List, int]:
+        """
+        Remove and return the buffered frames together with their total duration in ms.
+        """
+        frames, duration_ms = self.frames, self.duration_ms
+        self.frames = []
+        self.duration_ms = 0
+        self.first_frame_time = None
+        return frames, duration_ms
+
+    def adapt(self, queue_depth: int) -> int:
+        """
+        Adjust the batch size to the input backlog, returns the new batch size.
+
+        Args:
+            queue_depth: Number of frames waiting in the input queue
+        """
+        if queue_depth >= self.batch_size:
+            self.batch_size = min(self.batch_size * 2, self.max_batch_size)
+        elif queue_depth == 0 and self.batch_size > self.min_batch_size:
+            self.batch_size -= 1
+        return self.batch_size
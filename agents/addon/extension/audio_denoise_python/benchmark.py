@@ -0,0 +1,196 @@
+"""
+Micro-benchmarks of the audio path of the denoise extension, old and new implementations side by side.
+
+Run from agents/addon/extension, with the rte python binding importable:
+
+    python -m audio_denoise_python.benchmark frame_builder --frame-ms 40
+    python -m audio_denoise_python.benchmark resampler --frame-ms 10
+    python -m audio_denoise_python.benchmark ring --frame-ms 10
+"""
+import argparse
+import asyncio
+import json
+import queue
+import threading
+import time
+import timeit
+from typing import Callable
+
+import librosa
+import numpy as np
+from rte import PcmFrame, PcmFrameDataFmt
+
+from .frame_builder import PcmFrameBuilder
+from .pcm_ring_buffer import PcmRingBuffer
+from .resampler import StreamingResampler
+
+SAMPLE_RATE = 16000
+MODEL_SAMPLE_RATE = 48000
+BYTES_PER_SAMPLE = 2
+
+
+def best_us(fn: Callable[[], None], number: int, repeat: int = 5) -> float:
+    """best time of one call in microseconds over `repeat` runs of `number` calls"""
+    return round(min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6, 2)
+
+
+def create_frame_byte_loop(data: bytes, sample_rate: int, samples_per_channel: int) -> PcmFrame:
+    """frame construction before PcmFrameBuilder, copying one byte at a time"""
+    f = PcmFrame.create("pcm_frame")
+    f.set_sample_rate(sample_rate)
+    f.set_bytes_per_sample(BYTES_PER_SAMPLE)
+    f.set_number_of_channels(1)
+    f.set_data_fmt(PcmFrameDataFmt.INTERLEAVE)
+    f.set_samples_per_channel(samples_per_channel)
+    f.alloc_buf(samples_per_channel * BYTES_PER_SAMPLE)
+    buff = f.lock_buf()
+    for i in range(min(len(data), len(buff))):
+        buff[i] = data[i]
+    f.unlock_buf(buff)
+    return f
+
+
+def bench_frame_builder(args) -> dict:
+    samples = SAMPLE_RATE * args.frame_ms // 1000
+    data = np.random.default_rng(0).integers(-3000, 3000, samples, dtype=np.int16).tobytes()
+    builder = PcmFrameBuilder()
+
+    frame = builder.build(data, SAMPLE_RATE, samples)
+    buff = frame.lock_buf()
+    assert bytes(buff) == data
+    frame.unlock_buf(buff)
+
+    return {
+        "frame_ms": args.frame_ms,
+        "byte_loop_us": best_us(lambda: create_frame_byte_loop(data, SAMPLE_RATE, samples), args.number),
+        "builder_us": best_us(lambda: builder.build(data, SAMPLE_RATE, samples), args.number),
+    }
+
+
+def resample_librosa(data: bytes, orig_sr: int, target_sr: int, res_type: str) -> bytes:
+    """resampling before StreamingResampler, one librosa call per batch"""
+    audio_float = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+    audio_resampled = librosa.resample(audio_float, orig_sr=orig_sr, target_sr=target_sr, res_type=res_type)
+    return (audio_resampled * 32768.0).astype(np.int16).tobytes()
+
+
+def bench_resampler(args) -> dict:
+    samples = SAMPLE_RATE * args.frame_ms // 1000
+    t = np.arange(samples) / SAMPLE_RATE
+    data = (8000 * np.sin(2 * np.pi * 1000 * t)).astype(np.int16).tobytes()
+    up = StreamingResampler(SAMPLE_RATE, MODEL_SAMPLE_RATE)
+    down = StreamingResampler(MODEL_SAMPLE_RATE, SAMPLE_RATE)
+    up_data = up.process_bytes(data)
+    number = max(10, args.number // 20)
+
+    return {
+        "frame_ms": args.frame_ms,
+        "res_type": args.res_type,
+        "librosa_up_us": best_us(lambda: resample_librosa(data, SAMPLE_RATE, MODEL_SAMPLE_RATE, args.res_type), number),
+        "librosa_down_us": best_us(lambda: resample_librosa(up_data, MODEL_SAMPLE_RATE, SAMPLE_RATE, args.res_type), number),
+        "streaming_up_us": best_us(lambda: up.process_bytes(data), args.number),
+        "streaming_down_us": best_us(lambda: down.process_bytes(up_data), args.number),
+    }
+
+
+def producer_us(put: Callable[[], None], consume: Callable[[int], None], number: int) -> float:
+    """average cost of `put` on the producer thread while `consume` takes the chunks on another thread"""
+    consumer = threading.Thread(target=consume, args=[number])
+    consumer.start()
+    cost = 0.0
+    for i in range(number):
+        start = time.perf_counter()
+        put()
+        cost += time.perf_counter() - start
+        if i % 10 == 0:
+            # let the consumer run dry now and then, so it has to be woken up
+            time.sleep(0.0005)
+    consumer.join()
+    return round(cost / number * 1e6, 2)
+
+
+def bench_ring(args) -> dict:
+    data = bytes(SAMPLE_RATE * BYTES_PER_SAMPLE * args.frame_ms // 1000)
+    meta = (0, SAMPLE_RATE, BYTES_PER_SAMPLE)
+    number = args.number * 10
+
+    ring = PcmRingBuffer(3000, 960)
+    frame_queue = queue.Queue(3000)
+
+    def ring_put_get():
+        ring.put(data, meta)
+        ring.get_nowait()
+
+    def queue_put_get():
+        frame_queue.put(data, block=False)
+        frame_queue.get(timeout=1)
+
+    def ring_consume(n):
+        for _ in range(n):
+            ring.get(timeout=5)
+
+    def queue_consume(n):
+        for _ in range(n):
+            frame_queue.get(timeout=5)
+
+    # before the ring, the Transcribe extension scheduled a coroutine on its loop per frame and waited for it
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever)
+    loop_thread.start()
+    async_queue = asyncio.Queue()
+
+    async def enqueue():
+        await async_queue.put(data)
+
+    def coroutine_put():
+        asyncio.run_coroutine_threadsafe(enqueue(), loop).result()
+
+    def coroutine_consume(n):
+        async def consume():
+            for _ in range(n):
+                await async_queue.get()
+        asyncio.run_coroutine_threadsafe(consume(), loop).result()
+
+    def ring_async_consume(n):
+        async def consume():
+            for _ in range(n):
+                await ring.get_async(loop, timeout=5)
+        asyncio.run_coroutine_threadsafe(consume(), loop).result()
+
+    try:
+        return {
+            "frame_ms": args.frame_ms,
+            "same_thread_ring_us": best_us(ring_put_get, number),
+            "same_thread_queue_us": best_us(queue_put_get, number),
+            "threaded_ring_us": producer_us(lambda: ring.put(data, meta), ring_consume, args.number * 5),
+            "threaded_queue_us": producer_us(lambda: frame_queue.put(data, block=False), queue_consume, args.number * 5),
+            "asyncio_ring_us": producer_us(lambda: ring.put(data, meta), ring_async_consume, args.number * 5),
+            "asyncio_run_coroutine_threadsafe_us": producer_us(coroutine_put, coroutine_consume, args.number * 5),
+        }
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        loop.close()
+
+
+BENCHMARKS = {
+    "frame_builder": bench_frame_builder,
+    "resampler": bench_resampler,
+    "ring": bench_ring,
+}
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("benchmark", choices=list(BENCHMARKS))
+    parser.add_argument("--frame-ms", type=int, default=40, help="audio per frame")
+    parser.add_argument("--number", type=int, default=2000, help="calls per timed run")
+    parser.add_argument("--res-type", default="kaiser_best", help="librosa resampler, kaiser_best is the default of the pinned librosa 0.9.2")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_args()
+    print(json.dumps(BENCHMARKS[args.benchmark](args), indent=2))
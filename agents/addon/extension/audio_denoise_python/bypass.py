@@ -0,0 +1,73 @@
+import time
+from typing import Optional
+
+MODE_DENOISE = 'denoise'
+MODE_BYPASS = 'bypass'
+
+
+class BypassController:
+    """
+    Switches the extension to passthrough when the denoiser falls behind real time.
+
+    The real-time factor of a pass is its processing time divided by the audio
+    span it covers, tracked as an exponential moving average. Above `enter_rtf`
+    passes are bypassed and the original audio is sent; one pass is still
+    denoised every `probe_interval_s` to keep measuring. Denoising resumes once
+    the average drops below `exit_rtf`, the gap between both thresholds avoids
+    flapping between modes.
+    """
+
+    def __init__(self, enter_rtf: float = 0.9, exit_rtf: float = 0.6, alpha: float = 0.3,
+                 probe_interval_s: float = 1.0):
+        if exit_rtf > enter_rtf:
+            raise ValueError(f"exit_rtf {exit_rtf} must not exceed enter_rtf {enter_rtf}")
+
+        self.enter_rtf = enter_rtf
+        self.exit_rtf = exit_rtf
+        self.alpha = alpha
+        self.probe_interval_s = probe_interval_s
+
+        self.rtf = None
+        self.bypassed = False
+        self.last_probe = 0.0
+
+    @property
+    def mode(self) -> str:
+        return MODE_BYPASS if self.bypassed else MODE_DENOISE
+
+    def should_denoise(self) -> bool:
+        """
+        Whether the next pass should run through the model, always in denoise mode and once per probe interval in bypass mode.
+        """
+        if not self.bypassed:
+            return True
+        now = time.monotonic()
+        if now - self.last_probe >= self.probe_interval_s:
+            self.last_probe = now
+            return True
+        return False
+
+    def update(self, process_ms: float, audio_ms: float) -> Optional[str]:
+        """
+        Record a denoised pass.
+
+        Args:
+            process_ms: Wall time the model took for the pass
+            audio_ms: Duration of audio the pass covers per stream
+
+        Returns:
+            The new mode when it changed, None otherwise
+        """
+        if audio_ms <= 0:
+            return None
+        rtf = process_ms / audio_ms
+        self.rtf = rtf if self.rtf is None else self.alpha * rtf + (1 - self.alpha) * self.rtf
+
+        if not self.bypassed and self.rtf > self.enter_rtf:
+            self.bypassed = True
+            self.last_probe = time.monotonic()
+            return MODE_BYPASS
+        if self.bypassed and self.rtf < self.exit_rtf:
+            self.bypassed = False
+            return MODE_DENOISE
+        return None
@@ -0,0 +1,100 @@
+from rte import (
+    PcmFrame,
+    PcmFrameDataFmt,
+)
+
+from .log import logger
+
+
+class PcmFrameBuilder:
+    """
+    Builds outgoing PCM frames with a single slice assignment into the frame buffer.
+
+    Size mismatches between the payload and the frame are handled explicitly:
+    short payloads are zero-padded and long payloads are truncated. The zero
+    padding comes from a preallocated scratch buffer that grows on demand, so
+    steady-state frame construction does not allocate on the Python side.
+    """
+
+    def __init__(self, bytes_per_sample: int = 2, number_of_channels: int = 1, name: str = "pcm_frame"):
+        self.bytes_per_sample = bytes_per_sample
+        self.number_of_channels = number_of_channels
+        self.name = name
+
+        self._zeros = bytes(0)
+        self._zeros_view = memoryview(self._zeros)
+
+        self.padded_frames = 0
+        self.truncated_frames = 0
+
+    def frame_size(self, samples_per_channel: int) -> int:
+        """
+        Get the buffer size in bytes of a frame holding the given number of samples per channel.
+        """
+        return samples_per_channel * self.number_of_channels * self.bytes_per_sample
+
+    def build(self, data, sample_rate: int, samples_per_channel: int) -> PcmFrame:
+        """
+        Create a new PCM frame and copy the given audio data into it.
+
+        Args:
+            data: Raw PCM audio data (bytes, bytearray, memoryview or a contiguous NumPy array)
+            sample_rate: Sample rate in Hz
+            samples_per_channel: Number of samples per channel the frame holds
+
+        Returns:
+            A new PcmFrame object containing the audio data
+        """
+        frame_size = self.frame_size(samples_per_channel)
+
+        f = PcmFrame.create(self.name)
+        f.set_sample_rate(sample_rate)
+        f.set_bytes_per_sample(self.bytes_per_sample)
+        f.set_number_of_channels(self.number_of_channels)
+        f.set_data_fmt(PcmFrameDataFmt.INTERLEAVE)
+        f.set_samples_per_channel(samples_per_channel)
+
+        f.alloc_buf(frame_size)
+        buff = f.lock_buf()
+        try:
+            self.copy_into(buff, data)
+        finally:
+            f.unlock_buf(buff)
+
+        return f
+
+    def copy_into(self, buff, data) -> int:
+        """
+        Copy data into a locked frame buffer, padding with zeros or truncating as needed.
+
+        Both sides are cast to flat unsigned byte views first, so slice assignment never
+        fails with a memoryview structure mismatch.
+
+        Returns:
+            Number of payload bytes copied
+        """
+        dst = memoryview(buff).cast("B")
+        src = memoryview(data)
+        if src.format != "B" or src.ndim != 1:
+            src = src.cast("B")
+
+        buff_len = len(dst)
+        data_len = len(src)
+
+        if data_len >= buff_len:
+            if data_len > buff_len:
+                self.truncated_frames += 1
+                logger.debug(f"Truncating {data_len - buff_len} bytes that do not fit in the frame")
+            dst[:] = src[:buff_len]
+            return buff_len
+
+        self.padded_frames += 1
+        dst[:data_len] = src
+        dst[data_len:] = self.__zeros(buff_len - data_len)
+        return data_len
+
+    def __zeros(self, size: int) -> memoryview:
+        if len(self._zeros) < size:
+            self._zeros = bytes(size)
+            self._zeros_view = memoryview(self._zeros)
+        return self._zeros_view[:size]
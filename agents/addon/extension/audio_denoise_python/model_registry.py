@@ -0,0 +1,109 @@
+import copy
+import threading
+import time
+
+from modelscope.pipelines import pipeline
+from modelscope.utils.constant import Tasks
+
+from .log import logger
+
+DENOISE_MODEL_ID = 'iic/speech_dfsmn_ans_psm_48k_causal'
+
+WARMUP_ITERATIONS = 100
+WARMUP_CHUNK_BYTES = 3840  # 3840 bytes = 1920 samples at 16-bit
+
+# Attributes the ANS pipeline mutates in stream mode: the sliding input window,
+# the byte count until the next stride and whether the first window was emitted.
+STREAM_STATE_ATTRS = ('buffer', 'byte_length_remain', 'first_forward')
+
+
+class DenoiseStreamState:
+    """
+    Streaming state of one audio stream running through a shared denoise pipeline.
+    """
+
+    def __init__(self, attrs: dict):
+        self.attrs = attrs
+
+
+class SharedDenoiseModel:
+    """
+    A denoise pipeline loaded once per process and shared read-only between sessions.
+
+    The model weights are shared, while the causal streaming state lives in a
+    DenoiseStreamState owned by each session. The state is installed on the
+    pipeline for the duration of a call, so calls are serialized.
+    """
+
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+        self._lock = threading.Lock()
+
+        logger.info(f"Loading audio denoising model {model_id}...")
+        model_load_start = time.time()
+        self.pipeline = pipeline(
+            Tasks.acoustic_noise_suppression,
+            model=model_id,
+            stream_mode=True
+        )
+        self.load_time = time.time() - model_load_start
+        logger.info(f"Audio denoising model loaded in {self.load_time:.2f} seconds")
+
+        # Warmup inference with empty audio to initialize internal state
+        logger.debug("Performing warmup inference")
+        warmup_start = time.time()
+        for i in range(WARMUP_ITERATIONS):
+            self.pipeline(bytes(WARMUP_CHUNK_BYTES))
+        self.warmup_time = time.time() - warmup_start
+        logger.info(f"Audio denoising model warmup completed in {self.warmup_time:.2f} seconds")
+
+        # New streams start from the warmed-up state, as if they had received the warmup audio
+        self._initial_state = self.__capture_state()
+
+    def __capture_state(self) -> dict:
+        return {attr: getattr(self.pipeline, attr) for attr in STREAM_STATE_ATTRS if hasattr(self.pipeline, attr)}
+
+    def new_stream_state(self) -> DenoiseStreamState:
+        """
+        Create an independent streaming state for a new audio stream.
+        """
+        with self._lock:
+            return DenoiseStreamState(copy.deepcopy(self._initial_state))
+
+    def process(self, state: DenoiseStreamState, data: bytes) -> bytes:
+        """
+        Denoise the next chunk of a stream.
+
+        Args:
+            state: The stream's state, updated in place
+            data: 16-bit mono PCM at the model sample rate
+
+        Returns:
+            Denoised PCM bytes
+        """
+        with self._lock:
+            for attr, value in state.attrs.items():
+                setattr(self.pipeline, attr, value)
+            try:
+                result = self.pipeline(data)
+            finally:
+                state.attrs = self.__capture_state()
+        return result['output_pcm']
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_denoise_model(model_id: str = DENOISE_MODEL_ID) -> SharedDenoiseModel:
+    """
+    Get the process-wide denoise model, loading and warming it up on first use.
+    """
+    with _models_lock:
+        model = _models.get(model_id)
+        if model is None:
+            model = SharedDenoiseModel(model_id)
+            _models[model_id] = model
+        else:
+            logger.debug(f"Reusing loaded audio denoising model {model_id}")
+        return model
@@ -0,0 +1,140 @@
+from math import gcd
+
+import numpy as np
+
+INT16_MIN = -32768
+INT16_MAX = 32767
+
+# above this many branches, gather per-output windows instead of a dense matmul
+MAX_DENSE_PHASES = 8
+
+
+class StreamingResampler:
+    """
+    Stateful polyphase FIR resampler for a single mono audio stream.
+
+    The resampler is created once per stream and keeps the tail of the input
+    between calls, so consecutive chunks are filtered as one continuous signal
+    without edge artifacts at chunk boundaries. Filtering is done in float32 on
+    the raw sample values, int16 input is not normalized to [-1.0, 1.0].
+    """
+
+    def __init__(self, orig_sr: int, target_sr: int, taps_per_phase: int = 32, kaiser_beta: float = 8.0, rolloff: float = 0.94):
+        """
+        Args:
+            orig_sr: Input sample rate in Hz
+            target_sr: Output sample rate in Hz
+            taps_per_phase: Filter taps per polyphase branch, higher is sharper but slower
+            kaiser_beta: Kaiser window shape parameter of the prototype filter
+            rolloff: Cutoff frequency as a fraction of the lower Nyquist frequency
+        """
+        if orig_sr <= 0 or target_sr <= 0:
+            raise ValueError(f"Invalid sample rates: {orig_sr} -> {target_sr}")
+
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+
+        g = gcd(orig_sr, target_sr)
+        self.up = target_sr // g
+        self.down = orig_sr // g
+        self.taps_per_phase = taps_per_phase
+
+        self.bank = self.__design_filter_bank(kaiser_beta, rolloff)
+
+        # Last (taps_per_phase - 1) input samples of the previous call
+        self.history = np.zeros(self.taps_per_phase - 1, dtype=np.float32)
+        self.in_count = 0
+        self.out_count = 0
+
+    def __design_filter_bank(self, kaiser_beta: float, rolloff: float) -> np.ndarray:
+        """
+        Design a windowed-sinc low-pass prototype at the upsampled rate and split it
+        into `up` polyphase branches, each reversed to match a time-ascending window.
+        """
+        num_taps = self.taps_per_phase * self.up
+        cutoff = rolloff / max(self.up, self.down)
+
+        n = np.arange(num_taps) - (num_taps - 1) / 2.0
+        h = cutoff * np.sinc(cutoff * n) * np.kaiser(num_taps, kaiser_beta)
+        h *= self.up / h.sum()
+
+        # branch p holds h[p], h[p + up], h[p + 2*up], ...
+        bank = h.reshape(self.taps_per_phase, self.up).T
+        return np.ascontiguousarray(bank[:, ::-1], dtype=np.float32)
+
+    @property
+    def delay_samples(self) -> float:
+        """Group delay of the filter in output samples."""
+        return (self.taps_per_phase * self.up - 1) / 2.0 / self.down
+
+    def reset(self) -> None:
+        self.history[:] = 0
+        self.in_count = 0
+        self.out_count = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resample the next chunk of the stream.
+
+        Args:
+            samples: 1-D int16 or float32 array of input samples
+
+        Returns:
+            Resampled samples, int16 (saturated) for int16 input, float32 otherwise
+        """
+        is_int16 = samples.dtype == np.int16
+
+        if self.up == self.down:
+            return samples.copy()
+
+        x = samples.astype(np.float32, copy=False)
+        out_dtype = np.int16 if is_int16 else np.float32
+
+        buf = np.concatenate((self.history, x))
+        total_in = self.in_count + len(x)
+
+        # every output n whose input position (n * down) // up is already available
+        out_end = -(-(total_in * self.up) // self.down)
+        n = np.arange(self.out_count, out_end, dtype=np.int64)
+        pos = n * self.down
+        start = pos // self.up - self.in_count
+        phase = pos % self.up
+
+        if len(n) == 0:
+            y = np.zeros(0, dtype=np.float32)
+        else:
+            y = self.__filter(buf, start, phase)
+
+        self.history = buf[len(buf) - (self.taps_per_phase - 1):].copy()
+        self.in_count = total_in
+        self.out_count = out_end
+
+        # keep the counters small, only their relation to the phase matters
+        if self.in_count >= self.down * 1000 and self.out_count >= self.up * 1000:
+            k = min(self.in_count // self.down, self.out_count // self.up)
+            self.in_count -= k * self.down
+            self.out_count -= k * self.up
+
+        if is_int16:
+            return np.clip(np.rint(y), INT16_MIN, INT16_MAX).astype(out_dtype)
+        return y.astype(out_dtype, copy=False)
+
+    def __filter(self, buf: np.ndarray, start: np.ndarray, phase: np.ndarray) -> np.ndarray:
+        windows = np.lib.stride_tricks.sliding_window_view(buf, self.taps_per_phase)
+        if self.up == 1:
+            return windows[start] @ self.bank[0]
+
+        if self.up <= MAX_DENSE_PHASES:
+            # filter every input position with every branch in one matmul, then pick
+            first = start[0]
+            return (windows[first:start[-1] + 1] @ self.bank.T)[start - first, phase]
+
+        return np.einsum('ij,ij->i', windows[start], self.bank[phase])
+
+    def process_bytes(self, data: bytes) -> bytes:
+        """
+        Resample the next chunk of 16-bit mono PCM bytes.
+        """
+        if not data:
+            return bytes(0)
+        return self.process(np.frombuffer(data, dtype=np.int16)).tobytes()
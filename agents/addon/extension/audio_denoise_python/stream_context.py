@@ -0,0 +1,138 @@
+import collections
+import time
+from typing import Callable, List, Optional
+
+from .batcher import AdaptiveBatcher
+from .model_registry import DenoiseStreamState
+from .resampler import StreamingResampler
+from .vad import EnergyVad
+from .log import logger
+
+
+class StreamContext:
+    """
+    Everything that carries history for one source stream: the denoiser's
+    streaming state, the resamplers, the pending batch and the voice activity detector.
+    """
+
+    def __init__(self, stream_id: int, denoise_state: DenoiseStreamState, batcher: AdaptiveBatcher,
+                 vad: Optional[EnergyVad] = None):
+        self.stream_id = stream_id
+        self.denoise_state = denoise_state
+        self.batcher = batcher
+        self.vad = vad
+        self.resamplers = {}
+        self.last_active = time.monotonic()
+        # the last frame was gated as silence and skipped the resamplers and the denoiser
+        self.gated = False
+        # the last batch was passed through while the denoiser was bypassed
+        self.bypassed = False
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+    def reset_history(self, denoise_state: DenoiseStreamState) -> None:
+        """
+        Start the resamplers and the denoiser over, so audio after a gap they did not see
+        is not filtered against the audio from before it.
+        """
+        self.denoise_state = denoise_state
+        for resampler in self.resamplers.values():
+            resampler.reset()
+
+    def resume_denoising(self, denoise_state: DenoiseStreamState) -> bool:
+        """
+        Start the stream's history over if its last batch was passed through, the denoiser
+        and the output resampler did not see that audio.
+
+        Returns:
+            True if the history was reset
+        """
+        if not self.bypassed:
+            return False
+        self.bypassed = False
+        self.reset_history(denoise_state)
+        return True
+
+    def get_resampler(self, orig_sr: int, target_sr: int) -> StreamingResampler:
+        """
+        Get the streaming resampler of this stream for a (orig_sr, target_sr) pair.
+        """
+        resampler = self.resamplers.get((orig_sr, target_sr))
+        if resampler is None:
+            logger.info(f"Creating streaming resampler from {orig_sr} to {target_sr} for stream {self.stream_id}")
+            resampler = StreamingResampler(orig_sr, target_sr)
+            self.resamplers[(orig_sr, target_sr)] = resampler
+        return resampler
+
+
+class StreamContextCache:
+    """
+    Bounded LRU of stream contexts.
+
+    When more than `max_streams` streams are active the least recently used one
+    is evicted, and contexts idle for longer than `idle_timeout_s` are evicted by
+    `evict_idle`. `on_evict` is called for every evicted context so pending audio
+    can be flushed.
+    """
+
+    def __init__(self, factory: Callable[[int], StreamContext], max_streams: int = 8, idle_timeout_s: float = 60.0,
+                 on_evict: Optional[Callable[[StreamContext], None]] = None):
+        self.factory = factory
+        self.max_streams = max_streams
+        self.idle_timeout_s = idle_timeout_s
+        self.on_evict = on_evict
+        self.contexts = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.contexts)
+
+    def __iter__(self):
+        return iter(list(self.contexts.values()))
+
+    def get(self, stream_id: int) -> StreamContext:
+        """
+        Get the context of a stream, creating it (and evicting the LRU one if full) on first use.
+        """
+        ctx = self.contexts.get(stream_id)
+        if ctx is None:
+            while len(self.contexts) >= self.max_streams:
+                _, lru = self.contexts.popitem(last=False)
+                logger.info(f"Evicting least recently used stream {lru.stream_id}, {len(self.contexts)} streams left")
+                self.__evict(lru)
+            ctx = self.factory(stream_id)
+            self.contexts[stream_id] = ctx
+            logger.info(f"Created denoise context for stream {stream_id}, {len(self.contexts)} streams active")
+        else:
+            self.contexts.move_to_end(stream_id)
+        ctx.touch()
+        return ctx
+
+    def evict_idle(self) -> List[StreamContext]:
+        """
+        Evict the contexts that have not seen audio for `idle_timeout_s`.
+        """
+        now = time.monotonic()
+        evicted = []
+        # contexts are kept in LRU order, so the idle ones are at the front
+        while self.contexts:
+            ctx = next(iter(self.contexts.values()))
+            if now - ctx.last_active < self.idle_timeout_s:
+                break
+            self.contexts.popitem(last=False)
+            logger.info(f"Evicting stream {ctx.stream_id} after {now - ctx.last_active:.0f}s idle")
+            self.__evict(ctx)
+            evicted.append(ctx)
+        return evicted
+
+    def clear(self) -> None:
+        while self.contexts:
+            _, ctx = self.contexts.popitem(last=False)
+            self.__evict(ctx)
+
+    def __evict(self, ctx: StreamContext) -> None:
+        if self.on_evict:
+            try:
+                self.on_evict(ctx)
+            except Exception as e:
+                logger.exception(f"Error evicting stream {ctx.stream_id}: {e}")
@@ -0,0 +1,141 @@
+"""
+Wraparound and overflow behavior of PcmRingBuffer.
+
+Run from agents/addon/extension, with the rte python binding importable:
+
+    python -m pytest audio_denoise_python/tests
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from audio_denoise_python.pcm_ring_buffer import PcmRingBuffer, POLICY_DROP_NEWEST, POLICY_DROP_OLDEST
+
+
+def chunk(i: int, size: int = 4) -> bytes:
+    return bytes([i % 256]) * size
+
+
+def drain(ring: PcmRingBuffer) -> list:
+    items = []
+    while True:
+        item = ring.get_nowait()
+        if item is None:
+            return items
+        items.append(item)
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        PcmRingBuffer(4, 4, policy="drop_all")
+    with pytest.raises(ValueError):
+        PcmRingBuffer(0, 4)
+
+
+@pytest.mark.parametrize("policy", [POLICY_DROP_NEWEST, POLICY_DROP_OLDEST])
+def test_wraparound_keeps_order_and_data(policy):
+    ring = PcmRingBuffer(4, 4, policy=policy)
+    expected = []
+    got = []
+    # one chunk stays behind, then three in and three out, so the ring is full at a
+    # different slot on every lap
+    for i in range(301):
+        assert ring.put(chunk(i), i)
+        expected.append((chunk(i), i))
+        if i % 3 == 0 and i:
+            got += [ring.get_nowait() for _ in range(3)]
+    got += drain(ring)
+    assert got == expected
+    assert ring.dropped == 0
+
+
+def test_large_chunk_spans_slots_across_the_end():
+    ring = PcmRingBuffer(4, 4)
+    for i in range(3):
+        ring.put(chunk(i), i)
+    drain(ring)
+    # the next chunk starts in the last slot and wraps to the first ones
+    assert ring.put(b"abcdefghij", "m")
+    assert drain(ring) == [(b"abcd", "m"), (b"efgh", "m"), (b"ij", "m")]
+
+
+def test_drop_newest_rejects_when_full():
+    ring = PcmRingBuffer(4, 4, policy=POLICY_DROP_NEWEST)
+    for i in range(4):
+        assert ring.put(chunk(i), i)
+    assert not ring.put(chunk(4), 4)
+    assert ring.dropped == 1
+    assert [meta for _, meta in drain(ring)] == [0, 1, 2, 3]
+
+
+def test_drop_newest_rejects_a_chunk_that_only_fits_in_part():
+    ring = PcmRingBuffer(4, 4, policy=POLICY_DROP_NEWEST)
+    for i in range(2):
+        ring.put(chunk(i), i)
+    # three slots needed, two free: nothing of it is queued
+    assert not ring.put(b"abcdefghij", "m")
+    assert ring.dropped == 3
+    assert [meta for _, meta in drain(ring)] == [0, 1]
+
+    assert ring.put(b"abcdefghij", "m")
+    assert b"".join(data for data, _ in drain(ring)) == b"abcdefghij"
+
+
+def test_drop_newest_rejects_a_chunk_larger_than_the_ring():
+    ring = PcmRingBuffer(2, 4, policy=POLICY_DROP_NEWEST)
+    assert not ring.put(bytes(12))
+    assert ring.empty()
+
+
+def test_drop_oldest_overwrites_and_counts():
+    ring = PcmRingBuffer(4, 4, policy=POLICY_DROP_OLDEST)
+    for i in range(6):
+        assert ring.put(chunk(i), i)
+    assert len(ring) == 4
+    assert drain(ring) == [(chunk(i), i) for i in range(2, 6)]
+    assert ring.dropped == 2
+
+
+def test_get_times_out_and_returns_none_once_closed():
+    ring = PcmRingBuffer(4, 4)
+    assert ring.get(timeout=0.01) is None
+    ring.put(chunk(1), 1)
+    ring.close()
+    assert ring.get(timeout=1) == (chunk(1), 1)
+    assert ring.get(timeout=1) is None
+
+
+def test_threaded_consumer_sees_every_chunk_in_order():
+    ring = PcmRingBuffer(64, 320)
+    n = 20000
+    got = []
+
+    def consume():
+        while True:
+            item = ring.get(timeout=5)
+            if item is None:
+                return
+            got.append(item[1])
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    for i in range(n):
+        while not ring.put(chunk(i, 320), i):
+            time.sleep(0)  # full, let the consumer catch up
+    ring.close()
+    consumer.join()
+    assert got == list(range(n))
+
+
+def test_async_consumer_is_woken_up():
+    ring = PcmRingBuffer(4, 4)
+    loop = asyncio.new_event_loop()
+    try:
+        async def consume():
+            loop.call_later(0.01, ring.put, chunk(7), 7)
+            return await ring.get_async(loop, timeout=1)
+        assert loop.run_until_complete(consume()) == (chunk(7), 7)
+    finally:
+        loop.close()
@@ -0,0 +1,91 @@
+"""
+Behavior of StreamingResampler across chunk boundaries.
+
+Run from agents/addon/extension, with the rte python binding importable:
+
+    python -m pytest audio_denoise_python/tests
+"""
+import numpy as np
+import pytest
+
+from audio_denoise_python.resampler import StreamingResampler
+
+RATES = [(16000, 48000), (48000, 16000), (16000, 44100), (44100, 16000)]
+
+
+def tone(sample_rate: int, seconds: float, freq: float = 440.0, amplitude: float = 1.0) -> np.ndarray:
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def chunked(resampler: StreamingResampler, x: np.ndarray, sizes) -> np.ndarray:
+    out, i, k = [], 0, 0
+    while i < len(x):
+        n = sizes[k % len(sizes)]
+        out.append(resampler.process(x[i:i + n]))
+        i, k = i + n, k + 1
+    return np.concatenate(out)
+
+
+@pytest.mark.parametrize("orig_sr,target_sr", RATES)
+def test_chunking_does_not_change_output(orig_sr, target_sr):
+    x = tone(orig_sr, 2.0)
+    whole = StreamingResampler(orig_sr, target_sr).process(x)
+    # 10 ms frames, and odd sizes that put every phase at a chunk boundary
+    for sizes in ([orig_sr // 100], [1, 7, 160, 37, 1000]):
+        np.testing.assert_allclose(chunked(StreamingResampler(orig_sr, target_sr), x, sizes), whole,
+                                   rtol=0, atol=1e-4)
+
+
+@pytest.mark.parametrize("orig_sr,target_sr", RATES)
+def test_output_is_causal(orig_sr, target_sr):
+    """what was returned for a chunk depends neither on the next chunk nor on how much audio follows"""
+    x = tone(orig_sr, 0.1)
+    r = StreamingResampler(orig_sr, target_sr)
+    first = r.process(x)
+    assert len(first) == -(-len(x) * target_sr // orig_sr)
+
+    for tail in (np.zeros(orig_sr // 10, np.float32), tone(orig_sr, 0.1, freq=3000.0)):
+        r = StreamingResampler(orig_sr, target_sr)
+        np.testing.assert_array_equal(r.process(np.concatenate((x, tail)))[:len(first)], first)
+
+
+@pytest.mark.parametrize("orig_sr,target_sr", RATES)
+def test_phase_is_continuous_across_chunks(orig_sr, target_sr):
+    """a tone fed in 10 ms chunks comes out as the same tone, delayed by exactly delay_samples"""
+    freq = 440.0
+    r = StreamingResampler(orig_sr, target_sr)
+    y = chunked(r, tone(orig_sr, 1.0, freq), [orig_sr // 100])
+
+    t = (np.arange(len(y)) - r.delay_samples) / target_sr
+    expected = np.sin(2 * np.pi * freq * t)
+    settled = int(2 * r.delay_samples) + 1
+    assert np.abs(y[settled:] - expected[settled:]).max() < 1e-3
+
+
+def test_int16_round_trip():
+    x = (tone(16000, 1.0, freq=1000.0) * 8000).astype(np.int16)
+    up, down = StreamingResampler(16000, 48000), StreamingResampler(48000, 16000)
+    y = np.concatenate([down.process(up.process(x[i:i + 160])) for i in range(0, len(x), 160)])
+    assert y.dtype == np.int16 and len(y) == len(x)
+
+    delay = int(round(up.delay_samples / 3 + down.delay_samples))
+    err = y[delay + 1000:].astype(np.float64) - x[1000:len(y) - delay]
+    snr_db = 10 * np.log10(np.mean(x.astype(np.float64) ** 2) / np.mean(err ** 2))
+    assert snr_db > 60
+
+
+def test_reset_starts_a_new_stream():
+    x = tone(16000, 0.2)
+    r = StreamingResampler(16000, 48000)
+    first = r.process(x)
+    r.process(tone(16000, 0.05, freq=3000.0))
+    r.reset()
+    np.testing.assert_array_equal(r.process(x), first)
+
+
+def test_same_rate_is_a_copy():
+    x = (tone(16000, 0.01) * 1000).astype(np.int16)
+    y = StreamingResampler(16000, 16000).process(x)
+    np.testing.assert_array_equal(y, x)
+    assert y is not x
@@ -0,0 +1,55 @@
+"""
+History of a StreamContext across denoiser bypass.
+
+Run from agents/addon/extension, with the rte python binding importable:
+
+    python -m pytest audio_denoise_python/tests
+"""
+import numpy as np
+
+from audio_denoise_python.batcher import AdaptiveBatcher
+from audio_denoise_python.model_registry import DenoiseStreamState
+from audio_denoise_python.stream_context import StreamContext
+
+MODEL_SAMPLE_RATE = 48000
+OUTPUT_SAMPLE_RATE = 16000
+
+
+def tone(seconds: float, freq: float = 440.0) -> np.ndarray:
+    t = np.arange(int(MODEL_SAMPLE_RATE * seconds)) / MODEL_SAMPLE_RATE
+    return np.sin(2 * np.pi * freq * t).astype(np.float32)
+
+
+def new_context() -> StreamContext:
+    return StreamContext(1, DenoiseStreamState({'generation': 0}), AdaptiveBatcher())
+
+
+def test_denoised_stream_keeps_history():
+    ctx = new_context()
+    state = ctx.denoise_state
+    ctx.get_resampler(MODEL_SAMPLE_RATE, OUTPUT_SAMPLE_RATE).process(tone(0.1))
+
+    assert not ctx.resume_denoising(DenoiseStreamState({'generation': 1}))
+    assert ctx.denoise_state is state
+
+
+def test_resume_after_bypass_starts_history_over():
+    ctx = new_context()
+    resampler = ctx.get_resampler(MODEL_SAMPLE_RATE, OUTPUT_SAMPLE_RATE)
+    resampler.process(tone(0.1))
+    # the next batches are passed through, the denoiser and the output resampler never see them
+    ctx.bypassed = True
+
+    fresh = DenoiseStreamState({'generation': 1})
+    assert ctx.resume_denoising(fresh)
+    assert ctx.denoise_state is fresh
+    assert not ctx.bypassed
+
+    # the output resampler continues as if the stream started here, not from the audio before the bypass
+    after = tone(0.05, freq=1000.0)
+    expected = new_context().get_resampler(MODEL_SAMPLE_RATE, OUTPUT_SAMPLE_RATE).process(after)
+    np.testing.assert_allclose(resampler.process(after), expected, rtol=0, atol=1e-6)
+
+    # a single reset per bypass period
+    assert not ctx.resume_denoising(DenoiseStreamState({'generation': 2}))
+    assert ctx.denoise_state is fresh
@@ -0,0 +1,85 @@
+"""
+Noise floor tracking of EnergyVad.
+
+Run from agents/addon/extension, with the rte python binding importable:
+
+    python -m pytest audio_denoise_python/tests
+"""
+import numpy as np
+
+from audio_denoise_python.vad import EnergyVad, VAD_EVENT_SPEECH_END, VAD_EVENT_SPEECH_START
+
+SAMPLE_RATE = 16000
+FRAME_MS = 10
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+
+def frames(signal: np.ndarray):
+    for i in range(0, len(signal) - FRAME_SAMPLES + 1, FRAME_SAMPLES):
+        yield signal[i:i + FRAME_SAMPLES]
+
+
+def tone(seconds: float, freq: float, amplitude: float, phase: float = 0.0) -> np.ndarray:
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return amplitude * np.sin(2 * np.pi * freq * t + phase)
+
+
+def hiss(seconds: float, amplitude: float, rng: np.random.Generator) -> np.ndarray:
+    return amplitude * rng.standard_normal(int(SAMPLE_RATE * seconds))
+
+
+def speech(seconds: float, rng: np.random.Generator, background: float = 50.0) -> np.ndarray:
+    """400 ms voiced words with 150 ms pauses between them"""
+    words = []
+    while sum(len(w) for w in words) < SAMPLE_RATE * seconds:
+        words.append(tone(0.4, 220.0, 6000.0) * np.hanning(int(SAMPLE_RATE * 0.4)) ** 0.25)
+        words.append(np.zeros(int(SAMPLE_RATE * 0.15)))
+    x = np.concatenate(words)[:int(SAMPLE_RATE * seconds)]
+    return x + hiss(seconds, background, rng)
+
+
+def run(vad: EnergyVad, signal: np.ndarray):
+    """(time in ms, event) of every event, and whether the detector was active after each frame"""
+    events, active = [], []
+    for i, frame in enumerate(frames(signal.astype(np.int16))):
+        event = vad.process(frame, FRAME_MS)
+        if event:
+            events.append((i * FRAME_MS, event))
+        active.append(vad.active)
+    return events, active
+
+
+def test_constant_loud_hum_closes_the_gate():
+    # a steady low-pitched hum is loud and has a low zero-crossing rate, like voiced speech
+    vad = EnergyVad()
+    events, active = run(vad, tone(10.0, 100.0, 3000.0))
+
+    assert events[0] == (FRAME_MS, VAD_EVENT_SPEECH_START)
+    assert events[-1][1] == VAD_EVENT_SPEECH_END
+    # within one floor window and the hangover
+    assert events[-1][0] <= 2000 + 300 + 2 * FRAME_MS
+    assert len(events) == 2
+    assert not any(active[-500:])
+
+
+def test_speech_over_the_hum_opens_the_gate_again():
+    rng = np.random.default_rng(1)
+    vad = EnergyVad()
+    hum = tone(12.0, 100.0, 3000.0)
+    x = hum.copy()
+    x[8 * SAMPLE_RATE:] += speech(4.0, rng) * 4
+    events, _ = run(vad, x)
+
+    starts = [t for t, event in events if event == VAD_EVENT_SPEECH_START]
+    assert any(8000 <= t < 8100 for t in starts)
+
+
+def test_speech_with_pauses_stays_one_segment():
+    rng = np.random.default_rng(2)
+    vad = EnergyVad()
+    x = np.concatenate([hiss(1.0, 50.0, rng), speech(8.0, rng), hiss(1.0, 50.0, rng)])
+    events, _ = run(vad, x)
+
+    assert [event for _, event in events] == [VAD_EVENT_SPEECH_START, VAD_EVENT_SPEECH_END]
+    assert 1000 <= events[0][0] < 1100
+    assert events[1][0] >= 9000
@@ -0,0 +1,110 @@
+import collections
+from typing import Optional
+
+import numpy as np
+
+VAD_EVENT_SPEECH_START = 'speech_start'
+VAD_EVENT_SPEECH_END = 'speech_end'
+
+
+class EnergyVad:
+    """
+    Energy and zero-crossing rate voice activity detector for one stream.
+
+    A frame is voiced when its RMS is well above the tracked noise floor and its
+    zero-crossing rate is below that of hiss-like noise. Speech starts after
+    `onset_ms` of consecutive voiced frames and ends after `hangover_ms` of
+    unvoiced ones, so word gaps and trailing consonants stay inside the speech
+    segment.
+
+    The noise floor follows unvoiced frames, and is raised to the minimum RMS of the
+    last `floor_window_ms` of all frames when that is higher. Speech has pauses between
+    words that pull the minimum down to the noise, steady noise loud enough to pass as
+    voiced does not, so the gate closes about one window after such noise starts.
+    """
+
+    def __init__(self, threshold_ratio: float = 3.0, min_rms: float = 100.0, max_zcr: float = 0.35,
+                 onset_ms: int = 20, hangover_ms: int = 300, floor_alpha: float = 0.95,
+                 floor_window_ms: int = 2000, floor_subwindows: int = 8):
+        self.threshold_ratio = threshold_ratio
+        self.min_rms = min_rms
+        self.max_zcr = max_zcr
+        self.onset_ms = onset_ms
+        self.hangover_ms = hangover_ms
+        self.floor_alpha = floor_alpha
+        self.subwindow_ms = floor_window_ms / floor_subwindows
+
+        self.noise_floor = min_rms / threshold_ratio
+        # minimum RMS of each completed subwindow, and of the one being filled
+        self.subwindow_minima = collections.deque(maxlen=floor_subwindows)
+        self.subwindow_min = None
+        self.subwindow_elapsed_ms = 0
+        self.in_speech = False
+        self.voiced_ms = 0
+        self.unvoiced_ms = 0
+
+    @property
+    def active(self) -> bool:
+        """
+        Whether the last frame needs full processing: inside a speech segment, or a voiced frame of a possible onset.
+        """
+        return self.in_speech or self.voiced_ms > 0
+
+    def is_voiced(self, samples: np.ndarray, duration_ms: int) -> bool:
+        if len(samples) == 0:
+            return False
+        x = samples.astype(np.float32)
+        rms = float(np.sqrt(np.mean(x * x)))
+        zcr = float(np.count_nonzero(np.signbit(x[1:]) != np.signbit(x[:-1]))) / max(len(x) - 1, 1)
+
+        window_min = self.__track_minimum(rms, duration_ms)
+        if window_min is not None and window_min > self.noise_floor:
+            self.noise_floor = window_min
+
+        voiced = rms > max(self.min_rms, self.noise_floor * self.threshold_ratio) and zcr < self.max_zcr
+        if not voiced:
+            self.noise_floor = self.floor_alpha * self.noise_floor + (1 - self.floor_alpha) * rms
+        return voiced
+
+    def __track_minimum(self, rms: float, duration_ms: int) -> Optional[float]:
+        """
+        Add a frame to the sliding minimum.
+
+        Returns:
+            The minimum RMS over the last window, None until a full window was seen
+        """
+        self.subwindow_min = rms if self.subwindow_min is None else min(self.subwindow_min, rms)
+        self.subwindow_elapsed_ms += duration_ms
+        if self.subwindow_elapsed_ms >= self.subwindow_ms:
+            self.subwindow_minima.append(self.subwindow_min)
+            self.subwindow_min = None
+            self.subwindow_elapsed_ms = 0
+        if len(self.subwindow_minima) < self.subwindow_minima.maxlen:
+            return None
+        window_min = min(self.subwindow_minima)
+        return window_min if self.subwindow_min is None else min(window_min, self.subwindow_min)
+
+    def process(self, samples: np.ndarray, duration_ms: int) -> Optional[str]:
+        """
+        Update the detector with the next frame.
+
+        Args:
+            samples: int16 samples of the frame
+            duration_ms: Duration of the frame in milliseconds
+
+        Returns:
+            VAD_EVENT_SPEECH_START or VAD_EVENT_SPEECH_END when the state changes, None otherwise
+        """
+        if self.is_voiced(samples, duration_ms):
+            self.voiced_ms += duration_ms
+            self.unvoiced_ms = 0
+            if not self.in_speech and self.voiced_ms >= self.onset_ms:
+                self.in_speech = True
+                return VAD_EVENT_SPEECH_START
+        else:
+            self.unvoiced_ms += duration_ms
+            self.voiced_ms = 0
+            if self.in_speech and self.unvoiced_ms >= self.hangover_ms:
+                self.in_speech = False
+                return VAD_EVENT_SPEECH_END
+        return None
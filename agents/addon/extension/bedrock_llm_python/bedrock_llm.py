@@ -1,23 +1,21 @@
-import boto3
+from .aws_client import AwsClientConfig, get_aws_client, warm_up_client
 from .log import logger
 from .bedrock_llm_config import BedrockLLMConfig
 from .calculator import perform_calculation
 
+# no such model, the warm-up request is answered with a validation error without running inference
+WARM_UP_MODEL_ID = 'warm-up-probe'
+
 class BedrockLLM:
     client = None
-    def __init__(self, config: BedrockLLMConfig):
+    def __init__(self, config: BedrockLLMConfig, client_config: AwsClientConfig = None):
         self.config = config
 
         if config.access_key and config.secret_key:
             logger.info(f"BedrockLLM initialized with access key: {config.access_key}")
-
-            self.client = boto3.client(service_name='bedrock-runtime', 
-                                    region_name=config.region,
-                                    aws_access_key_id=config.access_key,
-                                    aws_secret_access_key=config.secret_key)
         else:
             logger.info(f"BedrockLLM initialized without access key, using default credentials provider chain.")
-            self.client = boto3.client(service_name='bedrock-runtime', region_name=config.region)
+        self.client = get_aws_client('bedrock-runtime', config.region, config.access_key, config.secret_key, client_config)
         
         # 定義計算器工具
         self.calculator_tool_config = {
@@ -53,6 +51,11 @@ class BedrockLLM:
             }
         }
 
+    def warm_up(self):
+        """opens a connection to the Bedrock runtime in the background, no model is invoked"""
+        warm_up_client(self.client, lambda: self.client.converse(
+            modelId=WARM_UP_MODEL_ID, messages=[{"role": "user", "content": [{"text": "hi"}]}]))
+
     def get_converse_resp(self, messages, stream=True, **override_params):
         bedrock_req_params = {
             "modelId": self.config.model,
@@ -11,6 +11,7 @@ from rte import (
     MetadataInfo,
 )
 from .bedrock_llm import BedrockLLM, BedrockLLMConfig
+from .aws_client import read_client_config
 from .data_parser import *
 from .log import logger
 from .property import *
@@ -81,10 +82,13 @@ class BedrockLLMExtension(Extension):
             )
 
         bedrock_llm_config.validate()
+        client_config = read_client_config(rte)
 
         # Create bedrockLLM instance
         try:
-            self.bedrock_llm = BedrockLLM(bedrock_llm_config)
+            self.bedrock_llm = BedrockLLM(bedrock_llm_config, client_config)
+            if client_config.warm_up:
+                self.bedrock_llm.warm_up()
             logger.info(
                 f"newBedrockLLM succeed with max_tokens: {bedrock_llm_config.max_tokens}, model: {bedrock_llm_config.model}"
             )
@@ -17,24 +17,46 @@ from rte import (
     CmdResult,
     MetadataInfo,
 )
-from typing import List, Any
+from typing import List, Any, Optional
 import dashscope
 import queue
 import threading
 from datetime import datetime
 from dashscope.audio.tts_v2 import ResultCallback, SpeechSynthesizer, AudioFormat
 from .log import logger
+from .metrics import Metrics
+from .pcm_frame_slicer import PcmFrameSlicer, fill_frame
+from .pcm_pacer import PcmPacer, DEFAULT_JITTER_BUFFER_MS
+
+
+def get_frame(data: bytes, sample_rate: int) -> PcmFrame:
+    frame_size = int(sample_rate * 1 * 2 / 100)
+    f = PcmFrame.create("pcm_frame")
+    f.set_sample_rate(sample_rate)
+    f.set_bytes_per_sample(2)
+    f.set_number_of_channels(1)
+    # f.set_timestamp = 0
+    f.set_data_fmt(PcmFrameDataFmt.INTERLEAVE)
+    f.set_samples_per_channel(sample_rate // 100)
+    f.alloc_buf(frame_size)
+    buff = f.lock_buf()
+    fill_frame(buff, data)
+    f.unlock_buf(buff)
+    return f
 
 
 class CosyTTSCallback(ResultCallback):
     _player = None
     _stream = None
 
-    def __init__(self, rte: RteEnv, sample_rate: int):
+    def __init__(self, rte: RteEnv, sample_rate: int, pacer: Optional[PcmPacer] = None):
         super().__init__()
         self.rte = rte
         self.sample_rate = sample_rate
+        self.pacer = pacer
         self.frame_size = int(self.sample_rate * 1 * 2 / 100)
+        self.slicer = PcmFrameSlicer(self.frame_size)
+        self.generation = 0  # flush generation of the sentence being synthesized
         self.canceled = False
         self.closed = False
 
@@ -43,6 +65,15 @@ class CosyTTSCallback(ResultCallback):
 
     def on_complete(self):
         logger.info("speech synthesis task complete successfully.")
+        if self.pacer or self.canceled:
+            return
+        # audio of a sentence does not have to end on a frame boundary
+        try:
+            frame = self.slicer.read(partial=True)
+            if frame is not None:
+                self.rte.send_pcm_frame(self.get_frame(frame))
+        except Exception as e:
+            logger.exception(e)
 
     def on_error(self, message: str):
         logger.info(f"speech synthesis task failed, {message}")
@@ -56,20 +87,7 @@ class CosyTTSCallback(ResultCallback):
         # logger.info(f"recv speech synthsis message {message}")
 
     def get_frame(self, data: bytes) -> PcmFrame:
-        f = PcmFrame.create("pcm_frame")
-        f.set_sample_rate(self.sample_rate)
-        f.set_bytes_per_sample(2)
-        f.set_number_of_channels(1)
-        # f.set_timestamp = 0
-        f.set_data_fmt(PcmFrameDataFmt.INTERLEAVE)
-        f.set_samples_per_channel(self.sample_rate // 100)
-        f.alloc_buf(self.frame_size)
-        buff = f.lock_buf()
-        if len(data) < self.frame_size:
-            buff[:] = bytes(self.frame_size)  # fill with 0
-        buff[: len(data)] = data
-        f.unlock_buf(buff)
-        return f
+        return get_frame(data, self.sample_rate)
 
     def cancel(self) -> None:
         self.canceled = True
@@ -79,22 +97,15 @@ class CosyTTSCallback(ResultCallback):
             return
 
         # logger.info("audio result length: %d, %d", len(data), self.frame_size)
+        if self.pacer:
+            self.pacer.write(data, self.generation)
+            return
+
         try:
-            chunk = int(len(data) / self.frame_size)
-            offset = 0
-            for i in range(0, chunk):
+            for frame in self.slicer.slice(data):
                 if self.canceled:
                     return
-                f = self.get_frame(data[offset : offset + self.frame_size])
-                self.rte.send_pcm_frame(f)
-                offset += self.frame_size
-
-            if self.canceled:
-                return
-            if offset < len(data):
-                size = len(data) - offset
-                f = self.get_frame(data[offset : offset + size])
-                self.rte.send_pcm_frame(f)
+                self.rte.send_pcm_frame(self.get_frame(frame))
         except Exception as e:
             logger.exception(e)
 
@@ -116,6 +127,11 @@ class CosyTTSExtension(Extension):
         self.queue = queue.Queue()
         self.mutex = threading.Lock()
 
+        self.metrics = Metrics("cosy_tts")
+        # bumped on every flush, sentences queued before it are dropped, the one being synthesized is canceled
+        self.flush_generation = 0
+        self.pacer = None
+
     def on_start(self, rte: RteEnv) -> None:
         logger.info("CosyTTSExtension on_start")
         self.api_key = rte.get_property_string("api_key")
@@ -142,6 +158,7 @@ class CosyTTSExtension(Extension):
             exit()
 
         self.format = f
+        self.pacer = self.create_pacer(rte)
 
         self.thread = threading.Thread(target=self.async_handle, args=[rte])
         self.thread.start()
@@ -153,12 +170,35 @@ class CosyTTSExtension(Extension):
         self.stopped = True
         self.queue.put(None)
         self.flush()
+        if self.pacer:
+            self.pacer.close()
         self.thread.join()
         rte.on_stop_done()
 
     def need_interrupt(self, ts: datetime.time) -> bool:
         return self.outdateTs > ts and (self.outdateTs - ts).total_seconds() > 1
 
+    def create_pacer(self, rte: RteEnv) -> Optional[PcmPacer]:
+        pace_audio = False
+        try:
+            pace_audio = rte.get_property_bool("pace_audio")
+        except Exception as e:
+            logger.info(f"get pace_audio failed, err: {e}. Using default value: {pace_audio}")
+        if not pace_audio:
+            return None
+
+        jitter_buffer_ms = DEFAULT_JITTER_BUFFER_MS
+        try:
+            value = rte.get_property_int("jitter_buffer_ms")
+            if value >= 0:
+                jitter_buffer_ms = value
+        except Exception as e:
+            logger.info(f"get jitter_buffer_ms failed, err: {e}. Using default value: {jitter_buffer_ms}")
+        sample_rate = self.sample_rate
+        frame_size = int(sample_rate * 1 * 2 / 100)
+        return PcmPacer(rte, lambda data: get_frame(data, sample_rate), frame_size,
+                        jitter_buffer_ms=jitter_buffer_ms, metrics=self.metrics)
+
     def async_handle(self, rte: RteEnv):
         try:
             tts = None
@@ -168,7 +208,7 @@ class CosyTTSExtension(Extension):
                     value = self.queue.get()
                     if value is None:
                         break
-                    inputText, ts = value
+                    inputText, ts, generation = value
                     if len(inputText) == 0:
                         logger.warning("empty input for interrupt")
                         if tts is not None:
@@ -182,7 +222,7 @@ class CosyTTSExtension(Extension):
                         callback = None
                         continue
 
-                    if self.need_interrupt(ts):
+                    if generation != self.flush_generation or self.need_interrupt(ts):
                         continue
 
                     if callback is not None and callback.closed is True:
@@ -190,7 +230,7 @@ class CosyTTSExtension(Extension):
 
                     if tts is None:
                         logger.info("creating tts")
-                        callback = CosyTTSCallback(rte, self.sample_rate)
+                        callback = CosyTTSCallback(rte, self.sample_rate, self.pacer)
                         tts = SpeechSynthesizer(
                             model=self.model,
                             voice=self.voice,
@@ -198,9 +238,19 @@ class CosyTTSExtension(Extension):
                             callback=callback,
                         )
 
+                    callback.generation = generation
+                    self.callback = callback
+                    if generation != self.flush_generation:
+                        # flushed since the check above, flush may have missed this callback
+                        callback.cancel()
+                        continue
+
                     logger.info("on message [%s]", inputText)
                     tts.streaming_call(inputText)
                     tts.streaming_complete()
+                    if self.pacer:
+                        self.pacer.end(generation)
+                    self.metrics.maybe_report()
                 except Exception as e:
                     logger.exception(e)
                     logger.exception(traceback.format_exc())
@@ -210,9 +260,14 @@ class CosyTTSExtension(Extension):
 
     def flush(self):
         logger.info("CosyTTSExtension flush")
+        self.flush_generation += 1
+        # the sentence being synthesized stops writing now, rather than once synthesis completed
+        callback = self.callback
+        if callback is not None:
+            callback.cancel()
         while not self.queue.empty():
             self.queue.get()
-        self.queue.put(("", datetime.now()))
+        self.queue.put(("", datetime.now(), self.flush_generation))
 
     def on_data(self, rte: RteEnv, data: Data) -> None:
         logger.info("CosyTTSExtension on_data")
@@ -224,7 +279,8 @@ class CosyTTSExtension(Extension):
         is_end = data.get_property_bool("end_of_segment")
 
         logger.info("on data %s %d", inputText, is_end)
-        self.queue.put((inputText, datetime.now()))
+        # tagged on the rte thread, which also runs flush, so a sentence never carries a newer generation
+        self.queue.put((inputText, datetime.now(), self.flush_generation))
 
     def on_cmd(self, rte: RteEnv, cmd: Cmd) -> None:
         logger.info("CosyTTSExtension on_cmd")
@@ -235,6 +291,9 @@ class CosyTTSExtension(Extension):
         if cmdName == "flush":
             self.outdateTs = datetime.now()
             self.flush()
+            if self.pacer:
+                # a sentence still being received has no way into the pacer any more
+                self.pacer.clear(self.flush_generation)
             cmd_out = Cmd.create("flush")
             rte.send_cmd(
                 cmd_out, lambda rte, result: print("DefaultExtension send_cmd done")
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark of cutting synthesized audio into frames, before and after PcmFrameSlicer.
+pcm_frame_slicer.py is the same in the Cosy, ElevenLabs and SageMaker extensions, the old code
+is read_pcm_stream of this extension and on_data of Cosy.
+
+Run from agents/addon/extension, with the rte python binding importable:
+
+    python -m elevenlabs_tts_python.benchmark --chunk-bytes 320 3584 4096 65536 0
+"""
+import argparse
+import json
+import timeit
+from typing import Callable, Iterator, List
+
+from .pcm import Pcm, PcmConfig
+from .pcm_frame_slicer import fill_frame
+
+
+def best_ms(fn: Callable[[], None], number: int, repeat: int = 5) -> float:
+    """best time of one call in milliseconds over `repeat` runs of `number` calls"""
+    return round(min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e3, 3)
+
+
+def fill_frame_old(buf: bytearray, data) -> None:
+    """the frame copy before fill_frame"""
+    if len(data) < len(buf):
+        buf[:] = bytes(len(buf))
+    buf[:len(data)] = data
+
+
+def read_pcm_stream_old(stream: Iterator[bytes], chunk_size: int) -> Iterator[bytes]:
+    """read_pcm_stream before PcmFrameSlicer"""
+    chunk = b""
+    for data in stream:
+        chunk += data
+        while len(chunk) >= chunk_size:
+            yield chunk[:chunk_size]
+            chunk = chunk[chunk_size:]
+
+    if chunk:
+        yield chunk
+
+
+def on_data_cosy_old(data: bytes, frame_size: int) -> Iterator[bytes]:
+    """Cosy's on_data before PcmFrameSlicer, it sent the tail of every chunk as a padded frame"""
+    chunk = int(len(data) / frame_size)
+    offset = 0
+    for i in range(0, chunk):
+        yield data[offset: offset + frame_size]
+        offset += frame_size
+    if offset < len(data):
+        yield data[offset:]
+
+
+def bench(chunk_bytes: int, seconds: int, number: int) -> dict:
+    config = PcmConfig()
+    pcm = Pcm(config)
+    frame_size = pcm.get_pcm_frame_size()
+    audio = bytes(range(256)) * (config.sample_rate * config.bytes_per_sample * seconds // 256)
+    chunk_bytes = chunk_bytes or len(audio)
+    chunks = [audio[i:i + chunk_bytes] for i in range(0, len(audio), chunk_bytes)]
+
+    old = [bytes(f) for f in read_pcm_stream_old(chunks, frame_size)]
+    new = [bytes(f) for f in pcm.read_pcm_stream(chunks, frame_size)]
+    if old != new:
+        raise AssertionError(f"read_pcm_stream returns other frames for {chunk_bytes} byte chunks")
+
+    frame = bytearray(frame_size)
+
+    def elevenlabs_old():
+        for f in read_pcm_stream_old(chunks, frame_size):
+            fill_frame_old(frame, f)
+
+    def cosy_old():
+        for data in chunks:
+            for f in on_data_cosy_old(data, frame_size):
+                fill_frame_old(frame, f)
+
+    def slicer():
+        for f in pcm.read_pcm_stream(chunks, frame_size):
+            fill_frame(frame, f)
+
+    return {
+        "seconds": seconds,
+        "chunk_bytes": chunk_bytes,
+        "read_pcm_stream_old_ms": best_ms(elevenlabs_old, number),
+        "cosy_on_data_old_ms": best_ms(cosy_old, number),
+        "slicer_ms": best_ms(slicer, number),
+    }
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--chunk-bytes", type=int, nargs="+", default=[320, 3584, 4096, 65536, 0],
+                        help="size of the chunks the service delivers, 0 for the whole audio in one chunk")
+    parser.add_argument("--seconds", type=int, default=30, help="audio per run, 16 kHz mono")
+    parser.add_argument("--number", type=int, default=5, help="runs per timing")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_args()
+    print(json.dumps([bench(chunk_bytes, args.seconds, args.number) for chunk_bytes in args.chunk_bytes], indent=2))
@@ -20,6 +20,8 @@ from rte import (
 )
 from .elevenlabs_tts import default_elevenlabs_tts_config, ElevenlabsTTS
 from .pcm import PcmConfig, Pcm
+from .pcm_pacer import PcmPacer, DEFAULT_JITTER_BUFFER_MS
+from .metrics import Metrics
 from .log import logger
 
 CMD_IN_FLUSH = "flush"
@@ -35,6 +37,8 @@ PROPERTY_SIMILARITY_BOOST = "similarity_boost"  # Optional
 PROPERTY_SPEAKER_BOOST = "speaker_boost"  # Optional
 PROPERTY_STABILITY = "stability"  # Optional
 PROPERTY_STYLE = "style"  # Optional
+PROPERTY_PACE_AUDIO = "pace_audio"  # Optional
+PROPERTY_JITTER_BUFFER_MS = "jitter_buffer_ms"  # Optional
 
 
 class Message:
@@ -51,6 +55,8 @@ class ElevenlabsTTSExtension(Extension):
         self.outdate_ts = 0
         self.pcm = None
         self.pcm_frame_size = 0
+        self.pacer = None
+        self.metrics = Metrics("elevenlabs_tts")
         self.text_queue = queue.Queue(maxsize=1024)
 
         # prepare configuration
@@ -112,12 +118,32 @@ class ElevenlabsTTSExtension(Extension):
         self.pcm = Pcm(PcmConfig())
         self.pcm_frame_size = self.pcm.get_pcm_frame_size()
 
+        pace_audio = False
+        try:
+            pace_audio = rte.get_property_bool(PROPERTY_PACE_AUDIO)
+        except Exception as e:
+            logger.warning(f"on_start get_property_bool {PROPERTY_PACE_AUDIO} error: {e}")
+
+        jitter_buffer_ms = DEFAULT_JITTER_BUFFER_MS
+        try:
+            value = rte.get_property_int(PROPERTY_JITTER_BUFFER_MS)
+            if value >= 0:
+                jitter_buffer_ms = value
+        except Exception as e:
+            logger.warning(f"on_start get_property_int {PROPERTY_JITTER_BUFFER_MS} error: {e}")
+
+        if pace_audio:
+            self.pacer = PcmPacer(rte, self.pcm.get_pcm_frame, self.pcm_frame_size,
+                                  jitter_buffer_ms=jitter_buffer_ms, metrics=self.metrics)
+
         threading.Thread(target=self.process_text_queue, args=(rte,)).start()
 
         rte.on_start_done()
 
     def on_stop(self, rte: RteEnv) -> None:
         logger.info("on_stop")
+        if self.pacer:
+            self.pacer.close()
         rte.on_stop_done()
 
     def on_cmd(self, rte: RteEnv, cmd: Cmd) -> None:
@@ -133,8 +159,11 @@ class ElevenlabsTTSExtension(Extension):
 
         logger.info(f"on_cmd [{cmd_name}]")
 
-        if cmd_name is CMD_IN_FLUSH:
+        if cmd_name == CMD_IN_FLUSH:
             self.outdate_ts = int(time.time() * 1000000)
+            if self.pacer:
+                # a text still being received has no way into the pacer any more
+                self.pacer.clear(self.outdate_ts)
 
             # send out
             out_cmd = Cmd.create(CMD_OUT_FLUSH)
@@ -180,10 +209,7 @@ class ElevenlabsTTSExtension(Extension):
                 continue
 
             start_time = time.time()
-            buf = self.pcm.new_buf()
             first_frame_latency = 0
-            n = 0
-            pcm_frame_read = 0
             read_bytes = 0
             sent_frames = 0
 
@@ -198,17 +224,11 @@ class ElevenlabsTTSExtension(Extension):
                     logger.info("read pcm stream EOF")
                     break
 
-                n = len(chunk)
-                read_bytes += n
-                pcm_frame_read += n
-
-                if pcm_frame_read != self.pcm.get_pcm_frame_size():
-                    logger.debug(f"the number of bytes read is [{pcm_frame_read}] inconsistent with pcm frame size")
-                    continue
-
-                self.pcm.send(rte, buf)
-                buf = self.pcm.new_buf()
-                pcm_frame_read = 0
+                read_bytes += len(chunk)
+                if self.pacer:
+                    self.pacer.write(chunk, msg.received_ts)
+                else:
+                    self.pcm.send(rte, chunk)
                 sent_frames += 1
 
                 if first_frame_latency == 0:
@@ -217,12 +237,10 @@ class ElevenlabsTTSExtension(Extension):
 
                 logger.debug(f"sending pcm data, text: [{msg.text}]")
 
-            if pcm_frame_read > 0:
-                self.pcm.send(rte, buf)
-                sent_frames += 1
-                logger.info(f"sending pcm remain data, text: [{msg.text}], pcm_frame_read: {pcm_frame_read}")
+            if self.pacer:
+                self.pacer.end(msg.received_ts)
 
             finish_latency = int((time.time() - start_time) * 1000)
-            logger.info(f"send pcm data finished, text: [{msg.text}], received_ts: {msg.received_ts}, read_bytes: {read_bytes}, sent_frames: {sent_frames},
-                first_frame_latency: {first_frame_latency}ms, finish_latency: {finish_latency}ms"
-            )
+            logger.info(f"send pcm data finished, text: [{msg.text}], received_ts: {msg.received_ts}, read_bytes: {read_bytes}, sent_frames: {sent_frames}, "
+                        f"first_frame_latency: {first_frame_latency}ms, finish_latency: {finish_latency}ms")
+            self.metrics.maybe_report()
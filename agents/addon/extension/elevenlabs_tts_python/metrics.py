@@ -0,0 +1,65 @@
+import threading
+import time
+
+from .log import logger
+
+
+class Metrics:
+    """
+    Lightweight in-process metrics: counters, gauges and value summaries.
+
+    Summaries (count/avg/max) are reset on every report, counters and gauges are kept.
+    Reports are written to the extension log at most once per report interval.
+    """
+
+    def __init__(self, name: str, report_interval_s: float = 10.0):
+        self.name = name
+        self.report_interval_s = report_interval_s
+
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+        self._last_report = time.monotonic()
+
+    def incr(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def gauge(self, key: str, value) -> None:
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, key: str, value: float) -> None:
+        with self._lock:
+            count, total, peak = self._summaries.get(key, (0, 0.0, value))
+            self._summaries[key] = (count + 1, total + value, max(peak, value))
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def snapshot(self, reset_summaries: bool = False) -> dict:
+        """
+        Get a copy of all metrics, summaries are flattened into <key>_count/_avg/_max.
+        """
+        with self._lock:
+            result = dict(self._counters)
+            result.update(self._gauges)
+            for key, (count, total, peak) in self._summaries.items():
+                result[f"{key}_count"] = count
+                result[f"{key}_avg"] = round(total / count, 3) if count else 0
+                result[f"{key}_max"] = round(peak, 3)
+            if reset_summaries:
+                self._summaries.clear()
+        return result
+
+    def maybe_report(self) -> None:
+        now = time.monotonic()
+        if now - self._last_report < self.report_interval_s:
+            return
+        self._last_report = now
+        self.report()
+
+    def report(self) -> None:
+        logger.info(f"{self.name} metrics: {self.snapshot(reset_summaries=True)}")
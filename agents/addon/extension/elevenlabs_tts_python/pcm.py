@@ -9,6 +9,7 @@
 import logging
 from typing import Iterator
 from rte import PcmFrame, RteEnv, PcmFrameDataFmt
+from .pcm_frame_slicer import PcmFrameSlicer, fill_frame
 
 
 class Pcm:
@@ -19,15 +20,15 @@ class Pcm:
         frame = PcmFrame.create(self.config.name)
         frame.set_bytes_per_sample(self.config.bytes_per_sample)
         frame.set_sample_rate(self.config.sample_rate)
-        frame.set_number_of_channels(self.config.num_channels)
+        frame.set_number_of_channels(self.config.channel)
         frame.set_timestamp(self.config.timestamp)
         frame.set_data_fmt(PcmFrameDataFmt.INTERLEAVE)
         frame.set_samples_per_channel(self.config.samples_per_channel // self.config.channel)
 
         frame.alloc_buf(self.get_pcm_frame_size())
         frame_buf = frame.lock_buf()
-        # copy data
-        frame_buf[:] = buf
+        # copy data, the last frame of a stream is padded with silence
+        fill_frame(frame_buf, buf)
         frame.unlock_buf(frame_buf)
 
         return frame
@@ -38,15 +39,14 @@ class Pcm:
     def new_buf(self) -> bytearray:
         return bytearray(self.get_pcm_frame_size())
 
-    def read_pcm_stream(self, stream: Iterator[bytes], chunk_size: int) -> Iterator[bytes]:
-        chunk = b""
+    def read_pcm_stream(self, stream: Iterator[bytes], chunk_size: int) -> Iterator[memoryview]:
+        """frames of chunk_size, each only valid until the next one is read"""
+        slicer = PcmFrameSlicer(chunk_size)
         for data in stream:
-            chunk += data
-            while len(chunk) >= chunk_size:
-                yield chunk[:chunk_size]
-                chunk = chunk[chunk_size:]
+            yield from slicer.slice(data)
 
-        if chunk:
+        chunk = slicer.read(partial=True)
+        if chunk is not None:
             yield chunk
 
     def send(self, rte: RteEnv, buf: memoryview) -> None:
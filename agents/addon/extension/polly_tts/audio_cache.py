@@ -0,0 +1,175 @@
+import collections
+import hashlib
+import mmap
+import os
+import threading
+from typing import Optional, Tuple, Union
+
+from .log import logger
+
+CACHE_FILE_SUFFIX = '.pcm'
+
+TIER_MEMORY = 'memory'
+TIER_DISK = 'disk'
+
+AudioBuffer = Union[bytes, memoryview]
+
+
+def make_cache_key(voice: str, engine: str, lang_code: Optional[str], sample_rate: Union[str, int], text: str) -> str:
+    """digest of everything the synthesized audio depends on, the text with its whitespace normalized"""
+    normalized = " ".join(text.split())
+    raw = "\x00".join([voice, engine, lang_code or "", str(sample_rate), normalized])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    Content-addressed cache of synthesized raw PCM, shared by the extensions of a process.
+
+    Recent audio is kept in a memory LRU bounded by `memory_bytes`. With `disk_dir`,
+    audio is also written there as one raw PCM file per key, bounded by `disk_bytes`,
+    so it survives restarts and is shared between processes. Disk hits are served from
+    a read-only memory map of the file, straight from the page cache.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: Optional[str] = None, disk_bytes: int = 0):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()  # key -> bytes, least recently used first
+        self._memory_size = 0
+        self._disk = collections.OrderedDict()    # key -> file size, least recently used first
+        self._disk_size = 0
+        self.evicted = 0
+
+        if disk_dir:
+            self.__load_disk_index()
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + CACHE_FILE_SUFFIX)
+
+    def __load_disk_index(self) -> None:
+        os.makedirs(self.disk_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(CACHE_FILE_SUFFIX):
+                continue
+            st = os.stat(os.path.join(self.disk_dir, name))
+            entries.append((st.st_mtime, name[:-len(CACHE_FILE_SUFFIX)], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        logger.info(f"audio cache: {len(self._disk)} files, {self._disk_size} bytes in {self.disk_dir}")
+        self.__evict_disk()
+
+    @property
+    def memory_size(self) -> int:
+        return self._memory_size
+
+    @property
+    def disk_size(self) -> int:
+        return self._disk_size
+
+    def get(self, key: str) -> Tuple[Optional[AudioBuffer], Optional[str]]:
+        """
+        Returns:
+            (audio, TIER_MEMORY or TIER_DISK), or (None, None) on a miss
+        """
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                return audio, TIER_MEMORY
+
+            on_disk = key in self._disk
+            if on_disk:
+                self._disk.move_to_end(key)
+
+        if on_disk:
+            audio = self.__map(key)
+            if audio is not None:
+                return audio, TIER_DISK
+
+        return None, None
+
+    def __map(self, key: str) -> Optional[memoryview]:
+        try:
+            with open(self.__path(key), "rb") as f:
+                # the mapping stays valid after the file is closed, or even removed
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError) as e:
+            logger.warning(f"audio cache: cannot map {key}: {e}")
+            with self._lock:
+                size = self._disk.pop(key, None)
+                if size is not None:
+                    self._disk_size -= size
+            return None
+
+    def put(self, key: str, audio: bytes) -> None:
+        if not audio:
+            return
+
+        with self._lock:
+            if len(audio) <= self.memory_bytes and key not in self._memory:
+                self._memory[key] = audio
+                self._memory_size += len(audio)
+                while self._memory_size > self.memory_bytes:
+                    _, evicted = self._memory.popitem(last=False)
+                    self._memory_size -= len(evicted)
+                    self.evicted += 1
+            write = bool(self.disk_dir) and len(audio) <= self.disk_bytes and key not in self._disk
+
+        if write:
+            self.__write(key, audio)
+
+    def __write(self, key: str, audio: bytes) -> None:
+        path = self.__path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(audio)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"audio cache: cannot write {path}: {e}")
+            return
+
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = len(audio)
+                self._disk_size += len(audio)
+                self.__evict_disk()
+
+    def __evict_disk(self) -> None:
+        while self._disk_size > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.remove(self.__path(key))
+            except OSError:
+                pass
+            self.evicted += 1
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_audio_cache(memory_bytes: int, disk_dir: Optional[str] = None, disk_bytes: int = 0) -> AudioCache:
+    """
+    Get the process-wide audio cache of a disk directory, creating it on first use.
+
+    There is one cache per directory, and one memory-only cache, since two indexes of the same
+    files would evict each other's entries. The sizes of the first caller apply, a caller asking
+    for other sizes gets the existing cache and a warning.
+    """
+    with _caches_lock:
+        cache = _caches.get(disk_dir)
+        if cache is None:
+            cache = AudioCache(memory_bytes, disk_dir, disk_bytes)
+            _caches[disk_dir] = cache
+        elif cache.memory_bytes != memory_bytes or (disk_dir and cache.disk_bytes != disk_bytes):
+            logger.warning(f"audio cache {disk_dir or '(memory)'} already exists with memory_bytes: {cache.memory_bytes}, "
+                           f"disk_bytes: {cache.disk_bytes}, ignoring memory_bytes: {memory_bytes}, disk_bytes: {disk_bytes}")
+        return cache
@@ -10,14 +10,23 @@ from rte import (
     MetadataInfo,
 )
 
+import collections
 import queue
 import threading
+import time
 from datetime import datetime
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import closing
+from typing import Optional
 
 from .log import logger
 from .polly_wrapper import PollyWrapper, PollyConfig
+from .aws_client import read_client_config
+from .audio_cache import get_audio_cache, make_cache_key
+from .metrics import Metrics
+from .pcm_frame_slicer import fill_frame
+from .pcm_pacer import PcmPacer, DEFAULT_JITTER_BUFFER_MS
 
 PROPERTY_REGION = "region"  # Optional
 PROPERTY_ACCESS_KEY = "access_key"  # Optional
@@ -26,6 +35,27 @@ PROPERTY_ENGINE = 'engine'          # Optional
 PROPERTY_VOICE = 'voice'           # Optional
 PROPERTY_SAMPLE_RATE = 'sample_rate'  # Optional
 PROPERTY_LANG_CODE = 'lang_code'    # Optional
+PROPERTY_AUDIO_CACHE_MB = 'audio_cache_mb'  # Optional
+PROPERTY_AUDIO_CACHE_DIR = 'audio_cache_dir'  # Optional
+PROPERTY_AUDIO_CACHE_DISK_MB = 'audio_cache_disk_mb'  # Optional
+PROPERTY_AUDIO_CACHE_MAX_CHARS = 'audio_cache_max_chars'  # Optional
+PROPERTY_PREFETCH_SENTENCES = 'prefetch_sentences'  # Optional
+PROPERTY_PACE_AUDIO = 'pace_audio'  # Optional
+PROPERTY_JITTER_BUFFER_MS = 'jitter_buffer_ms'  # Optional
+
+DEFAULT_AUDIO_CACHE_MB = 32
+DEFAULT_AUDIO_CACHE_DISK_MB = 256
+DEFAULT_AUDIO_CACHE_MAX_CHARS = 200 # only short texts repeat often enough to be worth caching
+DEFAULT_PREFETCH_SENTENCES = 2
+
+
+class PreparedSpeech:
+    """the audio of a sentence, either from the cache or as the stream of a synthesize request"""
+
+    def __init__(self, cache_key: Optional[str], audio=None, audio_stream=None):
+        self.cache_key = cache_key
+        self.audio = audio
+        self.audio_stream = audio_stream
 
 
 class PollyTTSExtension(Extension):
@@ -41,6 +71,15 @@ class PollyTTSExtension(Extension):
         self.bytes_per_sample = 2
         self.number_of_channels = 1
 
+        self.metrics = Metrics("polly_tts")
+        self.audio_cache = None
+        self.audio_cache_max_chars = DEFAULT_AUDIO_CACHE_MAX_CHARS
+        self.prefetch_sentences = DEFAULT_PREFETCH_SENTENCES
+        self.prefetch_pool = None
+        # bumped on every flush, sentences queued before it are dropped, the one being sent stops
+        self.flush_generation = 0
+        self.pacer = None
+
     def on_start(self, rte: RteEnv) -> None:
         logger.info("PollyTTSExtension on_start")
 
@@ -58,9 +97,47 @@ class PollyTTSExtension(Extension):
 
         polly_config.validate()
 
-        self.polly = PollyWrapper(polly_config)
+        cache_settings = {
+            PROPERTY_AUDIO_CACHE_MB: DEFAULT_AUDIO_CACHE_MB,
+            PROPERTY_AUDIO_CACHE_DISK_MB: DEFAULT_AUDIO_CACHE_DISK_MB,
+            PROPERTY_AUDIO_CACHE_MAX_CHARS: DEFAULT_AUDIO_CACHE_MAX_CHARS,
+        }
+        for optional_param in cache_settings:
+            try:
+                value = rte.get_property_int(optional_param)
+                if value >= 0:
+                    cache_settings[optional_param] = value
+            except Exception as err:
+                logger.debug(f"GetProperty optional {optional_param} failed, err: {err}. Using default value: {cache_settings[optional_param]}")
+        cache_dir = None
+        try:
+            cache_dir = rte.get_property_string(PROPERTY_AUDIO_CACHE_DIR).strip() or None
+        except Exception as err:
+            logger.debug(f"GetProperty optional {PROPERTY_AUDIO_CACHE_DIR} failed, err: {err}. Disk cache disabled")
+
+        if cache_settings[PROPERTY_AUDIO_CACHE_MAX_CHARS] > 0 and (cache_settings[PROPERTY_AUDIO_CACHE_MB] > 0 or cache_dir):
+            self.audio_cache = get_audio_cache(cache_settings[PROPERTY_AUDIO_CACHE_MB] * 1024 * 1024, cache_dir,
+                                               cache_settings[PROPERTY_AUDIO_CACHE_DISK_MB] * 1024 * 1024)
+            self.audio_cache_max_chars = cache_settings[PROPERTY_AUDIO_CACHE_MAX_CHARS]
+
+        client_config = read_client_config(rte)
+        self.polly = PollyWrapper(polly_config, client_config)
+        if client_config.warm_up:
+            self.polly.warm_up()
         self.frame_size = int(int(polly_config.sample_rate) * self.number_of_channels * self.bytes_per_sample / 100)
 
+        try:
+            value = rte.get_property_int(PROPERTY_PREFETCH_SENTENCES)
+            if value >= 0:
+                self.prefetch_sentences = value
+        except Exception as err:
+            logger.debug(f"GetProperty optional {PROPERTY_PREFETCH_SENTENCES} failed, err: {err}. Using default value: {self.prefetch_sentences}")
+        # one request per sentence in flight: the head and the sentences prefetched after it
+        self.prefetch_pool = ThreadPoolExecutor(max_workers=self.prefetch_sentences + 1,
+                                                thread_name_prefix="polly_prefetch")
+
+        self.pacer = self.__create_pacer(rte)
+
         self.thread = threading.Thread(target=self.async_polly_handler, args=[rte])
         self.thread.start()
         rte.on_start_done()
@@ -71,12 +148,39 @@ class PollyTTSExtension(Extension):
         self.stopped = True
         self.queue.put(None)
         self.flush()
+        if self.pacer:
+            self.pacer.close()
         self.thread.join()
+        self.prefetch_pool.shutdown(wait=False)
         rte.on_stop_done()
 
     def need_interrupt(self, ts: datetime.time) -> bool:
         return (self.outdateTs - ts).total_seconds() > 1
 
+    def __create_pacer(self, rte: RteEnv) -> Optional[PcmPacer]:
+        pace_audio = False
+        try:
+            pace_audio = rte.get_property_bool(PROPERTY_PACE_AUDIO)
+        except Exception as err:
+            logger.debug(f"GetProperty optional {PROPERTY_PACE_AUDIO} failed, err: {err}. Using default value: {pace_audio}")
+        if not pace_audio:
+            return None
+
+        jitter_buffer_ms = DEFAULT_JITTER_BUFFER_MS
+        try:
+            value = rte.get_property_int(PROPERTY_JITTER_BUFFER_MS)
+            if value >= 0:
+                jitter_buffer_ms = value
+        except Exception as err:
+            logger.debug(f"GetProperty optional {PROPERTY_JITTER_BUFFER_MS} failed, err: {err}. Using default value: {jitter_buffer_ms}")
+        return PcmPacer(rte, self.__get_frame, self.frame_size, jitter_buffer_ms=jitter_buffer_ms, metrics=self.metrics)
+
+    def __send_audio(self, rte: RteEnv, data, generation: int) -> None:
+        if self.pacer:
+            self.pacer.write(data, generation)
+        else:
+            rte.send_pcm_frame(self.__get_frame(data))
+
     def __get_frame(self, data: bytes) -> PcmFrame:
         sample_rate = int(self.polly.config.sample_rate)
 
@@ -89,41 +193,134 @@ class PollyTTSExtension(Extension):
         f.set_samples_per_channel(sample_rate // 100)
         f.alloc_buf(self.frame_size)
         buff = f.lock_buf()
-        if len(data) < self.frame_size:
-            buff[:] = bytes(self.frame_size)  # fill with 0
-        buff[:len(data)] = data
+        fill_frame(buff, data)
         f.unlock_buf(buff)
         return f
 
+    def __prepare(self, text: str) -> PreparedSpeech:
+        """look up or request the audio of a sentence, runs on the prefetch pool"""
+        cache_key = self.__get_cache_key(text)
+        if cache_key:
+            audio, tier = self.audio_cache.get(cache_key)
+            if audio is not None:
+                self.metrics.incr(f"audio_cache_hit_{tier}")
+                return PreparedSpeech(cache_key, audio=audio)
+            self.metrics.incr("audio_cache_miss")
+
+        audio_stream, visemes = self.polly.synthesize(text)
+        return PreparedSpeech(cache_key, audio_stream=audio_stream)
+
+    def __discard(self, future: Future) -> None:
+        """drop a prefetched sentence, closing its audio stream once the request is done"""
+        if future.cancel():
+            return
+
+        def close(f: Future):
+            if not f.cancelled() and f.exception() is None and f.result().audio_stream:
+                f.result().audio_stream.close()
+        future.add_done_callback(close)
+
     def async_polly_handler(self, rte: RteEnv):
+        # sentences in playing order, the ones after the head are synthesized while the head is sent
+        pending = collections.deque()  # (text, ts, flush generation, future)
+        last_sent_at = None
         while not self.stopped:
-            value = self.queue.get()
-            if value is None:
-                logger.warning("async_polly_handler: exit due to None value got.")
-                break
-            inputText, ts = value
-            if len(inputText) == 0:
-                logger.warning("async_polly_handler: empty input detected.")
+            block = not pending
+            while len(pending) <= self.prefetch_sentences:
+                try:
+                    value = self.queue.get(block=block)
+                except queue.Empty:
+                    break
+                block = False
+                if value is None:
+                    logger.warning("async_polly_handler: exit due to None value got.")
+                    for *_, future in pending:
+                        self.__discard(future)
+                    return
+                inputText, ts, generation = value
+                if len(inputText) == 0:
+                    logger.warning("async_polly_handler: empty input detected.")
+                    continue
+                pending.append((inputText, ts, generation, self.prefetch_pool.submit(self.__prepare, inputText)))
+
+            if not pending:
+                continue
+
+            inputText, ts, generation, future = pending.popleft()
+            if generation != self.flush_generation or self.need_interrupt(ts):
+                logger.debug("async_polly_handler: got interrupt cmd, drop prefetched sentence.")
+                self.__discard(future)
                 continue
+
             try:
-                audio_stream, visemes = self.polly.synthesize(inputText)
-                with closing(audio_stream) as stream:
+                start = time.time()
+                # the silence between two sentences that were both queued before the first one was sent
+                gap_from = last_sent_at if last_sent_at and ts.timestamp() < last_sent_at else None
+                speech = future.result()
+
+                if speech.audio is not None:
+                    self.__observe_first_frame(start, gap_from)
+                    self.__send_cached_audio(rte, speech.audio, ts, generation)
+                    if self.pacer:
+                        self.pacer.end(generation)
+                    last_sent_at = time.time()
+                    continue
+
+                # the audio is kept while it is sent, and cached once it was received in full
+                received = bytearray() if speech.cache_key else None
+                interrupted = False
+                with closing(speech.audio_stream) as stream:
                     for chunk in stream.iter_chunks(chunk_size=self.frame_size):
-                        if self.need_interrupt(ts):
+                        if generation != self.flush_generation or self.need_interrupt(ts):
                             logger.debug("async_polly_handler: got interrupt cmd, stop sending pcm frame.")
+                            interrupted = True
                             break
 
-                        f = self.__get_frame(chunk)
-                        rte.send_pcm_frame(f)
+                        if start:
+                            self.__observe_first_frame(start, gap_from)
+                            start = None
+                        self.__send_audio(rte, chunk, generation)
+                        if received is not None:
+                            received += chunk
+                if self.pacer:
+                    self.pacer.end(generation)
+                last_sent_at = time.time()
+
+                if received and not interrupted:
+                    self.audio_cache.put(speech.cache_key, bytes(received))
+                    self.metrics.gauge("audio_cache_memory_bytes", self.audio_cache.memory_size)
+                    self.metrics.gauge("audio_cache_disk_bytes", self.audio_cache.disk_size)
+                self.metrics.maybe_report()
             except Exception as e:
                 logger.exception(e)
                 logger.exception(traceback.format_exc())
 
+    def __get_cache_key(self, text: str) -> Optional[str]:
+        if not self.audio_cache or len(text) > self.audio_cache_max_chars:
+            return None
+        config = self.polly.config
+        return make_cache_key(config.voice, config.engine, config.lang_code, config.sample_rate, text)
+
+    def __observe_first_frame(self, start: float, gap_from: Optional[float]) -> None:
+        now = time.time()
+        self.metrics.observe("first_frame_ms", (now - start) * 1000)
+        if gap_from:
+            self.metrics.observe("sentence_gap_ms", (now - gap_from) * 1000)
+
+    def __send_cached_audio(self, rte: RteEnv, audio, ts: datetime, generation: int) -> None:
+        audio = memoryview(audio)
+        for offset in range(0, len(audio), self.frame_size):
+            if generation != self.flush_generation or self.need_interrupt(ts):
+                logger.debug("async_polly_handler: got interrupt cmd, stop sending cached pcm frame.")
+                break
+            self.__send_audio(rte, audio[offset:offset + self.frame_size], generation)
+
     def flush(self):
         logger.info("PollyTTSExtension flush")
+        self.flush_generation += 1
         while not self.queue.empty():
             self.queue.get()
-        self.queue.put(("", datetime.now()))
+        self.queue.put(("", datetime.now(), self.flush_generation))
 
     def on_data(self, rte: RteEnv, data: Data) -> None:
         logger.info("PollyTTSExtension on_data")
@@ -135,7 +332,8 @@ class PollyTTSExtension(Extension):
         is_end = data.get_property_bool("end_of_segment")
 
         logger.info("on data %s %d", inputText, is_end)
-        self.queue.put((inputText, datetime.now()))
+        # tagged on the rte thread, which also runs flush, so a sentence never carries a newer generation
+        self.queue.put((inputText, datetime.now(), self.flush_generation))
 
     def on_cmd(self, rte: RteEnv, cmd: Cmd) -> None:
         logger.info("PollyTTSExtension on_cmd")
@@ -146,6 +344,9 @@ class PollyTTSExtension(Extension):
         if cmdName == "flush":
             self.outdateTs = datetime.now()
             self.flush()
+            if self.pacer:
+                # a sentence still being received has no way into the pacer any more
+                self.pacer.clear(self.flush_generation)
             cmd_out = Cmd.create("flush")
             rte.send_cmd(cmd_out, lambda rte, result: print("PollyTTSExtension send_cmd done"))
         else:
@@ -1,8 +1,8 @@
 import json
-import boto3
 from typing import Union
 from botocore.exceptions import ClientError
 
+from .aws_client import AwsClientConfig, get_aws_client, warm_up_client
 from .log import logger
 
 ENGINE_STANDARD = 'standard'
@@ -109,26 +109,28 @@ class PollyConfig:
 class PollyWrapper:
     """Encapsulates Amazon Polly functions."""
 
-    def __init__(self, config: PollyConfig):
+    def __init__(self, config: PollyConfig, client_config: AwsClientConfig = None):
         """
         :param config: A PollyConfig
+        :param client_config: Connection settings of the client, shared by the wrappers with the same settings
         """
 
         self.config = config
 
         if config.access_key and config.secret_key:
             logger.info(f"PollyTTS initialized with access key: {config.access_key}")
-
-            self.client = boto3.client(service_name='polly', 
-                                    region_name=config.region,
-                                    aws_access_key_id=config.access_key,
-                                    aws_secret_access_key=config.secret_key)
         else:
             logger.info(f"PollyTTS initialized without access key, using default credentials provider chain.")
-            self.client = boto3.client(service_name='polly', region_name=config.region)
+        self.client = get_aws_client('polly', config.region, config.access_key, config.secret_key, client_config)
 
         self.voice_metadata = None
 
+    def warm_up(self):
+        """
+        Opens a connection to Amazon Polly in the background by listing the voices of the engine.
+        """
+        warm_up_client(self.client, lambda: self.client.describe_voices(Engine=self.config.engine))
+
 
     def describe_voices(self):
         """
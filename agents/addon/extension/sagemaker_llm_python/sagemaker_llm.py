@@ -1,31 +1,37 @@
 import json
-import boto3
 from botocore.exceptions import ClientError
 from typing import List, Any, Dict
 
 from .sagemaker_llm_config import SageMakerLLMConfig
+from .aws_client import AwsClientConfig, get_aws_client, warm_up_client
 from .log import logger
 
+# no such endpoint, the warm-up request is answered with a validation error without reaching a model
+WARM_UP_ENDPOINT = 'warm-up-probe'
+
 class SageMakerLLM:
     """Encapsulates Amazon SageMaker functions."""
 
-    def __init__(self, config: SageMakerLLMConfig):
+    def __init__(self, config: SageMakerLLMConfig, client_config: AwsClientConfig = None):
         """
         :param config: A SageMakerConfig
+        :param client_config: Connection settings of the client, shared by the wrappers with the same settings
         """
 
         self.config = config
 
         if config.access_key and config.secret_key:
             logger.info(f"SageMakerLLM initialized with access key: {config.access_key}")
-
-            self.client = boto3.client(service_name='sagemaker-runtime', 
-                                    region_name=config.region,
-                                    aws_access_key_id=config.access_key,
-                                    aws_secret_access_key=config.secret_key)
         else:
             logger.info(f"SageMakerLLM initialized without access key, using default credentials provider chain.")
-            self.client = boto3.client(service_name='sagemaker-runtime', region_name=config.region)
+        self.client = get_aws_client('sagemaker-runtime', config.region, config.access_key, config.secret_key, client_config)
+
+    def warm_up(self):
+        """
+        Opens a connection to the SageMaker runtime in the background, the endpoint itself is not invoked.
+        """
+        warm_up_client(self.client, lambda: self.client.invoke_endpoint(
+            EndpointName=WARM_UP_ENDPOINT, ContentType="application/json", Body=b"{}"))
 
 
     def get_stream_resp(self, messages: List[Dict[str,Any]]):
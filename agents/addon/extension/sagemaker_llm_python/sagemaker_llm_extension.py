@@ -10,6 +10,7 @@ from rte import (
 )
 from .sagemaker_llm_config import SageMakerLLMConfig
 from .sagemaker_llm import SageMakerLLM
+from .aws_client import read_client_config
 from .data_parser import *
 from .log import logger
 from .property import *
@@ -78,10 +79,13 @@ class SageMakerLLMExtension(Extension):
             )
 
         llm_config.validate()
+        client_config = read_client_config(rte)
 
         # Create SageMakerLLM instance
         try:
-            self.sagemaker_llm = SageMakerLLM(llm_config)
+            self.sagemaker_llm = SageMakerLLM(llm_config, client_config)
+            if client_config.warm_up:
+                self.sagemaker_llm.warm_up()
             logger.info(
                 f"newSageMakerLLM succeed, max_tokens: {llm_config.max_tokens}, endpoint: {llm_config.endpoint_name}, mode: {llm_config.mode}, chat template: [{llm_config.chat_template}]"
             )
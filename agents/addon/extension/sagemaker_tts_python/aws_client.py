@@ -0,0 +1,167 @@
+import threading
+import time
+from typing import Any, Callable, Tuple
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from rte import RteEnv
+
+from .log import logger
+
+PROPERTY_MAX_POOL_CONNECTIONS = 'max_pool_connections'  # Optional
+PROPERTY_TCP_KEEPALIVE = 'tcp_keepalive'  # Optional
+PROPERTY_RETRY_MODE = 'retry_mode'  # Optional
+PROPERTY_MAX_ATTEMPTS = 'max_attempts'  # Optional
+PROPERTY_CONNECT_TIMEOUT_S = 'connect_timeout_s'  # Optional
+PROPERTY_READ_TIMEOUT_S = 'read_timeout_s'  # Optional
+PROPERTY_WARM_UP = 'warm_up'  # Optional
+
+RETRY_MODES = ['legacy', 'standard', 'adaptive']
+
+
+class AwsClientConfig:
+    """connection pool, keep-alive, retry and timeout settings of the boto3 clients"""
+
+    def __init__(self,
+            max_pool_connections: int,
+            tcp_keepalive: bool,
+            retry_mode: str,
+            max_attempts: int,
+            connect_timeout_s: int,
+            read_timeout_s: int,
+            warm_up: bool):
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self.retry_mode = retry_mode
+        self.max_attempts = max_attempts
+        self.connect_timeout_s = connect_timeout_s
+        self.read_timeout_s = read_timeout_s
+        self.warm_up = warm_up  # send a request at start, so the first turn finds a connection open
+
+    def validate(self):
+        if self.retry_mode not in RETRY_MODES:
+            logger.warning(f"Invalid retry mode '{self.retry_mode}', must be one of {RETRY_MODES}. Fallback to adaptive")
+            self.retry_mode = 'adaptive'
+
+    def key(self) -> Tuple:
+        return (self.max_pool_connections, self.tcp_keepalive, self.retry_mode, self.max_attempts,
+                self.connect_timeout_s, self.read_timeout_s)
+
+    def botocore_config(self) -> Config:
+        return Config(
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=self.tcp_keepalive,
+            retries={'mode': self.retry_mode, 'max_attempts': self.max_attempts},
+            connect_timeout=self.connect_timeout_s,
+            read_timeout=self.read_timeout_s,
+        )
+
+    @classmethod
+    def default_config(cls):
+        return cls(
+            max_pool_connections=10,
+            tcp_keepalive=True,
+            retry_mode='adaptive',
+            max_attempts=3,
+            connect_timeout_s=5,
+            read_timeout_s=60,
+            warm_up=True,
+        )
+
+
+def read_client_config(rte: RteEnv) -> AwsClientConfig:
+    """AwsClientConfig from the optional extension properties"""
+    config = AwsClientConfig.default_config()
+
+    for optional_param in [PROPERTY_MAX_POOL_CONNECTIONS, PROPERTY_MAX_ATTEMPTS,
+                           PROPERTY_CONNECT_TIMEOUT_S, PROPERTY_READ_TIMEOUT_S]:
+        try:
+            value = rte.get_property_int(optional_param)
+            if value > 0:
+                config.__setattr__(optional_param, value)
+        except Exception as err:
+            logger.debug(f"GetProperty optional {optional_param} failed, err: {err}. Using default value: {config.__getattribute__(optional_param)}")
+
+    for optional_param in [PROPERTY_TCP_KEEPALIVE, PROPERTY_WARM_UP]:
+        try:
+            config.__setattr__(optional_param, rte.get_property_bool(optional_param))
+        except Exception as err:
+            logger.debug(f"GetProperty optional {optional_param} failed, err: {err}. Using default value: {config.__getattribute__(optional_param)}")
+
+    try:
+        value = rte.get_property_string(PROPERTY_RETRY_MODE).strip()
+        if value:
+            config.retry_mode = value
+    except Exception as err:
+        logger.debug(f"GetProperty optional {PROPERTY_RETRY_MODE} failed, err: {err}. Using default value: {config.retry_mode}")
+
+    config.validate()
+    return config
+
+
+def create_aws_client(service_name: str, region: str, access_key: str, secret_key: str, config: AwsClientConfig):
+    if access_key and secret_key:
+        return boto3.client(service_name=service_name,
+                            region_name=region,
+                            aws_access_key_id=access_key,
+                            aws_secret_access_key=secret_key,
+                            config=config.botocore_config())
+    return boto3.client(service_name=service_name, region_name=region, config=config.botocore_config())
+
+
+_clients = {}
+_warmed_up = set()
+_clients_lock = threading.Lock()
+
+
+def get_aws_client(service_name: str, region: str, access_key: str, secret_key: str, config: AwsClientConfig = None):
+    """
+    Get the process-wide client of a service, region, credentials and client config, creating it on first use.
+
+    boto3 clients are thread safe, so extension instances share the client and its connection
+    pool. Empty keys use the default credentials provider chain.
+    """
+    config = config or AwsClientConfig.default_config()
+    key = (service_name, region, access_key, secret_key) + config.key()
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            start = time.time()
+            client = create_aws_client(service_name, region, access_key, secret_key, config)
+            _clients[key] = client
+            logger.info(f"created {service_name} client for region {region} in {int((time.time() - start) * 1000)}ms, "
+                        f"max_pool_connections: {config.max_pool_connections}, retry_mode: {config.retry_mode}")
+        else:
+            logger.debug(f"Reusing {service_name} client for region {region}")
+        return client
+
+
+def warm_up_client(client, call: Callable[[], Any]) -> None:
+    """
+    Send a cheap request with a client in the background, once per client and process.
+
+    It resolves credentials and opens a pooled connection, DNS, TCP and TLS included, before
+    the first real request. Error responses are expected from some probes and good enough,
+    they went through the same connection.
+    """
+    with _clients_lock:
+        if id(client) in _warmed_up:
+            return
+        _warmed_up.add(id(client))
+
+    service_name = client.meta.service_model.service_name
+
+    def run():
+        start = time.time()
+        try:
+            call()
+        except ClientError as err:
+            logger.debug(f"{service_name} warm-up response: {err}")
+        except Exception as err:
+            logger.warning(f"{service_name} warm-up failed, err: {err}")
+            return
+        logger.info(f"{service_name} client warmed up in {int((time.time() - start) * 1000)}ms")
+
+    threading.Thread(target=run, name=f"{service_name}_warm_up", daemon=True).start()
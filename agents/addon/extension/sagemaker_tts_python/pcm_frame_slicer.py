@@ -0,0 +1,120 @@
+from typing import Iterator, Optional
+
+DEFAULT_RING_FRAMES = 16
+
+_SILENCE = memoryview(bytes(4096))
+
+
+def fill_frame(buf: memoryview, data) -> None:
+    """copy data into a frame buffer, padding a short frame with silence"""
+    size = len(data)
+    buf[:size] = data
+    while size < len(buf):
+        pad = min(len(buf) - size, len(_SILENCE))
+        buf[size:size + pad] = _SILENCE[:pad]
+        size += pad
+
+
+def _byte_view(data):
+    """data itself when len() counts its bytes, a byte view of it otherwise"""
+    if type(data) is bytes or type(data) is bytearray or (type(data) is memoryview and data.format == "B"):
+        return data
+    return memoryview(data).cast("B")
+
+
+class PcmFrameSlicer:
+    """
+    Cuts a stream of PCM chunks of any size into frames of `frame_size` bytes.
+
+    Audio is kept in a preallocated bytearray ring of whole frames and frames are handed
+    out as memoryview slices of it, so a byte is copied at most once on its way from the
+    service response into the outgoing PcmFrame. Since frames are read whole and the ring
+    holds a whole number of frames, a frame never wraps around the end of the ring.
+
+    A returned frame is only valid until the next write, callers copy it out right away.
+    """
+
+    def __init__(self, frame_size: int, frames: int = DEFAULT_RING_FRAMES):
+        if frame_size < 1 or frames < 1:
+            raise ValueError(f"Invalid ring size {frames} x {frame_size}")
+
+        self.frame_size = frame_size
+        self.capacity = frame_size * frames
+
+        self._buf = bytearray(self.capacity)
+        self._view = memoryview(self._buf)
+        # total number of bytes ever written / read
+        self._written = 0
+        self._read = 0
+
+    def __len__(self) -> int:
+        return self._written - self._read
+
+    def free(self) -> int:
+        return self.capacity - len(self)
+
+    def write(self, data) -> int:
+        """
+        Returns:
+            number of bytes taken from data, less than its length when the ring is full
+        """
+        data = _byte_view(data)
+        capacity = self.capacity
+        written = self._written
+        n = len(data)
+        free = capacity - written + self._read
+        if n > free:
+            n = free
+            data = data[:n]
+        start = written % capacity
+        if start + n <= capacity:
+            self._buf[start:start + n] = data
+        else:
+            first = capacity - start
+            self._buf[start:] = data[:first]
+            self._buf[:n - first] = data[first:]
+        self._written = written + n
+        return n
+
+    def read(self, partial: bool = False) -> Optional[memoryview]:
+        """
+        Returns:
+            the next frame, or the rest of the audio with partial, None if there is not enough audio
+        """
+        start = self._read
+        size = self._written - start
+        if size >= self.frame_size:
+            size = self.frame_size
+        elif size == 0 or not partial:
+            return None
+        self._read = start + size
+        start %= self.capacity
+        return self._view[start:start + size]
+
+    def clear(self) -> None:
+        self._read = self._written
+
+    def slice(self, data) -> Iterator[memoryview]:
+        """
+        Yield the frames completed by a chunk, whatever does not fill a frame stays buffered.
+
+        Only the frame started by earlier chunks and the unfinished tail go through the
+        ring, the whole frames in between are yielded straight from the chunk.
+        """
+        data = _byte_view(data)
+        if type(data) is not memoryview:
+            data = memoryview(data)
+        frame_size = self.frame_size
+        size = len(data)
+        offset = 0
+        while self._written != self._read and offset < size:
+            offset += self.write(data[offset:offset + frame_size - (self._written - self._read) % frame_size])
+            frame = self.read()
+            if frame is not None:
+                yield frame
+
+        whole = size - (size - offset) % frame_size
+        for start in range(offset, whole, frame_size):
+            yield data[start:start + frame_size]
+        if whole < size:
+            self.write(data[whole:])
@@ -0,0 +1,150 @@
+import threading
+import time
+from typing import Callable, Optional
+
+from rte import PcmFrame, RteEnv
+
+from .log import logger
+from .metrics import Metrics
+
+FRAME_MS = 10
+DEFAULT_JITTER_BUFFER_MS = 100
+DEFAULT_MAX_BUFFER_MS = 5000
+
+
+class PcmPacer:
+    """
+    Sends synthesized PCM downstream in real time, one frame every `frame_ms` on a monotonic clock.
+
+    Producers write audio in chunks of any size as fast as the service delivers it, and
+    call `end` once an utterance was written in full. Playback of an utterance starts
+    when `jitter_buffer_ms` of audio is buffered, or when it is complete. Running dry
+    before the end of an utterance counts as an underrun, playback then waits for the
+    jitter buffer to fill up again instead of sending gaps.
+
+    At most `max_buffer_ms` of audio waits to be sent, writes to a full buffer block until
+    the sender made room, an utterance that had to wait counts as one overrun. `clear`
+    drops everything not sent yet, so an interrupt is heard within one frame rather than
+    after the whole response.
+
+    Writes and ends may carry a `generation`, any tag that grows with every interrupt, such
+    as a flush counter or the time of the flush. `clear(generation)` also drops every later
+    write and end of an older generation, so a sentence still being received when the
+    interrupt arrived cannot refill the buffer.
+    """
+
+    def __init__(self, rte: RteEnv, get_frame: Callable[[bytes], PcmFrame], frame_size: int,
+                 jitter_buffer_ms: int = DEFAULT_JITTER_BUFFER_MS, max_buffer_ms: int = DEFAULT_MAX_BUFFER_MS,
+                 frame_ms: int = FRAME_MS, metrics: Optional[Metrics] = None):
+        self.rte = rte
+        self.get_frame = get_frame
+        self.frame_size = frame_size
+        self.frame_s = frame_ms / 1000
+        self.jitter_bytes = frame_size * max(1, jitter_buffer_ms // frame_ms)
+        self.max_bytes = max(self.jitter_bytes, frame_size * (max_buffer_ms // frame_ms))
+        self.metrics = metrics
+
+        self._cond = threading.Condition()
+        self._buf = bytearray()
+        self._complete = False  # the buffered utterance was written in full
+        self._overran = False   # a write of the current utterance waited for room
+        self._playing = False
+        self._closed = False
+        self._generation = 0    # writes of older generations are dropped
+
+        self.underruns = 0
+        self.overruns = 0
+
+        self._thread = threading.Thread(target=self.__run, name="pcm_pacer", daemon=True)
+        self._thread.start()
+
+    def buffered_ms(self) -> float:
+        return len(self._buf) / self.frame_size * self.frame_s * 1000
+
+    def write(self, data: bytes, generation: int = 0) -> None:
+        with self._cond:
+            if generation < self._generation:
+                return
+            if len(self._buf) >= self.max_bytes and not self._closed and not self._overran:
+                self._overran = True
+                self.overruns += 1
+                if self.metrics:
+                    self.metrics.incr("pacer_overrun")
+            while len(self._buf) >= self.max_bytes and not self._closed and generation >= self._generation:
+                self._cond.wait()
+            if self._closed or generation < self._generation:
+                return
+            self._buf += data
+            self._complete = False
+            self._cond.notify_all()
+
+    def end(self, generation: int = 0) -> None:
+        """the utterance was written in full, its tail is played without waiting for more"""
+        with self._cond:
+            if generation < self._generation:
+                return
+            self._complete = True
+            self._overran = False
+            self._cond.notify_all()
+
+    def clear(self, generation: int = 0) -> None:
+        with self._cond:
+            self._generation = max(self._generation, generation)
+            dropped_ms = self.buffered_ms()
+            self._buf.clear()
+            self._complete = False
+            self._overran = False
+            self._playing = False
+            self._cond.notify_all()
+        if self.metrics:
+            self.metrics.observe("pacer_cleared_ms", dropped_ms)
+        logger.debug(f"pcm pacer cleared, dropped {dropped_ms:.0f}ms")
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._buf.clear()
+            self._cond.notify_all()
+        self._thread.join()
+
+    def __ready(self) -> bool:
+        size = len(self._buf)
+        if size >= self.frame_size and (self._playing or size >= self.jitter_bytes):
+            return True
+        return size > 0 and self._complete
+
+    def __run(self) -> None:
+        next_at = 0.0
+        while True:
+            with self._cond:
+                while not self._closed and not self.__ready():
+                    if self._playing and not self._complete:
+                        # the producer fell behind in the middle of an utterance
+                        self._playing = False
+                        self.underruns += 1
+                        if self.metrics:
+                            self.metrics.incr("pacer_underrun")
+                    self._cond.wait()
+                if self._closed:
+                    return
+
+                if not self._playing:
+                    self._playing = True
+                    next_at = max(next_at, time.monotonic())
+                chunk = bytes(self._buf[:self.frame_size])
+                del self._buf[:self.frame_size]
+                if not self._buf and self._complete:
+                    self._playing = False
+                self._cond.notify_all()
+
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.frame_s:
+                # the sender itself was held up, resume from now rather than catching up with a burst
+                next_at = time.monotonic()
+            try:
+                self.rte.send_pcm_frame(self.get_frame(chunk))
+            except Exception as e:
+                logger.exception(e)
+            next_at += self.frame_s
@@ -15,9 +15,14 @@ import threading
 from datetime import datetime
 import traceback
 from contextlib import closing
+from typing import Optional
 
 from .log import logger
 from .sagemaker_wrapper import SageMakerTTSWrapper, SageMakerTTSConfig
+from .aws_client import read_client_config
+from .metrics import Metrics
+from .pcm_frame_slicer import PcmFrameSlicer, fill_frame
+from .pcm_pacer import PcmPacer, DEFAULT_JITTER_BUFFER_MS
 
 PROPERTY_REGION = "region"  # Optional
 PROPERTY_ACCESS_KEY = "access_key"  # Optional
@@ -29,6 +34,8 @@ PROPERTY_PROMPT_TEXT = 'prompt_text' # Optional
 PROPERTY_PROMPT_LANGUAGE = 'prompt_language'    # Optional
 PROPERTY_OUTPUT_LANGUAGE = 'output_language'    # Optional
 PROPERTY_MODEL_TYPE = 'model_type'    # Optional
+PROPERTY_PACE_AUDIO = 'pace_audio'  # Optional
+PROPERTY_JITTER_BUFFER_MS = 'jitter_buffer_ms'  # Optional
 
 class SageMakerTTSExtension(Extension):
     def __init__(self, name: str):
@@ -43,6 +50,11 @@ class SageMakerTTSExtension(Extension):
         self.bytes_per_sample = 2
         self.number_of_channels = 1
 
+        self.metrics = Metrics("sagemaker_tts")
+        # bumped on every flush, sentences queued before it are dropped, the one being sent stops
+        self.flush_generation = 0
+        self.pacer = None
+
     def on_start(self, rte: RteEnv) -> None:
         logger.info("SageMakerTTSExtension on_start")
 
@@ -61,8 +73,12 @@ class SageMakerTTSExtension(Extension):
 
         sagemaker_tts_config.validate()
 
-        self.sagemaker_tts = SageMakerTTSWrapper(sagemaker_tts_config)
+        client_config = read_client_config(rte)
+        self.sagemaker_tts = SageMakerTTSWrapper(sagemaker_tts_config, client_config)
+        if client_config.warm_up:
+            self.sagemaker_tts.warm_up()
         self.frame_size = int(int(sagemaker_tts_config.sample_rate) * self.number_of_channels * self.bytes_per_sample / 100)
+        self.pacer = self.__create_pacer(rte)
 
         self.thread = threading.Thread(target=self.async_sagemaker_tts_handler, args=[rte])
         self.thread.start()
@@ -74,12 +90,32 @@ class SageMakerTTSExtension(Extension):
         self.stopped = True
         self.queue.put(None)
         self.flush()
+        if self.pacer:
+            self.pacer.close()
         self.thread.join()
         rte.on_stop_done()
 
     def need_interrupt(self, ts: datetime.time) -> bool:
         return (self.outdateTs - ts).total_seconds() > 1
 
+    def __create_pacer(self, rte: RteEnv) -> Optional[PcmPacer]:
+        pace_audio = False
+        try:
+            pace_audio = rte.get_property_bool(PROPERTY_PACE_AUDIO)
+        except Exception as err:
+            logger.info(f"GetProperty optional {PROPERTY_PACE_AUDIO} failed, err: {err}. Using default value: {pace_audio}")
+        if not pace_audio:
+            return None
+
+        jitter_buffer_ms = DEFAULT_JITTER_BUFFER_MS
+        try:
+            value = rte.get_property_int(PROPERTY_JITTER_BUFFER_MS)
+            if value >= 0:
+                jitter_buffer_ms = value
+        except Exception as err:
+            logger.info(f"GetProperty optional {PROPERTY_JITTER_BUFFER_MS} failed, err: {err}. Using default value: {jitter_buffer_ms}")
+        return PcmPacer(rte, self.__get_frame, self.frame_size, jitter_buffer_ms=jitter_buffer_ms, metrics=self.metrics)
+
     def __get_frame(self, data: bytes) -> PcmFrame:
         sample_rate = int(self.sagemaker_tts.config.sample_rate)
 
@@ -92,9 +128,7 @@ class SageMakerTTSExtension(Extension):
         f.set_samples_per_channel(sample_rate // 100)
         f.alloc_buf(self.frame_size)
         buff = f.lock_buf()
-        if len(data) < self.frame_size:
-            buff[:] = bytes(self.frame_size)  # fill with 0
-        buff[:len(data)] = data
+        fill_frame(buff, data)
         f.unlock_buf(buff)
         return f
 
@@ -105,20 +139,32 @@ class SageMakerTTSExtension(Extension):
                 logger.warning("async_sagemaker_tts_handler: exit due to None value got.")
                 break
 
-            inputText, ts = value
+            inputText, ts, generation = value
             if not inputText:
                 logger.warning("async_sagemaker_tts_handler: empty input detected.")
                 continue
+            if generation != self.flush_generation:
+                continue
 
             try:
                 audio_stream = self.sagemaker_tts.synthesize(text=inputText, language=self.sagemaker_tts.config.output_language)
+                slicer = None if self.pacer else PcmFrameSlicer(self.frame_size)
                 for event in audio_stream:
-                    if self.need_interrupt(ts):
+                    if generation != self.flush_generation or self.need_interrupt(ts):
                         logger.debug("async_sagemaker_tts_handler: got interrupt cmd, stop sending pcm frame.")
                         break
                     chunk_bytes = event['PayloadPart']['Bytes']
-                    f = self.__get_frame(chunk_bytes)
-                    rte.send_pcm_frame(f)
+                    if self.pacer:
+                        self.pacer.write(chunk_bytes, generation)
+                        continue
+                    # payload parts are not aligned to frames
+                    for frame in slicer.slice(chunk_bytes):
+                        rte.send_pcm_frame(self.__get_frame(frame))
+                if self.pacer:
+                    self.pacer.end(generation)
+                elif len(slicer) and generation == self.flush_generation and not self.need_interrupt(ts):
+                    rte.send_pcm_frame(self.__get_frame(slicer.read(partial=True)))
+                self.metrics.maybe_report()
 
             except Exception as e:
                 logger.exception(e)
@@ -126,9 +172,10 @@ class SageMakerTTSExtension(Extension):
 
     def flush(self):
         logger.info("SageMakerTTSExtension flush")
+        self.flush_generation += 1
         while not self.queue.empty():
             self.queue.get()
-        self.queue.put(("", datetime.now()))
+        self.queue.put(("", datetime.now(), self.flush_generation))
 
     def on_data(self, rte: RteEnv, data: Data) -> None:
         logger.info("SageMakerTTSExtension on_data")
@@ -140,7 +187,8 @@ class SageMakerTTSExtension(Extension):
         is_end = data.get_property_bool("end_of_segment")
 
         logger.info("on data %s %d", inputText, is_end)
-        self.queue.put((inputText, datetime.now()))
+        # tagged on the rte thread, which also runs flush, so a sentence never carries a newer generation
+        self.queue.put((inputText, datetime.now(), self.flush_generation))
 
     def on_cmd(self, rte: RteEnv, cmd: Cmd) -> None:
         logger.info("SageMakerTTSExtension on_cmd")
@@ -151,6 +199,9 @@ class SageMakerTTSExtension(Extension):
         if cmdName == "flush":
             self.outdateTs = datetime.now()
             self.flush()
+            if self.pacer:
+                # a sentence still being received has no way into the pacer any more
+                self.pacer.clear(self.flush_generation)
             cmd_out = Cmd.create("flush")
             rte.send_cmd(cmd_out, lambda rte, result: print("SageMakerTTSExtension send_cmd done"))
         else:
@@ -0,0 +1,138 @@
+"""
+Replay the partial results of the offline fake service through the stable/non-stable text split,
+check that IncrementalItemSplitter returns what the previous split_items did for every event,
+and time both.
+
+Run from agents/addon/extension, with the rte python binding importable:
+
+    python -m transcribe_asr_python.bench_item_splitter --words 20 100 400
+"""
+import argparse
+import asyncio
+import json
+import random
+import timeit
+from typing import List, Optional, Tuple
+
+from amazon_transcribe.model import Item
+
+from .fake_transcribe import FakeTranscribeStreamingClient, split_script
+from .item_splitter import IncrementalItemSplitter
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2
+VOCABULARY = "the a quick brown fox jumps over lazy dog transcribe stream audio latency partial result".split()
+
+# (result_id, transcript, items, is_final) of one result event
+ResultEvent = Tuple[Optional[str], str, List[Item], bool]
+
+
+def split_items(text_result: str, items: List[Item]) -> Tuple[str, str]:
+    """the split before IncrementalItemSplitter, rebuilding both strings on every event"""
+    stable_str, non_stable_str = "", ""
+
+    idx = 0
+    full_len = len(text_result)
+
+    for item in items:
+        content = item.content
+        idx += len(content)
+
+        while idx < full_len and text_result[idx] == ' ':
+            content += ' '
+            idx += 1
+
+        if item.stable:
+            stable_str += content
+        else:
+            non_stable_str += content
+
+    return stable_str, non_stable_str
+
+
+def utterance_text(words: int, rng: random.Random) -> str:
+    tokens = []
+    for i in range(1, words + 1):
+        tokens.append(rng.choice(VOCABULARY))
+        if i % 12 == 0:
+            tokens.append(",")
+    return " ".join(tokens)
+
+
+async def record_events(texts: List[str], word_ms: int) -> List[ResultEvent]:
+    """the result events the fake service sends for some utterances, about one partial per word"""
+    words = sum(len(text.split()) for text in texts)
+    pause_ms = 2 * word_ms
+    script = split_script(texts, words * word_ms + len(texts) * pause_ms, pause_ms)
+    client = FakeTranscribeStreamingClient(script, start_latency_ms=0, partial_interval_ms=word_ms,
+                                           result_latency_ms=0, bytes_per_sample=BYTES_PER_SAMPLE)
+    stream = await client.start_stream_transcription(language_code="en-US", media_sample_rate_hz=SAMPLE_RATE,
+                                                     media_encoding="pcm",
+                                                     enable_partial_results_stabilization=True)
+    chunk = bytes(SAMPLE_RATE * BYTES_PER_SAMPLE * word_ms // 1000)
+    for _ in range(words + 2 * len(texts) + 1):
+        await stream.input_stream.send_audio_event(audio_chunk=chunk)
+    await stream.input_stream.end_stream()
+
+    events = []
+    async for event in stream.output_stream:
+        for result in event.transcript.results:
+            alternative = result.alternatives[0]
+            events.append((result.result_id, alternative.transcript, alternative.items, not result.is_partial))
+    return events
+
+
+def replay_splitter(events: List[ResultEvent]) -> List[Tuple[str, str]]:
+    """split every event the way TranscribeEventHandler does"""
+    splitter = IncrementalItemSplitter()
+    out = []
+    for result_id, transcript, items, is_final in events:
+        out.append(splitter.split(result_id, transcript, items))
+        if is_final:
+            splitter.reset()
+    return out
+
+
+def bench(words: int, utterances: int, word_ms: int, number: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    events = asyncio.run(record_events([utterance_text(words, rng) for _ in range(utterances)], word_ms))
+
+    expected = [split_items(transcript, items) for _, transcript, items, _ in events]
+    got = replay_splitter(events)
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, got)) if a != b]
+    if mismatches:
+        raise AssertionError(f"{len(mismatches)} of {len(events)} events split differently, first at event {mismatches[0]}")
+
+    def old():
+        for _, transcript, items, _ in events:
+            split_items(transcript, items)
+
+    def new():
+        replay_splitter(events)
+
+    per_event_us = lambda fn: round(min(timeit.repeat(fn, number=number, repeat=5)) / number / len(events) * 1e6, 2)
+    return {
+        "words": words,
+        "utterances": utterances,
+        "events": len(events),
+        "identical": True,
+        "split_items_us": per_event_us(old),
+        "incremental_us": per_event_us(new),
+    }
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--words", type=int, nargs="+", default=[20, 100, 400], help="words per utterance")
+    parser.add_argument("--utterances", type=int, default=3, help="utterances per stream, the splitter is reset after each final")
+    parser.add_argument("--word-ms", type=int, default=300, help="audio per word, one partial per word")
+    parser.add_argument("--number", type=int, default=20, help="replays per timed run")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the random utterance text")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = process_args()
+    print(json.dumps([bench(words, args.utterances, args.word_ms, args.number, args.seed) for words in args.words], indent=2))
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from amazon_transcribe import AWSCRTEventLoop
+from amazon_transcribe.auth import AwsCrtCredentialResolver, CredentialResolver, Credentials, StaticCredentialResolver
+from amazon_transcribe.client import TranscribeStreamingClient
+
+from .log import logger
+from .metrics import Metrics
+from .transcribe_config import TranscribeConfig
+
+# (region, access_key, secret_key), empty keys use the default credentials provider chain
+ClientKey = Tuple[str, str, str]
+
+CREDENTIAL_REFRESH_INTERVAL_S = 300 # refresh resolved credentials at least this often
+CREDENTIAL_EXPIRY_MARGIN_S = 300    # and this long before they expire
+
+
+class CachingCredentialResolver(CredentialResolver):
+    """
+    Resolves credentials through the default provider chain once and hands out the cached result.
+
+    The client resolves credentials for every stream and every audio event, each a round
+    trip through the provider chain. Cached credentials are refreshed in the background
+    once they are older than the refresh interval or close to expiry, callers only wait
+    when nothing usable is cached.
+    """
+
+    def __init__(self, resolver: CredentialResolver, refresh_interval_s: float = CREDENTIAL_REFRESH_INTERVAL_S,
+                 metrics: Optional[Metrics] = None):
+        self.resolver = resolver
+        self.refresh_interval_s = refresh_interval_s
+        self.metrics = metrics
+
+        self._lock = threading.Lock()
+        self.credentials: Optional[Credentials] = None
+        self.resolved_at = 0.0
+        self.refreshing = False
+
+    def __expires_in(self) -> Optional[float]:
+        expiration = getattr(self.credentials, "expiration", None)
+        if expiration is None:
+            return None
+        return (expiration - datetime.now(timezone.utc)).total_seconds()
+
+    def __usable(self) -> bool:
+        if self.credentials is None:
+            return False
+        expires_in = self.__expires_in()
+        return expires_in is None or expires_in > 0
+
+    def __refresh_due(self) -> bool:
+        expires_in = self.__expires_in()
+        return (time.monotonic() - self.resolved_at >= self.refresh_interval_s or
+                (expires_in is not None and expires_in < CREDENTIAL_EXPIRY_MARGIN_S))
+
+    async def refresh(self) -> Optional[Credentials]:
+        start = time.time()
+        try:
+            credentials = await self.resolver.get_credentials()
+        except Exception as e:
+            if self.metrics:
+                self.metrics.incr("credentials_refresh_failed")
+            logger.warning(f"resolve credentials failed: {e}")
+            return self.credentials if self.__usable() else None
+        finally:
+            with self._lock:
+                self.refreshing = False
+
+        with self._lock:
+            self.credentials = credentials
+            self.resolved_at = time.monotonic()
+        if self.metrics:
+            self.metrics.observe("credentials_resolve_ms", (time.time() - start) * 1000)
+        return credentials
+
+    async def get_credentials(self) -> Optional[Credentials]:
+        with self._lock:
+            usable = self.__usable()
+            refresh = usable and not self.refreshing and self.__refresh_due()
+            if refresh:
+                self.refreshing = True
+        if not usable:
+            return await self.refresh()
+
+        if refresh:
+            asyncio.ensure_future(self.refresh())
+        return self.credentials
+
+
+def create_transcribe_client(config: TranscribeConfig, metrics: Optional[Metrics] = None) -> TranscribeStreamingClient:
+    if config.access_key and config.secret_key:
+        logger.info(f"init trascribe client with access key: {config.access_key}, lang_code: {config.lang_code}")
+        return TranscribeStreamingClient(
+            region=config.region,
+            credential_resolver=StaticCredentialResolver(
+                access_key_id=config.access_key,
+                secret_access_key=config.secret_key
+            )
+        )
+
+    logger.info(f"init trascribe client without access key, using default credentials provider chain, lang_code: {config.lang_code}")
+    return TranscribeStreamingClient(
+        region=config.region,
+        credential_resolver=CachingCredentialResolver(AwsCrtCredentialResolver(AWSCRTEventLoop().bootstrap),
+                                                      metrics=metrics)
+    )
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_transcribe_client(config: TranscribeConfig, metrics: Optional[Metrics] = None) -> TranscribeStreamingClient:
+    """
+    Get the process-wide client for the config's region and credentials, creating it on first use.
+
+    The client holds no per-stream state, so extension instances and their sessions share it.
+    """
+    key: ClientKey = (config.region, config.access_key, config.secret_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            start = time.time()
+            client = create_transcribe_client(config, metrics)
+            _clients[key] = client
+            if metrics:
+                metrics.incr("client_cache_miss")
+                metrics.observe("client_create_ms", (time.time() - start) * 1000)
+        else:
+            logger.debug(f"Reusing transcribe client for region {config.region}")
+            if metrics:
+                metrics.incr("client_cache_hit")
+        return client
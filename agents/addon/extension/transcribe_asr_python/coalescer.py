@@ -0,0 +1,43 @@
+from time import monotonic
+from typing import Optional
+
+
+class AudioCoalescer:
+    """
+    Packs consecutive PCM frames into larger audio events.
+
+    Every audio event is framed and signed on its own, so sending one per 10ms
+    frame multiplies that overhead. Frames are appended until `event_ms` of audio
+    is buffered, or until the oldest buffered frame has waited `max_delay_ms`,
+    which bounds the latency added to results.
+    """
+
+    def __init__(self, sample_rate: int, event_ms: int = 50, max_delay_ms: int = 100, bytes_per_sample: int = 2):
+        self.event_bytes = max(int(sample_rate * bytes_per_sample * event_ms / 1000), 1)
+        self.max_delay_s = max_delay_ms / 1000
+
+        self.buf = bytearray()
+        self.first_at = None
+
+    def __len__(self) -> int:
+        return len(self.buf)
+
+    def add(self, chunk: bytes) -> None:
+        if not self.buf:
+            self.first_at = monotonic()
+        self.buf += chunk
+
+    def time_until_deadline(self) -> Optional[float]:
+        """seconds left before the buffered audio must be sent, None if nothing is buffered"""
+        if not self.buf:
+            return None
+        return max(0.0, self.max_delay_s - (monotonic() - self.first_at))
+
+    def should_flush(self) -> bool:
+        return len(self.buf) >= self.event_bytes or self.time_until_deadline() == 0
+
+    def take(self) -> bytes:
+        chunk = bytes(self.buf)
+        self.buf.clear()
+        self.first_at = None
+        return chunk
@@ -0,0 +1,53 @@
+from time import monotonic
+from typing import Optional
+
+EMIT = 'emit'
+SUPPRESS_DUPLICATE = 'duplicate'
+SUPPRESS_RATE = 'rate'
+
+
+class PartialEmissionPolicy:
+    """
+    Decides which transcript results of one stream are sent as text_data.
+
+    Finals are always sent. A partial is dropped when its text equals the last
+    partial sent. A partial arriving less than `min_interval_ms` after the last
+    one sent is held back, the caller keeps the latest held partial and sends it
+    once `due_in` has elapsed, unless a newer result was sent before.
+    """
+
+    def __init__(self, dedup: bool = False, min_interval_ms: int = 0):
+        self.dedup = dedup
+        self.min_interval_s = min_interval_ms / 1000
+
+        self.last_text = None
+        self.last_emit_at = None
+
+    def check(self, text: str, is_final: bool, now: Optional[float] = None) -> str:
+        """
+        Returns:
+            EMIT, or the reason the result is suppressed
+        """
+        if is_final:
+            # the next segment starts fresh
+            self.last_text = None
+            self.last_emit_at = None
+            return EMIT
+
+        if self.dedup and text == self.last_text:
+            return SUPPRESS_DUPLICATE
+
+        now = monotonic() if now is None else now
+        if self.due_in(now) > 0:
+            return SUPPRESS_RATE
+
+        self.last_text = text
+        self.last_emit_at = now
+        return EMIT
+
+    def due_in(self, now: Optional[float] = None) -> float:
+        """seconds until the next partial may be sent"""
+        if self.last_emit_at is None:
+            return 0.0
+        now = monotonic() if now is None else now
+        return max(0.0, self.last_emit_at + self.min_interval_s - now)
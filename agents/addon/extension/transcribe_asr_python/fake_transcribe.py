@@ -0,0 +1,184 @@
+import asyncio
+from typing import List, Optional
+
+from amazon_transcribe.model import Alternative, Item, Result, Transcript, TranscriptEvent
+
+
+class ScriptedUtterance:
+    """
+    One utterance the fake service recognizes, placed in the audio time of the stream.
+
+    Words are revealed evenly between start_ms and end_ms, the final result is
+    sent once the stream has received audio up to end_ms.
+    """
+
+    def __init__(self, text: str, start_ms: int, end_ms: int, confidence: float = 0.95):
+        self.words = text.split()
+        self.text = " ".join(self.words)
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.confidence = confidence
+
+    def words_at(self, audio_ms: float) -> int:
+        """number of words recognized once the stream has received audio_ms of audio"""
+        if audio_ms >= self.end_ms:
+            return len(self.words)
+        progress = (audio_ms - self.start_ms) / max(self.end_ms - self.start_ms, 1)
+        return max(1, min(len(self.words), int(progress * len(self.words)) + 1))
+
+
+def split_script(texts: List[str], duration_ms: int, pause_ms: int = 300) -> List[ScriptedUtterance]:
+    """spread utterances evenly over duration_ms of audio, separated by pause_ms"""
+    if not texts:
+        return []
+    slot_ms = duration_ms / len(texts)
+    return [ScriptedUtterance(text, int(i * slot_ms), int((i + 1) * slot_ms - pause_ms)) for i, text in enumerate(texts)]
+
+
+class FakeAudioStream:
+    def __init__(self, stream: "FakeTranscribeStream"):
+        self.stream = stream
+
+    async def send_audio_event(self, audio_chunk: bytes) -> None:
+        self.stream.on_audio(audio_chunk)
+
+    async def end_stream(self) -> None:
+        self.stream.on_end()
+
+
+class FakeTranscribeStream:
+    """
+    Stand-in for StartStreamTranscriptionEventStream, results follow the audio received.
+
+    A partial is sent every partial_interval_ms of received audio while an utterance is
+    in progress, and every result is delivered result_latency_ms after the audio that
+    produced it, as the service would.
+    """
+
+    def __init__(self, script: List[ScriptedUtterance], bytes_per_ms: float, partial_interval_ms: int,
+                 result_latency_ms: int, stabilization: bool):
+        self.script = script
+        self.bytes_per_ms = bytes_per_ms
+        self.partial_interval_ms = partial_interval_ms
+        self.result_latency_s = result_latency_ms / 1000
+        self.stabilization = stabilization
+
+        self.loop = asyncio.get_running_loop()
+        self.events = asyncio.Queue()
+        self.ended = False
+
+        self.audio_bytes = 0
+        self.audio_events = 0
+        self.next_utterance = 0
+        self.next_partial_ms = None
+
+        self.input_stream = FakeAudioStream(self)
+        self.output_stream = self.iter_events()
+
+    @property
+    def audio_ms(self) -> float:
+        return self.audio_bytes / self.bytes_per_ms
+
+    def on_audio(self, chunk: bytes) -> None:
+        if self.ended:
+            raise IOError("stream already ended")
+        self.audio_bytes += len(chunk)
+        self.audio_events += 1
+
+        while self.next_utterance < len(self.script):
+            utterance = self.script[self.next_utterance]
+            if self.audio_ms < utterance.start_ms:
+                return
+
+            if self.audio_ms >= utterance.end_ms:
+                self.emit(utterance, is_partial=False)
+                self.next_utterance += 1
+                self.next_partial_ms = None
+                continue
+
+            if self.next_partial_ms is None:
+                self.next_partial_ms = utterance.start_ms
+            if self.audio_ms >= self.next_partial_ms:
+                self.emit(utterance, is_partial=True)
+                self.next_partial_ms = self.audio_ms + self.partial_interval_ms
+            return
+
+    def on_end(self) -> None:
+        if self.ended:
+            return
+        # the service finalizes the utterance in progress when the audio ends
+        if self.next_utterance < len(self.script) and self.next_partial_ms is not None:
+            self.emit(self.script[self.next_utterance], is_partial=False)
+            self.next_utterance += 1
+        self.ended = True
+        self.deliver(None)
+
+    def emit(self, utterance: ScriptedUtterance, is_partial: bool) -> None:
+        count = utterance.words_at(self.audio_ms) if is_partial else len(utterance.words)
+        word_ms = (utterance.end_ms - utterance.start_ms) / max(len(utterance.words), 1)
+
+        items = []
+        for i, word in enumerate(utterance.words[:count]):
+            items.append(Item(
+                start_time=(utterance.start_ms + i * word_ms) / 1000,
+                end_time=(utterance.start_ms + (i + 1) * word_ms) / 1000,
+                item_type="pronunciation",
+                content=word,
+                confidence=utterance.confidence,
+                # the last words of a partial may still change
+                stable=(not is_partial or i < count - 2) if self.stabilization else None,
+            ))
+
+        result = Result(
+            result_id=f"result-{self.next_utterance}",
+            start_time=utterance.start_ms / 1000,
+            end_time=min(self.audio_ms, utterance.end_ms) / 1000,
+            is_partial=is_partial,
+            alternatives=[Alternative(transcript=" ".join(utterance.words[:count]), items=items)],
+        )
+        self.deliver(TranscriptEvent(transcript=Transcript(results=[result])))
+
+    def deliver(self, event: Optional[TranscriptEvent]) -> None:
+        self.loop.call_later(self.result_latency_s, self.events.put_nowait, event)
+
+    async def iter_events(self):
+        while True:
+            event = await self.events.get()
+            if event is None:
+                return
+            yield event
+
+
+class FakeTranscribeStreamingClient:
+    """
+    Offline stand-in for TranscribeStreamingClient, for benchmarks and local runs without AWS.
+
+    Every stream recognizes the same script, in the audio time of that stream.
+
+    Args:
+        script: utterances recognized by every stream
+        start_latency_ms: time to open a stream
+        partial_interval_ms: audio between two partial results of an utterance
+        result_latency_ms: time from the audio to its result
+        bytes_per_sample: sample width of the audio, used to turn bytes into audio time
+    """
+
+    def __init__(self, script: List[ScriptedUtterance], start_latency_ms: int = 200, partial_interval_ms: int = 200,
+                 result_latency_ms: int = 300, bytes_per_sample: int = 2):
+        self.script = script
+        self.start_latency_s = start_latency_ms / 1000
+        self.partial_interval_ms = partial_interval_ms
+        self.result_latency_ms = result_latency_ms
+        self.bytes_per_sample = bytes_per_sample
+
+        self.streams: List[FakeTranscribeStream] = []
+
+    async def start_stream_transcription(self, *, language_code: str, media_sample_rate_hz: int, media_encoding: str,
+                                         enable_partial_results_stabilization: Optional[bool] = None,
+                                         **kwargs) -> FakeTranscribeStream:
+        await asyncio.sleep(self.start_latency_s)
+        stream = FakeTranscribeStream(self.script, media_sample_rate_hz * self.bytes_per_sample / 1000,
+                                      self.partial_interval_ms, self.result_latency_ms,
+                                      bool(enable_partial_results_stabilization))
+        self.streams.append(stream)
+        return stream
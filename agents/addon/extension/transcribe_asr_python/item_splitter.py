@@ -0,0 +1,65 @@
+from typing import List, Optional, Tuple
+
+from amazon_transcribe.model import Item
+
+
+class IncrementalItemSplitter:
+    """
+    Splits the transcript of a partial result into its stable and non-stable text.
+
+    With partial results stabilization, stable items only ever grow as a prefix
+    of the result's items, and every partial re-sends all items of the result.
+    The stable prefix already seen is kept, so each event only walks the items
+    that are new or not yet stable instead of the whole utterance.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, result_id: Optional[str] = None) -> None:
+        self.result_id = result_id
+        self.stable_count = 0   # number of leading stable items consumed
+        self.stable_end = 0     # offset in the transcript after the stable prefix
+        self.stable_str = ""
+
+    def split(self, result_id: Optional[str], text_result: str, items: List[Item]) -> Tuple[str, str]:
+        if result_id != self.result_id or len(items) < self.stable_count:
+            self.reset(result_id)
+
+        full_len = len(text_result)
+        idx = self.stable_end
+        i = self.stable_count
+
+        # extend the remembered stable prefix
+        new_stable = []
+        while i < len(items) and items[i].stable:
+            content, idx = self.__take(items[i].content, text_result, idx, full_len)
+            new_stable.append(content)
+            i += 1
+        if new_stable:
+            self.stable_str += "".join(new_stable)
+            self.stable_count = i
+            self.stable_end = idx
+
+        # the rest is re-read on every event
+        stable_tail, non_stable = [], []
+        for item in items[i:]:
+            content, idx = self.__take(item.content, text_result, idx, full_len)
+            if item.stable:
+                stable_tail.append(content)
+            else:
+                non_stable.append(content)
+
+        stable_str = self.stable_str + "".join(stable_tail) if stable_tail else self.stable_str
+        return stable_str, "".join(non_stable)
+
+    @staticmethod
+    def __take(content: str, text_result: str, idx: int, full_len: int) -> Tuple[str, int]:
+        """the item's content with the spaces that follow it in the transcript, and the offset after them"""
+        idx += len(content)
+        end = idx
+        while end < full_len and text_result[end] == ' ':
+            end += 1
+        if end > idx:
+            content += ' ' * (end - idx)
+        return content, end
@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_DROP_NEWEST = 'drop_newest'
+
+POLICIES = [POLICY_DROP_OLDEST, POLICY_DROP_NEWEST]
+
+
+class PcmRingBuffer:
+    """
+    Preallocated single-producer/single-consumer ring of PCM chunks.
+
+    Audio is copied into fixed-size slots of one bytearray. The producer only
+    advances `_head` and the consumer only advances `_tail`, so neither side
+    takes a lock. Chunks larger than a slot are split over consecutive slots.
+
+    When the ring is full, POLICY_DROP_NEWEST rejects the incoming chunk as a whole,
+    it is never queued in part, and POLICY_DROP_OLDEST overwrites the oldest one. Overwrites are detected by the
+    consumer through per-slot sequence numbers and counted as dropped.
+
+    The consumer is only woken up when it is actually waiting, a busy consumer
+    costs the producer nothing beyond the copy. `close` wakes the consumer up for
+    good, after which the getters return None once the ring is drained.
+    """
+
+    def __init__(self, slots: int, slot_bytes: int, policy: str = POLICY_DROP_NEWEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Invalid policy '{policy}', must be one of {POLICIES}")
+        if slots < 1 or slot_bytes < 1:
+            raise ValueError(f"Invalid ring size {slots} x {slot_bytes}")
+
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.policy = policy
+
+        self._buf = bytearray(slots * slot_bytes)
+        self._view = memoryview(self._buf)
+        self._lengths = [0] * slots
+        self._meta = [None] * slots
+        self._seq = [-1] * slots
+
+        # total number of chunks ever published / consumed
+        self._head = 0
+        self._tail = 0
+
+        self._waiting = False
+        self._event = threading.Event()
+        self._async_waiter = None
+
+        self.closed = False
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return min(self._head - self._tail, self.slots)
+
+    def empty(self) -> bool:
+        return self._head == self._tail
+
+    def put(self, data, meta: Any = None) -> bool:
+        """
+        Copy a chunk into the ring. Producer side only.
+
+        Returns:
+            False if the chunk was rejected because the ring is full
+        """
+        src = memoryview(data)
+        if src.format != 'B' or src.ndim != 1:
+            src = src.cast('B')
+
+        pieces = max(-(-len(src) // self.slot_bytes), 1)
+        if self.policy == POLICY_DROP_NEWEST and self._head - self._tail + pieces > self.slots:
+            # all slots of the chunk or none, half a frame is worse than a dropped one
+            self.dropped += pieces
+            return False
+
+        for offset in range(0, pieces * self.slot_bytes, self.slot_bytes):
+            piece = src[offset:offset + self.slot_bytes]
+            seq = self._head
+            i = seq % self.slots
+            start = i * self.slot_bytes
+            self._seq[i] = -1  # mark as being written
+            self._view[start:start + len(piece)] = piece
+            self._lengths[i] = len(piece)
+            self._meta[i] = meta
+            self._seq[i] = seq
+            self._head = seq + 1
+
+        if self._waiting:
+            # one wakeup per wait is enough
+            self._waiting = False
+            self.wakeup()
+        return True
+
+    def get_nowait(self) -> Optional[Tuple[bytes, Any]]:
+        """
+        Take the oldest chunk out of the ring. Consumer side only.
+
+        Returns:
+            (data, meta), or None if the ring is empty
+        """
+        while self._tail < self._head:
+            seq = self._tail
+            if self._head - seq > self.slots:
+                # the producer lapped us, skip to the oldest chunk still in the ring
+                skipped = self._head - self.slots - seq
+                self.dropped += skipped
+                self._tail = seq + skipped
+                continue
+
+            i = seq % self.slots
+            if self._seq[i] != seq:
+                self._tail = seq + 1
+                self.dropped += 1
+                continue
+
+            start = i * self.slot_bytes
+            data = bytes(self._view[start:start + self._lengths[i]])
+            meta = self._meta[i]
+
+            if self._seq[i] != seq:
+                # overwritten while copying
+                self._tail = seq + 1
+                self.dropped += 1
+                continue
+
+            self._tail = seq + 1
+            return data, meta
+        return None
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[bytes, Any]]:
+        """
+        Take the oldest chunk, blocking the calling thread for up to `timeout` seconds.
+        """
+        item = self.get_nowait()
+        if item is not None or timeout == 0:
+            return item
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._event.clear()
+            self._waiting = True
+            try:
+                item = self.get_nowait()
+                if item is not None or self.closed:
+                    return item
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._event.wait(remaining)
+            finally:
+                self._waiting = False
+
+            item = self.get_nowait()
+            if item is not None or self.closed or (deadline is not None and time.monotonic() >= deadline):
+                return item
+
+    async def get_async(self, loop: asyncio.AbstractEventLoop, timeout: Optional[float] = None) -> Optional[Tuple[bytes, Any]]:
+        """
+        Take the oldest chunk from a coroutine running on `loop`, waiting up to `timeout` seconds.
+        """
+        item = self.get_nowait()
+        if item is not None:
+            return item
+
+        waiter = asyncio.Event()
+        self._async_waiter = (loop, waiter)
+        self._waiting = True
+        try:
+            item = self.get_nowait()
+            if item is not None or self.closed:
+                return item
+            try:
+                await asyncio.wait_for(waiter.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            self._waiting = False
+            self._async_waiter = None
+        return self.get_nowait()
+
+    def close(self) -> None:
+        """
+        Signal the consumer that no more audio will be produced.
+        """
+        self.closed = True
+        self.wakeup()
+
+    def wakeup(self) -> None:
+        """
+        Wake up a waiting consumer.
+        """
+        self._event.set()
+        async_waiter = self._async_waiter
+        if async_waiter:
+            loop, waiter = async_waiter
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(waiter.set)
@@ -0,0 +1,47 @@
+import collections
+from time import time
+from typing import List, Optional
+
+
+class ReplayBuffer:
+    """
+    Bounded buffer for audio captured while no transcription stream is ready.
+
+    Chunks are kept with the time they were captured, so once the new stream is
+    ready the first buffered chunk can be used as the stream's first frame time.
+    When more than `max_ms` of audio is buffered the oldest chunks are dropped.
+    """
+
+    def __init__(self, sample_rate: int, max_ms: int = 5000, bytes_per_sample: int = 2):
+        self.bytes_per_ms = sample_rate * bytes_per_sample / 1000
+        self.max_ms = max_ms
+
+        self.chunks = collections.deque()
+        self.buffered_bytes = 0
+        self.dropped_ms = 0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def duration_ms(self) -> int:
+        return int(self.buffered_bytes / self.bytes_per_ms)
+
+    @property
+    def first_captured_at(self) -> Optional[int]:
+        """the timestamp(us) the oldest buffered chunk was captured at"""
+        return self.chunks[0][1] if self.chunks else None
+
+    def append(self, chunk: bytes, captured_at: Optional[int] = None) -> None:
+        self.chunks.append((chunk, captured_at or int(time() * 1000_000)))
+        self.buffered_bytes += len(chunk)
+        while self.duration_ms > self.max_ms and len(self.chunks) > 1:
+            dropped, _ = self.chunks.popleft()
+            self.buffered_bytes -= len(dropped)
+            self.dropped_ms += int(len(dropped) / self.bytes_per_ms)
+
+    def drain(self) -> List[bytes]:
+        chunks = [chunk for chunk, _ in self.chunks]
+        self.chunks.clear()
+        self.buffered_bytes = 0
+        return chunks
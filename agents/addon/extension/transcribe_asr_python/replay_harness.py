@@ -0,0 +1,198 @@
+"""
+Replay a WAV or raw PCM file through TranscribeAsrExtension against the offline fake service,
+and report enqueue latency, time to first partial and final results, and dropped frames.
+
+Run from agents/addon/extension, with the rte python binding importable:
+
+    python -m transcribe_asr_python.replay_harness speech.wav --speed 1 --streams 4 \
+        --text "hello there" "how can I help you"
+"""
+import argparse
+import json
+import threading
+import wave
+from time import monotonic, sleep
+from typing import Dict, List, Tuple
+
+from rte import Cmd, PcmFrame, PcmFrameDataFmt
+
+from .fake_transcribe import FakeTranscribeStreamingClient, split_script
+from .transcribe_asr_extension import TranscribeAsrExtension
+
+FRAME_MS = 10
+BYTES_PER_SAMPLE = 2
+
+
+class RecordingRteEnv:
+    """the part of RteEnv the extension uses, properties come from a dict and text_data is recorded"""
+
+    def __init__(self, properties: dict):
+        self.properties = properties
+        self.results: List[Tuple[float, int, str, bool]] = []  # (received_at, stream_id, text, is_final)
+        self.lock = threading.Lock()
+
+    def __get(self, key: str):
+        if key not in self.properties:
+            raise KeyError(key)
+        return self.properties[key]
+
+    def get_property_string(self, key: str) -> str:
+        return str(self.__get(key))
+
+    def get_property_int(self, key: str) -> int:
+        return int(self.__get(key))
+
+    def get_property_bool(self, key: str) -> bool:
+        return bool(self.__get(key))
+
+    def send_data(self, data) -> None:
+        with self.lock:
+            self.results.append((monotonic(), data.get_property_int("stream_id"),
+                                 data.get_property_string("text"), data.get_property_bool("is_final")))
+
+    def return_result(self, result, cmd) -> None:
+        pass
+
+    def on_start_done(self) -> None:
+        pass
+
+    def on_stop_done(self) -> None:
+        pass
+
+
+def read_audio(path: str, sample_rate: int) -> Tuple[bytes, int]:
+    """16-bit mono PCM of a WAV file, or of a raw PCM file at sample_rate"""
+    if not path.endswith(".wav"):
+        with open(path, "rb") as f:
+            return f.read(), sample_rate
+
+    with wave.open(path, "rb") as w:
+        if w.getsampwidth() != BYTES_PER_SAMPLE or w.getnchannels() != 1:
+            raise ValueError(f"{path}: only 16-bit mono WAV is supported")
+        return w.readframes(w.getnframes()), w.getframerate()
+
+
+def create_frame(data: bytes, sample_rate: int, stream_id: int) -> PcmFrame:
+    f = PcmFrame.create("pcm_frame")
+    f.set_sample_rate(sample_rate)
+    f.set_bytes_per_sample(BYTES_PER_SAMPLE)
+    f.set_number_of_channels(1)
+    f.set_data_fmt(PcmFrameDataFmt.INTERLEAVE)
+    f.set_samples_per_channel(len(data) // BYTES_PER_SAMPLE)
+    f.set_property_int("stream_id", stream_id)
+    f.alloc_buf(len(data))
+    buff = f.lock_buf()
+    buff[:] = data
+    f.unlock_buf(buff)
+    return f
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: round(values[round(q * (len(values) - 1))], 2)
+    return {"count": len(values), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(values[-1], 2)}
+
+
+def replay(args) -> dict:
+    audio, sample_rate = read_audio(args.input, args.sample_rate)
+    frame_bytes = sample_rate * BYTES_PER_SAMPLE * FRAME_MS // 1000
+    frames = [audio[i:i + frame_bytes] for i in range(0, len(audio) - frame_bytes + 1, frame_bytes)]
+    duration_ms = len(frames) * FRAME_MS
+
+    script = split_script(args.text, duration_ms)
+    client = FakeTranscribeStreamingClient(script, start_latency_ms=args.start_latency_ms,
+                                           partial_interval_ms=args.partial_interval_ms,
+                                           result_latency_ms=args.result_latency_ms)
+
+    properties = {"sample_rate": str(sample_rate), "max_streams": args.streams}
+    properties.update(json.loads(args.properties))
+    rte = RecordingRteEnv(properties)
+    ext = TranscribeAsrExtension("transcribe_asr")
+    ext.transcribe_client = client
+    ext.on_start(rte)
+    if args.prewarm:
+        ext.on_cmd(rte, Cmd.create("on_user_joined"))
+
+    # frames are fed at the given speed on a monotonic clock, 0 feeds as fast as possible
+    stream_ids = list(range(1, args.streams + 1))
+    fed_at = []
+    enqueue_ms = []
+    started = monotonic()
+    for i, frame in enumerate(frames):
+        if args.speed > 0:
+            delay = started + i * FRAME_MS / 1000 / args.speed - monotonic()
+            if delay > 0:
+                sleep(delay)
+        pcm_frames = [create_frame(frame, sample_rate, stream_id) for stream_id in stream_ids]
+        fed_at.append(monotonic())
+        for pcm_frame in pcm_frames:
+            t = monotonic()
+            ext.on_pcm_frame(rte, pcm_frame)
+            enqueue_ms.append((monotonic() - t) * 1000)
+
+    # wait for the finals of the script before stopping
+    deadline = monotonic() + args.drain_s
+    while monotonic() < deadline:
+        with rte.lock:
+            finals = sum(1 for _, _, _, is_final in rte.results if is_final)
+        if finals >= len(script) * len(stream_ids):
+            break
+        sleep(0.05)
+    rings = [session.ring for session in list(ext.sessions.values())]
+    ext.on_stop(rte)
+
+    # the n-th final of a stream belongs to the n-th utterance, partials to the utterance that is not final yet
+    def fed_at_ms(audio_ms: int) -> float:
+        return fed_at[min(len(fed_at) - 1, max(0, audio_ms // FRAME_MS - 1))]
+
+    first_partial_ms, final_ms = [], []
+    for stream_id in stream_ids:
+        utterance, seen_partial = 0, False
+        for received_at, result_stream_id, _, is_final in rte.results:
+            if result_stream_id != stream_id or utterance >= len(script):
+                continue
+            if is_final:
+                final_ms.append((received_at - fed_at_ms(script[utterance].end_ms)) * 1000)
+                utterance, seen_partial = utterance + 1, False
+            elif not seen_partial:
+                first_partial_ms.append((received_at - fed_at_ms(script[utterance].start_ms + FRAME_MS)) * 1000)
+                seen_partial = True
+
+    metrics = ext.metrics.snapshot()
+    return {
+        "audio_ms": duration_ms,
+        "frames_fed": len(frames) * len(stream_ids),
+        "frames_dropped": sum(ring.dropped for ring in rings) + metrics.get("frames_rejected", 0),
+        "replay_dropped_ms": metrics.get("replay_dropped_ms", 0),
+        "finals": sum(1 for _, _, _, is_final in rte.results if is_final),
+        "finals_expected": len(script) * len(stream_ids),
+        "enqueue_ms": percentiles(enqueue_ms),
+        "first_partial_ms": percentiles(first_partial_ms),
+        "final_ms": percentiles(final_ms),
+        "metrics": metrics,
+    }
+
+
+def process_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("input", help="16-bit mono WAV file, or raw PCM at --sample-rate")
+    parser.add_argument("--sample-rate", type=int, default=16000, help="sample rate of raw PCM input")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 is real time, 0 as fast as possible")
+    parser.add_argument("--streams", type=int, default=1, help="number of speakers replaying the file at once")
+    parser.add_argument("--text", nargs="+", default=["hello there", "how can I help you today"],
+                        help="utterances recognized, spread evenly over the audio")
+    parser.add_argument("--start-latency-ms", type=int, default=200, help="time to open a stream")
+    parser.add_argument("--partial-interval-ms", type=int, default=200, help="audio between two partial results")
+    parser.add_argument("--result-latency-ms", type=int, default=300, help="time from the audio to its result")
+    parser.add_argument("--prewarm", action="store_true", help="send on_user_joined before the audio")
+    parser.add_argument("--drain-s", type=float, default=5.0, help="wait for missing finals at most this long")
+    parser.add_argument("--properties", default="{}", help="extension properties as json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    print(json.dumps(replay(process_args()), indent=2))
@@ -0,0 +1,202 @@
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from amazon_transcribe.model import StartStreamTranscriptionEventStream
+
+from .log import logger
+from .metrics import Metrics
+
+# (region, lang_code, sample_rate, media_encoding, enable_partial_results_stabilization)
+StreamKey = Tuple[str, str, int, str, bool]
+
+# Amazon Transcribe ends a streaming session after 4 hours
+STREAM_DURATION_LIMIT_S = 4 * 3600
+# and after 15 seconds without audio
+STREAM_AUDIO_TIMEOUT_S = 15
+
+
+class PooledStream:
+    """
+    An opened transcription stream and the amount of audio it has seen.
+
+    `audio_ms` counts the keep-alive silence sent before the stream was handed
+    out. Result times are relative to the start of the stream's audio, so the
+    first real frame sits at `audio_ms` in the stream's timeline.
+    """
+
+    def __init__(self, key: StreamKey, stream: StartStreamTranscriptionEventStream):
+        self.key = key
+        self.stream = stream
+        self.opened_at = time.monotonic()
+        self.audio_ms = 0
+
+    @property
+    def age_s(self) -> float:
+        return time.monotonic() - self.opened_at
+
+    async def send_silence(self, duration_ms: int) -> None:
+        sample_rate = self.key[2]
+        # counted before the send, the stream can be handed out while it is awaited
+        self.audio_ms += duration_ms
+        await self.stream.input_stream.send_audio_event(audio_chunk=bytes(sample_rate * duration_ms // 1000 * 2))
+
+    async def close(self) -> None:
+        try:
+            await self.stream.input_stream.end_stream()
+        except Exception as e:
+            logger.debug(f"Error ending pooled stream: {e}")
+
+
+class TranscribeStreamPool:
+    """
+    Pre-opened transcription streams, keyed by the stream parameters.
+
+    Opening a stream costs a TLS handshake and the service's stream setup, so
+    `size` streams per key are opened ahead of time and kept alive by sending a
+    short chunk of silence every `keepalive_interval_s`. `acquire` hands out an
+    idle stream and opens a replacement in the background. Idle streams older
+    than `max_age_s` are closed and replaced well before the service's stream
+    duration limit.
+
+    Streams are bound to the event loop they were opened on, so there is one
+    pool per loop, see `get_stream_pool`.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, size: int = 0, keepalive_interval_s: float = 5.0,
+                 keepalive_chunk_ms: int = 100, max_age_s: float = STREAM_DURATION_LIMIT_S - 300,
+                 metrics: Optional[Metrics] = None):
+        self.loop = loop
+        self.size = size
+        self.keepalive_interval_s = keepalive_interval_s
+        self.keepalive_chunk_ms = keepalive_chunk_ms
+        self.max_age_s = max_age_s
+        self.metrics = metrics
+
+        self._idle: Dict[StreamKey, List[PooledStream]] = {}
+        self._openers: Dict[StreamKey, Callable[[], Awaitable[StartStreamTranscriptionEventStream]]] = {}
+        self._opening: Dict[StreamKey, int] = {}
+        self._keepalive_task = None
+        self._closed = False
+
+    async def acquire(self, key: StreamKey, opener: Callable[[], Awaitable[StartStreamTranscriptionEventStream]]) -> PooledStream:
+        """
+        Take an opened stream for `key`, opening one now if none is ready.
+        """
+        self._openers[key] = opener
+        idle = self._idle.get(key, [])
+        pooled = None
+        while idle and pooled is None:
+            candidate = idle.pop(0)
+            if candidate.age_s < self.max_age_s:
+                pooled = candidate
+            else:
+                asyncio.create_task(candidate.close())
+
+        if pooled:
+            self.__incr("stream_pool_hit")
+        else:
+            self.__incr("stream_pool_miss")
+            pooled = await self.__open(key, opener)
+        self.prewarm(key, opener)
+        return pooled
+
+    def prewarm(self, key: StreamKey, opener: Optional[Callable[[], Awaitable[StartStreamTranscriptionEventStream]]] = None) -> None:
+        """
+        Open streams for `key` in the background until `size` are idle. Must be called on the pool's loop.
+        """
+        if opener:
+            self._openers[key] = opener
+        opener = self._openers.get(key)
+        if self._closed or opener is None:
+            return
+        missing = self.size - len(self._idle.get(key, [])) - self._opening.get(key, 0)
+        for _ in range(missing):
+            self._opening[key] = self._opening.get(key, 0) + 1
+            asyncio.create_task(self.__open_idle(key, opener))
+        if self.size > 0 and self._keepalive_task is None:
+            self._keepalive_task = asyncio.create_task(self.__keepalive())
+
+    async def close(self) -> None:
+        """
+        Close all idle streams and stop keeping them alive.
+        """
+        self._closed = True
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        idle = [pooled for streams in self._idle.values() for pooled in streams]
+        self._idle.clear()
+        for pooled in idle:
+            await pooled.close()
+        with _pools_lock:
+            if _pools.get(self.loop) is self:
+                del _pools[self.loop]
+
+    async def __open(self, key: StreamKey, opener) -> PooledStream:
+        start = time.time()
+        stream = await opener()
+        open_ms = (time.time() - start) * 1000
+        logger.info(f"Opened transcribe stream {key} in {open_ms:.0f}ms")
+        if self.metrics:
+            self.metrics.observe("stream_open_ms", open_ms)
+        return PooledStream(key, stream)
+
+    async def __open_idle(self, key: StreamKey, opener) -> None:
+        try:
+            pooled = await self.__open(key, opener)
+            if self._closed:
+                await pooled.close()
+                return
+            self._idle.setdefault(key, []).append(pooled)
+        except Exception as e:
+            logger.warning(f"Failed to pre-open transcribe stream {key}: {e}")
+            self.__incr("stream_pool_open_failed")
+        finally:
+            self._opening[key] -= 1
+
+    async def __keepalive(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(self.keepalive_interval_s)
+            for key, idle in list(self._idle.items()):
+                for pooled in list(idle):
+                    # acquire may have handed the stream out while an earlier one was awaited,
+                    # silence must not end up in the audio of a session
+                    if pooled not in idle:
+                        continue
+                    if pooled.age_s >= self.max_age_s:
+                        logger.info(f"Recycling idle transcribe stream {key} after {pooled.age_s:.0f}s")
+                        idle.remove(pooled)
+                        self.__incr("stream_pool_recycled")
+                        await pooled.close()
+                        continue
+                    try:
+                        await pooled.send_silence(self.keepalive_chunk_ms)
+                    except Exception as e:
+                        logger.warning(f"Dropping idle transcribe stream {key}: {e}")
+                        if pooled in idle:
+                            idle.remove(pooled)
+                        await pooled.close()
+                self.prewarm(key)
+
+    def __incr(self, key: str) -> None:
+        if self.metrics:
+            self.metrics.incr(key)
+
+
+_pools: Dict[asyncio.AbstractEventLoop, TranscribeStreamPool] = {}
+# sessions are created on the RTE thread while pools are closed on their loop's thread
+_pools_lock = threading.Lock()
+
+
+def get_stream_pool(loop: asyncio.AbstractEventLoop, **kwargs) -> TranscribeStreamPool:
+    """
+    Get the stream pool of an event loop, creating it with `kwargs` on first use.
+    """
+    with _pools_lock:
+        pool = _pools.get(loop)
+        if pool is None:
+            pool = TranscribeStreamPool(loop, **kwargs)
+            _pools[loop] = pool
+        return pool
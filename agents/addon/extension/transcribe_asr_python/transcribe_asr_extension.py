@@ -10,9 +10,14 @@ from rte import (
 import json
 import asyncio
 import threading
+import time
 
 from .log import logger
-from .transcribe_wrapper import AsyncTranscribeWrapper, TranscribeConfig
+from .transcribe_wrapper import AsyncTranscribeWrapper, TranscribeConfig, get_stream_key, start_transcribe_stream
+from .client_cache import get_transcribe_client
+from .pcm_ring_buffer import PcmRingBuffer, POLICIES, POLICY_DROP_NEWEST, POLICY_DROP_OLDEST
+from .stream_pool import get_stream_pool
+from .metrics import Metrics
 
 PROPERTY_REGION = "region"  # Optional
 PROPERTY_ACCESS_KEY = "access_key"  # Optional
@@ -20,21 +25,54 @@ PROPERTY_SECRET_KEY = "secret_key"  # Optional
 PROPERTY_SAMPLE_RATE = 'sample_rate'# Optional
 PROPERTY_LANG_CODE = 'lang_code'    # Optional
 PROPERTY_PARTIAL_STABLE = 'enable_partial_results_stabilization' # Optional
+PROPERTY_STREAM_POOL_SIZE = 'stream_pool_size' # Optional
+PROPERTY_STREAM_MAX_AGE_S = 'stream_max_age_s' # Optional
+PROPERTY_REPLAY_BUFFER_MS = 'replay_buffer_ms' # Optional
+PROPERTY_AUDIO_EVENT_MS = 'audio_event_ms' # Optional
+PROPERTY_AUDIO_EVENT_MAX_DELAY_MS = 'audio_event_max_delay_ms' # Optional
+PROPERTY_MAX_STREAMS = 'max_streams' # Optional
+PROPERTY_PARTIAL_DEDUP = 'partial_dedup' # Optional
+PROPERTY_PARTIAL_MIN_INTERVAL_MS = 'partial_min_interval_ms' # Optional
+PROPERTY_OVERLOAD_POLICY = 'overload_policy' # Optional
+PROPERTY_WORD_TIMINGS = 'enable_word_timings' # Optional
+
+FRAME_PROPERTY_STREAM_ID = 'stream_id'
+DEFAULT_STREAM_ID = 0
+
+FRAME_RING_SLOTS = 3000 # about 3000 * 10ms = 30s input per stream
+FRAME_RING_SLOT_BYTES = 640 # 20ms of 16-bit mono at 16kHz, larger frames span several slots
+DEFAULT_MAX_STREAMS = 16
+STOP_TIMEOUT_S = 10.0
+
+RECOVERED_WATERMARK = 0.5 # a backed up ring counts as recovered once it is less than half full
 
 class TranscribeAsrExtension(Extension):
     def __init__(self, name: str):
         super().__init__(name)
 
         self.stopped = False
-        self.queue = asyncio.Queue(maxsize=3000) # about 3000 * 10ms = 30s input
-        self.transcribe = None
+        self.rte = None
+        self.transcribe_config = None
+        self.transcribe_client = None
+        self.metrics = Metrics("transcribe_asr")
+        self.max_streams = DEFAULT_MAX_STREAMS
+        self.overload_policy = POLICY_DROP_NEWEST
         self.thread = None
 
+        # one transcription session per source stream, keyed by the frame's stream_id, all on one shared loop.
+        # each session has its own lock-free ring from the rte thread, so a slow stream only drops its own frames
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        self.rejected_streams = set()
+        # user ids of the last on_user_joined, the default stream is transcribed on behalf of that user
+        self.user_id = "0"
+        self.remote_user_id = "0"
+
         self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
 
     def on_start(self, rte: RteEnv) -> None:
         logger.info("TranscribeAsrExtension on_start")
+        start = time.time()
 
         transcribe_config = TranscribeConfig.default_config()
 
@@ -46,35 +84,142 @@ class TranscribeAsrExtension(Extension):
                     transcribe_config.__setattr__(optional_param, value)
             except Exception as err:
                 logger.debug(f"GetProperty optional {optional_param} failed, err: {err}. Using default value: {transcribe_config.__getattribute__(optional_param)}")
+        # the sample rate is configured as a string, buffers and the stream need a number
+        transcribe_config.sample_rate = int(transcribe_config.sample_rate)
 
-        for optional_param in [PROPERTY_PARTIAL_STABLE]:
+        for optional_param in [PROPERTY_PARTIAL_STABLE, PROPERTY_PARTIAL_DEDUP, PROPERTY_WORD_TIMINGS]:
             try:
                 value = rte.get_property_bool(optional_param)
                 transcribe_config.__setattr__(optional_param, value)
             except Exception as err:
                 logger.debug(f"GetProperty optional {optional_param} failed, err: {err}. Using default value: {transcribe_config.__getattribute__(optional_param)}")
 
-        self.transcribe = AsyncTranscribeWrapper(transcribe_config, self.queue, rte, self.loop)
+        for optional_param in [PROPERTY_STREAM_POOL_SIZE, PROPERTY_STREAM_MAX_AGE_S, PROPERTY_REPLAY_BUFFER_MS,
+                PROPERTY_AUDIO_EVENT_MS, PROPERTY_AUDIO_EVENT_MAX_DELAY_MS, PROPERTY_PARTIAL_MIN_INTERVAL_MS]:
+            try:
+                value = rte.get_property_int(optional_param)
+                if value > 0 or (optional_param in [PROPERTY_STREAM_POOL_SIZE, PROPERTY_AUDIO_EVENT_MAX_DELAY_MS,
+                                                    PROPERTY_PARTIAL_MIN_INTERVAL_MS] and value == 0):
+                    transcribe_config.__setattr__(optional_param, value)
+            except Exception as err:
+                logger.debug(f"GetProperty optional {optional_param} failed, err: {err}. Using default value: {transcribe_config.__getattribute__(optional_param)}")
+
+        try:
+            value = rte.get_property_int(PROPERTY_MAX_STREAMS)
+            if value > 0:
+                self.max_streams = value
+        except Exception as err:
+            logger.debug(f"GetProperty optional {PROPERTY_MAX_STREAMS} failed, err: {err}. Using default value: {self.max_streams}")
+
+        try:
+            value = rte.get_property_string(PROPERTY_OVERLOAD_POLICY).strip()
+            if value in POLICIES:
+                self.overload_policy = value
+            elif value:
+                logger.warning(f"Invalid {PROPERTY_OVERLOAD_POLICY} '{value}', must be one of {POLICIES}. Using default value: {self.overload_policy}")
+        except Exception as err:
+            logger.debug(f"GetProperty optional {PROPERTY_OVERLOAD_POLICY} failed, err: {err}. Using default value: {self.overload_policy}")
+
+        self.rte = rte
+        self.transcribe_config = transcribe_config
+        # clients are shared per process, so only the first session pays for client and credentials setup
+        if self.transcribe_client is None:
+            self.transcribe_client = get_transcribe_client(transcribe_config, self.metrics)
+        get_stream_pool(self.loop, size=transcribe_config.stream_pool_size,
+                        max_age_s=transcribe_config.stream_max_age_s, metrics=self.metrics)
 
-        logger.info("Starting async_transcribe_wrapper thread")
-        self.thread = threading.Thread(target=self.transcribe.run, args=[])
+        logger.info("Starting transcribe loop thread")
+        self.thread = threading.Thread(target=self.run_loop, args=[])
         self.thread.start()
 
+        self.metrics.observe("startup_ms", (time.time() - start) * 1000)
         rte.on_start_done()
 
+    def run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        logger.info("transcribe loop thread completed.")
+
+    def get_stream_id(self, pcm_frame: PcmFrame) -> int:
+        try:
+            return pcm_frame.get_property_int(FRAME_PROPERTY_STREAM_ID)
+        except Exception:
+            return DEFAULT_STREAM_ID
+
+    def get_session(self, stream_id: int) -> AsyncTranscribeWrapper:
+        """get the session of a stream, starting it on the shared loop on first use. Returns None when full"""
+        with self.sessions_lock:
+            session = self.sessions.get(stream_id)
+            if session or self.stopped:
+                return session
+
+            if len(self.sessions) >= self.max_streams:
+                self.metrics.incr("frames_rejected")
+                if stream_id not in self.rejected_streams:
+                    self.rejected_streams.add(stream_id)
+                    logger.warning(f"{len(self.sessions)} streams already transcribed, dropping frames of stream {stream_id}")
+                return None
+            self.rejected_streams.discard(stream_id)
+
+            ring = PcmRingBuffer(FRAME_RING_SLOTS, FRAME_RING_SLOT_BYTES, policy=self.overload_policy)
+            session = AsyncTranscribeWrapper(self.transcribe_config, ring, self.rte, self.loop,
+                                             transcribe_client=self.transcribe_client, metrics=self.metrics,
+                                             stream_id=stream_id)
+            if stream_id == DEFAULT_STREAM_ID:
+                session.set_user_id(self.user_id, self.remote_user_id)
+            self.sessions[stream_id] = session
+            self.metrics.gauge("active_streams", len(self.sessions))
+
+        logger.info(f"start transcribe session for stream {stream_id}, {len(self.sessions)} sessions active")
+        self.loop.call_soon_threadsafe(self.start_session, session)
+        return session
+
+    def start_session(self, session: AsyncTranscribeWrapper) -> None:
+        session.task = asyncio.create_task(session.transcribe_loop())
+        session.task.add_done_callback(lambda _: self.remove_session(session))
+
+    def remove_session(self, session: AsyncTranscribeWrapper) -> None:
+        with self.sessions_lock:
+            if self.sessions.get(session.stream_id) is session:
+                del self.sessions[session.stream_id]
+            self.metrics.gauge("active_streams", len(self.sessions))
+        logger.info(f"transcribe session for stream {session.stream_id} ended")
+
     def put_pcm_frame(self, pcm_frame: PcmFrame) -> None:
-        if self.loop.is_closed():
-            logger.warning("Event loop is closed, cannot enqueue frame")
+        if self.stopped:
+            logger.warning("Extension stopped, cannot enqueue frame")
             return
 
         try:
-            asyncio.run_coroutine_threadsafe(self.queue.put(pcm_frame), self.loop).result(timeout=0.1)
-        except asyncio.QueueFull:
-            logger.exception("Queue is full, dropping frame")
-        except asyncio.TimeoutError:
-            logger.warning("Timeout while putting frame in queue")
+            frame_buf = pcm_frame.get_buf()
+            if not frame_buf:
+                logger.warning("put_pcm_frame: empty pcm_frame detected.")
+                return
+
+            stream_id = self.get_stream_id(pcm_frame)
+            session = self.get_session(stream_id)
+            if session is None:
+                return
+
+            start = time.perf_counter()
+            ring = session.ring
+            depth = len(ring)
+            # a full drop_oldest ring overwrites its oldest frame instead of rejecting this one
+            overwrite = self.overload_policy == POLICY_DROP_OLDEST and depth >= ring.slots
+            dropped = not ring.put(frame_buf) or overwrite
+
+            self.metrics.observe("enqueue_us", (time.perf_counter() - start) * 1000_000)
+            self.metrics.observe("ring_depth", depth)
+            if dropped:
+                self.metrics.incr(f"frames_dropped_{self.overload_policy}")
+                if not session.overloaded:
+                    session.overloaded = True
+                    logger.warning(f"Ring of stream {stream_id} is backed up ({depth} frames), dropping frames ({self.overload_policy})")
+            elif session.overloaded and depth < ring.slots * RECOVERED_WATERMARK:
+                session.overloaded = False
+                logger.info(f"Ring of stream {stream_id} recovered, {self.metrics.get_counter(f'frames_dropped_{self.overload_policy}')} frames dropped so far")
         except Exception as e:
-            logger.exception(f"Error putting frame in queue: {e}")
+            logger.exception(f"Error putting frame in ring: {e}")
 
     def on_pcm_frame(self, rte: RteEnv, pcm_frame: PcmFrame) -> None:
         self.put_pcm_frame(pcm_frame=pcm_frame)
@@ -82,15 +227,34 @@ class TranscribeAsrExtension(Extension):
     def on_stop(self, rte: RteEnv) -> None:
         logger.info("TranscribeAsrExtension on_stop")
 
-        # put an empty frame to stop transcribe_wrapper
-        self.put_pcm_frame(None)
-        self.stopped = True
-        self.thread.join()
-        self.loop.stop()
+        # close the rings to stop the sessions once their buffered frames are sent
+        with self.sessions_lock:
+            self.stopped = True
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.ring.close()
+
+        if self.thread:
+            try:
+                asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout=STOP_TIMEOUT_S)
+            except Exception as e:
+                logger.warning(f"Error stopping transcribe sessions: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
         self.loop.close()
 
         rte.on_stop_done()
 
+    def prewarm(self) -> None:
+        get_stream_pool(self.loop).prewarm(get_stream_key(self.transcribe_config),
+                                           lambda: start_transcribe_stream(self.transcribe_client, self.transcribe_config))
+
+    async def shutdown(self) -> None:
+        tasks = [session.task for session in list(self.sessions.values()) if session.task]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await get_stream_pool(self.loop).close()
+
     def on_cmd(self, rte: RteEnv, cmd: Cmd) -> None:
         logger.info("TranscribeAsrExtension on_cmd")
         cmd_json = cmd.to_json()
@@ -101,7 +265,19 @@ class TranscribeAsrExtension(Extension):
             cmdName = cmd.get_name()
             logger.info("got cmd %s" % cmdName)
             if cmdName == "on_user_joined":
-                self.transcribe.set_user_id(cmd_json.get('user_id', '0'), cmd_json.get('remote_user_id', '0'))
+                self.user_id, self.remote_user_id = cmd_json.get('user_id', '0'), cmd_json.get('remote_user_id', '0')
+                with self.sessions_lock:
+                    session = self.sessions.get(DEFAULT_STREAM_ID)
+                if session:
+                    session.set_user_id(self.user_id, self.remote_user_id)
+                # speculatively open a stream so the user's first words do not wait for stream setup
+                self.loop.call_soon_threadsafe(self.prewarm)
+            elif cmdName == "on_user_left":
+                # the stream of the user that left, frames of the default stream keep their session
+                with self.sessions_lock:
+                    session = self.sessions.get(int(cmd_json.get('remote_user_id', DEFAULT_STREAM_ID) or DEFAULT_STREAM_ID))
+                if session and session.stream_id != DEFAULT_STREAM_ID:
+                    session.ring.close()
 
             cmd_result = CmdResult.create(StatusCode.OK)
             cmd_result.set_property_string("detail", "success")
@@ -7,7 +7,15 @@ class TranscribeConfig:
             secret_key: str, 
             sample_rate: Union[str, int],
             lang_code: str,
-            enable_partial_results_stabilization: bool):
+            enable_partial_results_stabilization: bool,
+            stream_pool_size: int = 0,
+            stream_max_age_s: int = 14100,
+            replay_buffer_ms: int = 5000,
+            audio_event_ms: int = 50,
+            audio_event_max_delay_ms: int = 100,
+            partial_dedup: bool = False,
+            partial_min_interval_ms: int = 0,
+            enable_word_timings: bool = False):
         self.region = region
         self.access_key = access_key
         self.secret_key = secret_key
@@ -21,6 +29,26 @@ class TranscribeConfig:
 
         self.enable_partial_results_stabilization = enable_partial_results_stabilization
 
+        # number of pre-opened streams kept alive per stream parameters, and when to replace a stream
+        # before the 4 hour service limit
+        self.stream_pool_size = int(stream_pool_size)
+        self.stream_max_age_s = int(stream_max_age_s)
+
+        # how much audio to hold while a stream is being created
+        self.replay_buffer_ms = int(replay_buffer_ms)
+
+        # how much audio to pack into one audio event, and how long a frame may wait for the event to fill up
+        self.audio_event_ms = int(audio_event_ms)
+        self.audio_event_max_delay_ms = int(audio_event_max_delay_ms)
+
+        # drop partial results repeating the last one, and send at most one partial per interval, finals always pass.
+        # Both off by default, every partial is sent
+        self.partial_dedup = partial_dedup
+        self.partial_min_interval_ms = int(partial_min_interval_ms)
+
+        # attach the timing and confidence of every word to text_data as a packed buffer
+        self.enable_word_timings = enable_word_timings
+
     @classmethod
     def default_config(cls):
         return cls(
@@ -29,5 +57,13 @@ class TranscribeConfig:
             secret_key="",
             sample_rate=16000,
             lang_code='en-US',
-            enable_partial_results_stabilization=False
+            enable_partial_results_stabilization=False,
+            stream_pool_size=0,
+            stream_max_age_s=14100,
+            replay_buffer_ms=5000,
+            audio_event_ms=50,
+            audio_event_max_delay_ms=100,
+            partial_dedup=False,
+            partial_min_interval_ms=0,
+            enable_word_timings=False
         )
\ No newline at end of file
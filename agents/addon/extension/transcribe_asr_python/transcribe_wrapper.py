@@ -1,19 +1,27 @@
 from typing import Union, List, Tuple, Optional
 import asyncio
-from time import time
+from time import time, monotonic
 
 from rte import (
     RteEnv,
     Data
 )
 
-from amazon_transcribe.auth import StaticCredentialResolver
 from amazon_transcribe.client import TranscribeStreamingClient
 from amazon_transcribe.handlers import TranscriptResultStreamHandler
 from amazon_transcribe.model import TranscriptEvent, TranscriptResultStream, StartStreamTranscriptionEventStream, Item
 
 from .log import logger
 from .transcribe_config import TranscribeConfig
+from .client_cache import get_transcribe_client
+from .pcm_ring_buffer import PcmRingBuffer
+from .stream_pool import PooledStream, StreamKey, get_stream_pool
+from .replay_buffer import ReplayBuffer
+from .coalescer import AudioCoalescer
+from .item_splitter import IncrementalItemSplitter
+from .emission_policy import PartialEmissionPolicy, EMIT, SUPPRESS_RATE
+from .word_timings import pack_word_timings
+from .metrics import Metrics
 
 DATA_OUT_TEXT_DATA_PROPERTY_LANGUAGE = "language"
 DATA_OUT_TEXT_DATA_PROPERTY_TEXT = "text"
@@ -24,47 +32,88 @@ DATA_OUT_TEXT_DATA_PROPERTY_STREAM_ID = "stream_id"
 DATA_OUT_TEXT_DATA_PROPERTY_EOS = "end_of_segment"
 DATA_OUT_TEXT_DATA_PROPERTY_TIME = "time" # timestamp, ms
 DATA_OUT_TEXT_DATA_PROPERTY_DURATION_MS = "duration_ms"
+DATA_OUT_TEXT_DATA_PROPERTY_WORD_TIMINGS = "word_timings" # buf, see word_timings.py
+
+STREAM_POLL_INTERVAL_S = 0.05 # how often to check a pending stream creation while audio is buffered
+STREAM_RETRY_INTERVAL_S = 1.0 # wait before retrying a failed stream creation
+
+def get_stream_key(config: TranscribeConfig) -> StreamKey:
+    return (config.region, config.lang_code, config.sample_rate, config.media_encoding,
+            config.enable_partial_results_stabilization)
+
+async def start_transcribe_stream(client: TranscribeStreamingClient, config: TranscribeConfig) -> StartStreamTranscriptionEventStream:
+    stream = await client.start_stream_transcription(
+        language_code=config.lang_code,
+        media_sample_rate_hz=config.sample_rate,
+        media_encoding=config.media_encoding,
+        enable_partial_results_stabilization = config.enable_partial_results_stabilization
+    )
+    return stream
 
 class AsyncTranscribeWrapper():
-    def __init__(self, config: TranscribeConfig, queue: asyncio.Queue, rte:RteEnv, loop: asyncio.BaseEventLoop):
-        self.queue = queue
+    """
+    transcription of one audio stream, runs as a coroutine on a loop that may be shared with other streams
+
+    the client, metrics and stream pool can be shared between the streams of an extension
+    """
+    def __init__(self, config: TranscribeConfig, ring: PcmRingBuffer, rte:RteEnv, loop: asyncio.BaseEventLoop,
+                 transcribe_client: Optional[TranscribeStreamingClient] = None, metrics: Optional[Metrics] = None,
+                 stream_id: int = 0):
+        self.ring = ring
         self.rte = rte
-        self.stopped = False
         self.config = config
         self.loop = loop
+        self.stream_id = stream_id
         self.is_first_frame = True
+        self.metrics = metrics or Metrics("transcribe_asr")
+        self.user_id = "0"
+        self.remote_user_id = str(stream_id)
+        self.pool = get_stream_pool(loop, size=config.stream_pool_size, max_age_s=config.stream_max_age_s,
+                                    metrics=self.metrics)
 
-        if config.access_key and config.secret_key:
-            logger.info(f"init trascribe client with access key: {config.access_key}, lang_code: {self.config.lang_code}")
-            self.transcribe_client = TranscribeStreamingClient(
-                region=config.region,
-                credential_resolver=StaticCredentialResolver(
-                    access_key_id=config.access_key,
-                    secret_access_key=config.secret_key
-                )
-            )
-        else:
-            logger.info(f"init trascribe client without access key, using default credentials provider chain, lang_code: {self.config.lang_code}")
+        # audio captured while a stream is being created, replayed into the stream once it is ready
+        self.replay = ReplayBuffer(config.sample_rate, max_ms=config.replay_buffer_ms)
+        self.create_task = None
+        self.next_create_at = 0.0
+        self.retiring = set()
+
+        # set by the extension: the task running transcribe_loop on the shared loop,
+        # and whether frames of the stream are being dropped, to log once per overload
+        self.task = None
+        self.overloaded = False
+
+        # frames are packed into larger audio events, each event is framed and signed separately
+        self.coalescer = AudioCoalescer(config.sample_rate, event_ms=config.audio_event_ms,
+                                        max_delay_ms=config.audio_event_max_delay_ms)
 
-            self.transcribe_client = TranscribeStreamingClient(
-                region=config.region
-            )
+        self.transcribe_client = transcribe_client or get_transcribe_client(config, self.metrics)
 
-        asyncio.set_event_loop(self.loop)
         self.reset_stream()
 
     def set_user_id(self, user_id:str="0", remote_user_id:str="0"):
-        logger.info(f"set_user_id: {user_id}, {remote_user_id}")
+        logger.info(f"set_user_id: {user_id}, {remote_user_id}, stream {self.stream_id}")
         self.user_id = user_id
         self.remote_user_id = remote_user_id
 
+    def stream_key(self) -> StreamKey:
+        return get_stream_key(self.config)
+
+    def prewarm(self) -> None:
+        """open streams ahead of the first frame, must run on self.loop"""
+        self.pool.prewarm(self.stream_key(), self.get_transcribe_stream)
+
     def reset_stream(self):
+        self.pooled: Optional[PooledStream] = None
         self.stream = None
         self.handler = None
         self.event_handler_task = None
         self.is_first_frame = True
 
     async def cleanup(self):
+        if self.create_task:
+            await self.create_task
+            self.create_task = None
+
         if self.stream:
             await self.stream.input_stream.end_stream()
             logger.info("cleanup: stream ended.")
@@ -75,10 +124,32 @@ class AsyncTranscribeWrapper():
 
         self.reset_stream()
 
+        if self.retiring:
+            await asyncio.gather(*self.retiring, return_exceptions=True)
+
+    def retire_stream(self):
+        """end the current stream in the background, new audio goes to the replay buffer meanwhile"""
+        stream, event_handler_task = self.stream, self.event_handler_task
+        self.reset_stream()
+
+        async def end():
+            try:
+                await stream.input_stream.end_stream()
+                if event_handler_task:
+                    await event_handler_task
+                logger.info("retire_stream: stream ended.")
+            except Exception as e:
+                logger.warning(f"retire_stream: error ending stream: {e}")
+
+        task = asyncio.create_task(end())
+        self.retiring.add(task)
+        task.add_done_callback(self.retiring.discard)
+
     async def create_stream(self) -> bool:
         try:
-            self.stream = await self.get_transcribe_stream()
-            self.handler = TranscribeEventHandler(self.stream.output_stream, self.rte, self.config)
+            self.pooled = await self.pool.acquire(self.stream_key(), self.get_transcribe_stream)
+            self.stream = self.pooled.stream
+            self.handler = TranscribeEventHandler(self.stream.output_stream, self.rte, self.config, self.metrics)
             self.handler.set_user_id(self.user_id, self.remote_user_id)
             self.event_handler_task = asyncio.create_task(self.handler.handle_events())
         except Exception as e:
@@ -87,36 +158,105 @@ class AsyncTranscribeWrapper():
 
         return True
 
+    async def flush_replay(self, wait: bool = False) -> None:
+        """
+        create a stream for the buffered audio if needed, and replay the audio once the stream is ready
+
+        Args:
+            wait: wait for a pending stream creation instead of returning
+        """
+        if not self.stream or self.create_task:
+            if self.create_task is None:
+                if monotonic() < self.next_create_at:
+                    return
+                logger.info("lazy init stream.")
+                self.create_task = asyncio.create_task(self.create_stream())
+            if not self.create_task.done() and not wait:
+                return
+
+            created = await self.create_task
+            self.create_task = None
+            if not created:
+                self.metrics.incr("stream_create_failed")
+                self.next_create_at = monotonic() + STREAM_RETRY_INTERVAL_S
+                logger.warning(f"create stream failed, keeping {self.replay.duration_ms}ms of audio to replay")
+                return
+
+        if self.is_first_frame:
+            self.is_first_frame = False
+            # the first buffered chunk is the first frame of the stream, a pre-opened stream has already
+            # seen keep-alive silence and result times include it
+            self.handler.set_first_frame_time(self.replay.first_captured_at - self.pooled.audio_ms * 1000)
+
+        replay_ms = self.replay.duration_ms
+        audio = b''.join(self.replay.drain())
+        for offset in range(0, len(audio), self.coalescer.event_bytes):
+            await self.send_audio(audio[offset:offset + self.coalescer.event_bytes])
+        self.metrics.observe("replay_ms", replay_ms)
+        self.metrics.gauge("replay_buffered_ms", 0)
+
+    async def send_audio(self, chunk: bytes) -> None:
+        await self.stream.input_stream.send_audio_event(audio_chunk=chunk)
+        self.metrics.incr("audio_events")
+
+    async def send_coalesced(self) -> None:
+        """send the frames packed so far as one audio event"""
+        if self.coalescer:
+            await self.send_audio(self.coalescer.take())
+
     async def send_frame(self) -> None:
         self.is_first_frame = True
 
-        while not self.stopped:
+        while True:
             try:
-                pcm_frame = await asyncio.wait_for(self.queue.get(), timeout=10.0)
-
-                if pcm_frame is None:
-                    logger.warning("send_frame: exit due to None value got.")
+                # poll while buffered audio waits for a stream, and wake up for the deadline of packed frames
+                waiting_for_stream = len(self.replay) > 0
+                if waiting_for_stream:
+                    timeout = STREAM_POLL_INTERVAL_S
+                elif self.coalescer:
+                    timeout = self.coalescer.time_until_deadline()
+                else:
+                    timeout = 10.0
+                item = await self.ring.get_async(self.loop, timeout=timeout)
+
+                if item is None and self.ring.closed:
+                    if self.replay:
+                        await self.flush_replay(wait=True)
+                    elif self.stream:
+                        await self.send_coalesced()
+                    logger.warning("send_frame: exit due to frame ring closed.")
                     return
 
-                frame_buf = pcm_frame.get_buf()
-                if not frame_buf:
-                    logger.warning("send_frame: empty pcm_frame detected.")
-                    continue
+                if item is None and not waiting_for_stream and not self.coalescer:
+                    raise asyncio.TimeoutError()
 
-                if not self.stream:
-                    logger.info("lazy init stream.")
-                    if not await self.create_stream():
+                if item is not None:
+                    frame_buf, _ = item
+                    if not frame_buf:
+                        logger.warning("send_frame: empty pcm_frame detected.")
                         continue
 
-                if self.is_first_frame:
-                    self.is_first_frame = False
-                    self.handler.set_first_frame_time()
-
-                await self.stream.input_stream.send_audio_event(audio_chunk=frame_buf)
-                self.queue.task_done()
+                    if self.stream and self.pooled.age_s >= self.pool.max_age_s:
+                        logger.info(f"recycle stream after {self.pooled.age_s:.0f}s, before the service duration limit.")
+                        self.metrics.incr("stream_recycled")
+                        await self.send_coalesced()
+                        self.retire_stream()
+
+                    if not self.stream or self.replay:
+                        self.replay.append(frame_buf)
+                        self.metrics.gauge("replay_buffered_ms", self.replay.duration_ms)
+                        self.metrics.gauge("replay_dropped_ms", self.replay.dropped_ms)
+                    else:
+                        self.coalescer.add(frame_buf)
+
+                if self.replay:
+                    await self.flush_replay()
+                elif self.coalescer and self.coalescer.should_flush():
+                    await self.send_coalesced()
+                self.metrics.maybe_report()
             except asyncio.TimeoutError:
                 if self.stream:
-                    await self.cleanup()
+                    self.retire_stream()
                     logger.debug("send_frame: no data for 10s, will close current stream and create a new one when receving new frame.")
                 else:
                     logger.debug("send_frame: waiting for pcm frame.")
@@ -126,8 +266,6 @@ class AsyncTranscribeWrapper():
                 logger.exception(f"Error in send_frame: {e}")
                 raise e
 
-        logger.info("send_frame: exit due to self.stopped == True")
-
     async def transcribe_loop(self) -> None:
         try:
             await self.send_frame()
@@ -137,61 +275,43 @@ class AsyncTranscribeWrapper():
             await self.cleanup()
 
     async def get_transcribe_stream(self) -> StartStreamTranscriptionEventStream:
-        stream = await self.transcribe_client.start_stream_transcription(
-            language_code=self.config.lang_code,
-            media_sample_rate_hz=self.config.sample_rate,
-            media_encoding=self.config.media_encoding,
-            enable_partial_results_stabilization = self.config.enable_partial_results_stabilization
-        )
-        return stream
-
-    def run(self) -> None:
-        self.loop.run_until_complete(self.transcribe_loop())
-        self.loop.close()
-        logger.info("async_transcribe_wrapper: thread completed.")
-
-    def stop(self) -> None:
-        self.stopped = True
+        return await start_transcribe_stream(self.transcribe_client, self.config)
 
 
 class TranscribeEventHandler(TranscriptResultStreamHandler):
-    def __init__(self, transcript_result_stream: TranscriptResultStream, rte: RteEnv, transcribe_config: TranscribeConfig):
+    def __init__(self, transcript_result_stream: TranscriptResultStream, rte: RteEnv, transcribe_config: TranscribeConfig,
+                 metrics: Optional[Metrics] = None):
         super().__init__(transcript_result_stream)
         self.rte = rte
         self.transcribe_config = transcribe_config
+        self.metrics = metrics
 
         self.user_id = 0
         self.remote_user_id = 0
 
         # the timestamp(us) of first pcm frame
         self.first_frame_time = 0
+        # when the first pcm frame was sent, for time to first result
+        self.first_frame_sent_at = None
+
+        # remembers the stable prefix of the current result across its partials
+        self.splitter = IncrementalItemSplitter()
+        # drops repeated partials and rate-limits the rest, finals always pass
+        self.emission_policy = PartialEmissionPolicy(dedup=transcribe_config.partial_dedup,
+                                                     min_interval_ms=transcribe_config.partial_min_interval_ms)
+        # the latest rate-limited partial (result, text), sent when the interval ends unless a newer result was sent
+        self.held = None
+        self.held_timer = None
 
     def set_first_frame_time(self, ts: Optional[int] = None):
+        self.first_frame_sent_at = time()
         if ts:
             self.first_frame_time = ts
         else:
             self.first_frame_time = int(time() * 1000_000)
 
-    def split_items(self, text_result: str, items: List[Item]) -> Tuple[str, str]:
-        stable_str, non_stable_str = "", ""
-
-        idx = 0
-        full_len = len(text_result)
-
-        for item in items:
-            content = item.content
-            idx += len(content)
-
-            while idx < full_len and text_result[idx] == ' ':
-                content += ' '
-                idx += 1
-
-            if item.stable:
-                stable_str += content
-            else:
-                non_stable_str += content
-
-        return stable_str, non_stable_str
+    def split_items(self, result_id: Optional[str], text_result: str, items: List[Item]) -> Tuple[str, str]:
+        return self.splitter.split(result_id, text_result, items)
 
     def get_abs_start_time(self, segment_start_time: float):
         """get current segment's absolute start time timestamp(ms)"""
@@ -205,6 +325,10 @@ class TranscribeEventHandler(TranscriptResultStreamHandler):
         if not results:
             return
 
+        if self.metrics and self.first_frame_sent_at:
+            self.metrics.observe("first_result_ms", (time() - self.first_frame_sent_at) * 1000)
+            self.first_frame_sent_at = None
+
         if len(results) > 1:
             logger.warning(f"got more than one result, only handle the first")
 
@@ -221,11 +345,86 @@ class TranscribeEventHandler(TranscriptResultStreamHandler):
         if not text_result:
             return
 
+        decision = self.emission_policy.check(text_result, is_final)
+        if decision == SUPPRESS_RATE:
+            self.hold(result, text_result)
+            return
+        # whatever is held is older than this result
+        self.drop_held()
+        if decision != EMIT:
+            if self.metrics:
+                self.metrics.incr(f"text_suppressed_{decision}")
+            logger.debug(f"suppress transcript ({decision}): [{text_result}]")
+            return
+
+        self.send_result(result, text_result, is_final)
+
+    async def handle_events(self) -> None:
+        try:
+            await super().handle_events()
+        finally:
+            # the stream ended in the middle of an utterance, its latest text still goes out
+            if self.held_timer:
+                self.held_timer.cancel()
+                self.held_timer = None
+            if self.held:
+                result, text_result = self.held
+                self.held = None
+                self.send_result(result, text_result, False)
+
+    def hold(self, result, text_result: str) -> None:
+        if self.held and self.metrics:
+            self.metrics.incr("text_suppressed_rate")
+        logger.debug(f"hold transcript: [{text_result}]")
+        self.held = (result, text_result)
+        if self.held_timer is None:
+            self.held_timer = asyncio.get_running_loop().call_later(self.emission_policy.due_in(), self.send_held)
+
+    def drop_held(self) -> None:
+        if self.held_timer:
+            self.held_timer.cancel()
+            self.held_timer = None
+        if self.held:
+            if self.metrics:
+                self.metrics.incr("text_suppressed_rate")
+            self.held = None
+
+    def send_held(self) -> None:
+        """trailing edge of the rate limit, runs on the loop when the interval ended"""
+        self.held_timer = None
+        if not self.held:
+            return
+        result, text_result = self.held
+        self.held = None
+
+        decision = self.emission_policy.check(text_result, False)
+        if decision == SUPPRESS_RATE:
+            # the timer fired a bit early
+            self.hold(result, text_result)
+            return
+        if decision != EMIT:
+            if self.metrics:
+                self.metrics.incr(f"text_suppressed_{decision}")
+            return
+        if self.metrics:
+            self.metrics.incr("text_emitted_held")
+        self.send_result(result, text_result, False)
+
+    def send_result(self, result, text_result: str, is_final: bool) -> None:
+        if self.metrics:
+            self.metrics.incr("text_emitted")
+
         if self.transcribe_config.enable_partial_results_stabilization:
-            stable_str, non_stable_str = self.split_items(text_result, result.alternatives[0].items)
+            stable_str, non_stable_str = self.split_items(result.result_id, text_result, result.alternatives[0].items)
+            if is_final:
+                self.splitter.reset()
         else:
             stable_str, non_stable_str = '', ''
 
+        word_timings = None
+        if self.transcribe_config.enable_word_timings:
+            word_timings = pack_word_timings(result.alternatives[0].items, text_result, result.start_time)
+
         logger.info(f"got transcript: [{text_result}], is_final: [{is_final}]")
 
         self.create_and_send_data(
@@ -234,9 +433,10 @@ class TranscribeEventHandler(TranscriptResultStreamHandler):
             text_stable=stable_str,
             text_non_stable=non_stable_str,
             is_final=is_final,
-            end_of_segment=end_of_segment,
+            end_of_segment=is_final,
             start_time=self.get_abs_start_time(result.start_time),
-            duration_ms=int((result.end_time - result.start_time) * 1000)
+            duration_ms=int((result.end_time - result.start_time) * 1000),
+            word_timings=word_timings
         )
 
     def set_user_id(self, user_id:str="0", remote_user_id:str="0"):
@@ -244,7 +444,8 @@ class TranscribeEventHandler(TranscriptResultStreamHandler):
         self.remote_user_id = int(remote_user_id)
 
     def create_and_send_data(self, language: str, text_result: str, text_stable: str, text_non_stable: str,
-                             is_final: bool, end_of_segment: bool, start_time: int, duration_ms: int):
+                             is_final: bool, end_of_segment: bool, start_time: int, duration_ms: int,
+                             word_timings: Optional[bytes] = None):
         rte_text_data = Data.create("text_data")
         try:
             rte_text_data.set_property_string(DATA_OUT_TEXT_DATA_PROPERTY_LANGUAGE, language)
@@ -256,6 +457,8 @@ class TranscribeEventHandler(TranscriptResultStreamHandler):
             rte_text_data.set_property_bool(DATA_OUT_TEXT_DATA_PROPERTY_EOS, end_of_segment)
             rte_text_data.set_property_int(DATA_OUT_TEXT_DATA_PROPERTY_TIME, start_time)
             rte_text_data.set_property_int(DATA_OUT_TEXT_DATA_PROPERTY_DURATION_MS, duration_ms)
+            if word_timings is not None:
+                rte_text_data.set_property_buf(DATA_OUT_TEXT_DATA_PROPERTY_WORD_TIMINGS, word_timings)
 
             self.rte.send_data(rte_text_data)
         except Exception as e:
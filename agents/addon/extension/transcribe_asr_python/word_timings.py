@@ -0,0 +1,48 @@
+import struct
+from typing import List
+
+from amazon_transcribe.model import Item
+
+# one record per word, little endian:
+#   offset_ms   uint32   start of the word, from the start of the result (the `time` of text_data)
+#   duration_ms uint32
+#   confidence  float32  0..1, NaN when the service gave none
+#   text_start  uint32   the word is text[text_start:text_end]
+#   text_end    uint32
+WORD_TIMING = struct.Struct('<IIfII')
+
+PRONUNCIATION = 'pronunciation'
+
+
+def pack_word_timings(items: List[Item], text: str, result_start_time: float) -> bytes:
+    """
+    Pack the timing, confidence and position in `text` of every word of a result.
+
+    Punctuation items are skipped, they carry no timing of their own.
+    """
+    buf = bytearray(WORD_TIMING.size * len(items))
+    count = 0
+    idx = 0
+    for item in items:
+        content = item.content or ''
+        start = text.find(content, idx)
+        if start < 0:
+            start = idx
+        idx = start + len(content)
+
+        if item.item_type != PRONUNCIATION:
+            continue
+
+        offset_ms = max(0, int(round((item.start_time - result_start_time) * 1000)))
+        duration_ms = max(0, int(round((item.end_time - item.start_time) * 1000)))
+        confidence = item.confidence if item.confidence is not None else float('nan')
+        WORD_TIMING.pack_into(buf, count * WORD_TIMING.size, offset_ms, duration_ms, confidence, start, idx)
+        count += 1
+
+    del buf[count * WORD_TIMING.size:]
+    return bytes(buf)
+
+
+def unpack_word_timings(buf: bytes) -> List[tuple]:
+    """(offset_ms, duration_ms, confidence, text_start, text_end) of every word"""
+    return list(WORD_TIMING.iter_unpack(buf))